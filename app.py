@@ -5,7 +5,13 @@ import plotly.graph_objects as go
 import numpy as np
 from datetime import datetime
 import warnings
+import inspect
+import os
+import tempfile
 from pathlib import Path
+import data_store
+import sales_engine
+import sql_backend
 warnings.filterwarnings('ignore')
 
 # ============================================================================
@@ -44,6 +50,46 @@ CHART_COLORS = [
     '#6366F1'   # Indigo
 ]
 
+# Trend charts: at most POINTS_PER_PIXEL points per trace across a typical
+# chart width, drawn with WebGL once a trace has more than WEBGL_MIN_POINTS
+TREND_CHART_WIDTH_PX = 900
+POINTS_PER_PIXEL = 1
+WEBGL_MIN_POINTS = 500
+TREND_GRANULARITIES = ['Daily', 'Weekly', 'Monthly']
+
+# Append every rerun's stage timings to this JSON-lines file when set
+PERF_LOG = os.environ.get('DASHBOARD_PERF_LOG')
+
+# 'pandas' queries the sales table in memory; 'stream' reads the CSV in
+# chunks into aggregates without keeping the rows; 'duckdb' or 'sqlite'
+# push filters and group-bys down to an embedded engine over the data files
+QUERY_BACKEND = os.environ.get('DASHBOARD_BACKEND', 'pandas')
+if QUERY_BACKEND == 'duckdb' and not sql_backend.DUCKDB_AVAILABLE:
+    QUERY_BACKEND = 'sqlite'
+
+# Workers aggregating row shards of large tables in parallel (1: off);
+# tables under sales_engine.PARALLEL_MIN_ROWS always use a single pass
+QUERY_WORKERS = int(os.environ.get('DASHBOARD_WORKERS', os.cpu_count() or 1))
+
+# Standard error of sketched distinct-customer counts (see "Exact customer counts"),
+# used for tables of at least APPROXIMATE_MIN_ROWS rows; smaller ones count exactly
+DISTINCT_ERROR = float(os.environ.get('DASHBOARD_DISTINCT_ERROR', '0.02'))
+APPROXIMATE_MIN_ROWS = int(os.environ.get('DASHBOARD_APPROXIMATE_ROWS', sales_engine.APPROXIMATE_MIN_ROWS))
+
+# Dtype of the loaded monetary columns; 'float32' halves them but rounds
+# away cents in the Detailed Reports table and exports
+FLOAT_DTYPE = os.environ.get('DASHBOARD_FLOAT_DTYPE', data_store.FLOAT_DTYPE)
+
+# Threads computing likely next views when "Prefetch next views" is on,
+# and the exact aggregates behind a preview
+PREFETCH_WORKERS = int(os.environ.get('DASHBOARD_PREFETCH_WORKERS', '2'))
+
+# Selections of at least this many rows render first from the stratified
+# sample, then rerun with the exact aggregates once the background
+# computation has cached them (0 turns previews off)
+PREVIEW_MIN_ROWS = int(os.environ.get('DASHBOARD_PREVIEW_ROWS', '1000000'))
+PREVIEW_POLL_SECONDS = 0.5
+
 # ============================================================================
 # PAGE CONFIGURATION
 # ============================================================================
@@ -54,6 +100,9 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Per-rerun stage timings, shown in the sidebar Performance panel
+timer = sales_engine.StageTimer()
+
 # ============================================================================
 # SESSION STATE INITIALIZATION
 # ============================================================================
@@ -61,6 +110,8 @@ if 'dark_mode' not in st.session_state:
     st.session_state.dark_mode = False
 if 'data_loaded' not in st.session_state:
     st.session_state.data_loaded = False
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = os.urandom(4).hex()
 
 # ============================================================================
 # CUSTOM CSS (DYNAMIC – UPDATES WITH DARK MODE)
@@ -241,6 +292,72 @@ def format_currency(value):
     else:
         return f"${value:,.0f}"
 
+def export_selection(chunks, total, fmt):
+    """Write rows arriving in chunks to a temp file and offer it for download"""
+    extension, mime = data_store.EXPORT_FORMATS[fmt]
+    progress = st.progress(0.0, text="Preparing export...")
+    fd, path = tempfile.mkstemp(suffix=f".{extension}")
+    os.close(fd)
+    try:
+        data_store.write_export(
+            chunks, path, fmt, total,
+            progress=lambda done, total: progress.progress(
+                done / total if total else 1.0, text=f"Exported {done:,} of {total:,} rows"
+            )
+        )
+        with open(path, 'rb') as f:
+            st.download_button(
+                label=f"Download {fmt}",
+                data=f,
+                file_name=f"sales_{datetime.now():%Y%m%d_%H%M%S}.{extension}",
+                mime=mime
+            )
+    finally:
+        os.remove(path)
+
+def lazy_tabs(labels, key):
+    """
+    Tabs that rerun the script when the selection changes, so hidden tabs
+    can skip their work. Older Streamlit versions render every tab.
+    """
+    if 'on_change' in inspect.signature(st.tabs).parameters:
+        return st.tabs(labels, key=key, on_change="rerun")
+    return st.tabs(labels)
+
+def tab_is_open(tab):
+    """False only for a tab known to be hidden"""
+    return getattr(tab, 'open', None) is not False
+
+def error_bars(frame, column='TotalSales'):
+    """Confidence half-width column of a previewed aggregate, or None for exact results"""
+    name = f'{column}_ci'
+    return name if name in frame.columns else None
+
+def trend_trace(x, y, budget, **kwargs):
+    """
+    Line trace downsampled to `budget` points with LTTB, using Scattergl
+    for dense traces. Returns (trace, points sent).
+    """
+    keep = sales_engine.lttb(x.values, y.values, budget)
+    trace_type = go.Scatter
+    if len(keep) > WEBGL_MIN_POINTS:
+        trace_type = go.Scattergl
+        kwargs['mode'] = 'lines'
+    return trace_type(x=x.values[keep], y=y.values[keep], **kwargs), len(keep)
+
+def trace_points(trace):
+    """Number of points a trace sends to the browser (pie charts have values, not x)"""
+    for attr in ('x', 'values'):
+        data = getattr(trace, attr, None)
+        if data is not None:
+            return len(data)
+    return 0
+
+def plot_chart(fig, timer, name):
+    """Render a Plotly figure, timing its serialization as a stage"""
+    with timer.span(f"plot:{name}", rows_in=sum(trace_points(trace) for trace in fig.data)):
+        st.plotly_chart(fig, use_container_width=True)
+
 def get_chart_colors(n_colors):
     return CHART_COLORS[:min(n_colors, len(CHART_COLORS))]
 
@@ -328,41 +445,146 @@ def generate_sample_data():
 # ============================================================================
 # LOAD DATA (with corrected paths)
 # ============================================================================
-@st.cache_data
+# Cached as a resource: the dataset is shared across reruns and sessions
+# instead of being deserialized into a fresh copy on every rerun, so its
+# frames must be treated as read-only. Refresh updates it in place.
+def find_data_dir():
+    possible_paths = [
+        Path('/mount/src/Sales-Performance-Dashboard/sales_dashboard_data'),
+        Path('sales_dashboard_data'),
+        Path('./sales_dashboard_data'),
+        Path('../sales_dashboard_data'),
+        Path.cwd() / 'sales_dashboard_data',
+    ]
+    for path in possible_paths:
+        if path.exists() and ((path / data_store.SALES_FILE).exists() or (path / data_store.PARTITION_DIR).is_dir()):
+            return path
+    return None
+
+@st.cache_resource
 def load_data():
     try:
-        possible_paths = [
-            Path('/mount/src/Sales-Performance-Dashboard/sales_dashboard_data'),
-            Path('sales_dashboard_data'),
-            Path('./sales_dashboard_data'),
-            Path('../sales_dashboard_data'),
-            Path.cwd() / 'sales_dashboard_data',
-        ]
-
-        data_dir = None
-        for path in possible_paths:
-            if path.exists() and (path / 'sales_transactions.csv').exists():
-                data_dir = path
-                st.sidebar.success(f"✅ Data found at: {path}")
-                break
+        data_dir = find_data_dir()
+        if data_dir is not None:
+            st.sidebar.success(f"✅ Data found at: {data_dir}")
 
         if data_dir is None:
             st.info("✨ Using sample data for demonstration")
-            return generate_sample_data()
-
-        sales = pd.read_csv(data_dir / 'sales_transactions.csv')
-        products = pd.read_csv(data_dir / 'products.csv')
-        customers = pd.read_csv(data_dir / 'customers.csv')
-        regions = pd.read_csv(data_dir / 'regions.csv')
-
-        sales['OrderDate'] = pd.to_datetime(sales['OrderDate'])
-        sales['MonthYear'] = sales['OrderDate'].dt.to_period('M').astype(str)
+            return data_store.Dataset.from_frames(*generate_sample_data())
 
-        return sales, products, customers, regions
+        # Other backends hold only the dimension tables in memory; a
+        # partitioned folder is always queried in memory, by date range
+        dataset = data_store.Dataset(data_dir, float_dtype=FLOAT_DTYPE, sales=QUERY_BACKEND == 'pandas')
+        if dataset.source == 'snapshot':
+            st.sidebar.caption("⚡ Loaded from columnar snapshot")
+        return dataset
 
     except Exception as e:
         st.warning(f"Using sample data: {str(e)}")
-        return generate_sample_data()
+        return data_store.Dataset.from_frames(*generate_sample_data())
+
+def load_model(dataset):
+    """Query structures for the current dataset, built on first use"""
+    with dataset.lock:
+        if dataset.model is None and dataset.sales is None and not dataset.partitioned:
+            with st.spinner("Summarizing sales data..."):
+                dataset.model = sales_engine.build_summary(dataset, distinct_error=DISTINCT_ERROR)
+        elif dataset.model is None:
+            with st.spinner("Indexing sales data..."):
+                dataset.model = sales_engine.build_model(dataset, load_shard_pool(), DISTINCT_ERROR)
+        return dataset.model
+
+@st.cache_resource
+def load_backend(data_dir):
+    with st.spinner("Preparing SQL tables..."):
+        return sql_backend.SqlBackend(data_dir, QUERY_BACKEND)
+
+def sql_backend_for(dataset):
+    """The SQL backend over the dataset's files, or None when querying in memory"""
+    if QUERY_BACKEND in ('pandas', 'stream') or dataset.data_dir is None or dataset.partitioned:
+        return None
+    return load_backend(dataset.data_dir)
+
+def load_partitions(dataset, start, end):
+    """
+    Load the partitions a date range and its comparison period need, so
+    a recent range never reads older history. Loaded partitions stay, and
+    the model is extended with their rows.
+    """
+    with dataset.lock:
+        rows = dataset.load_range(*sales_engine.date_span(start, end))
+        if rows is not None and dataset.model is not None:
+            with st.spinner(f"Loading {len(rows):,} rows..."):
+                dataset.model = dataset.model.append(rows, dataset.customers)
+            dataset.sales = dataset.model.filter_index.sales
+
+def refresh_data(dataset):
+    """
+    Pick up changes to the data files. Rows appended to the sales CSV are
+    parsed and added to the existing query structures, dimension tables
+    no structure depends on are just reread; anything else triggers a
+    rebuild.
+    """
+    with dataset.lock:
+        status, tail = dataset.refresh()
+        files = tail if status == 'dimensions' else []
+        added = len(tail) if status == 'appended' else 0
+        if QUERY_BACKEND == 'stream' and dataset.sales is None:
+            status, added = refresh_summary(dataset, status)
+        elif status == 'appended' and dataset.model is not None:
+            with st.spinner(f"Adding {len(tail):,} new rows..."):
+                dataset.model = dataset.model.append(tail, dataset.customers)
+            # Keep one copy of the rows: the model's is the date-sorted one
+            dataset.sales = dataset.model.filter_index.sales
+        elif status == 'reloaded':
+            dataset.model = None
+    backend = sql_backend_for(dataset)
+    if backend is not None and backend.refresh() and status in ('unchanged', 'dimensions'):
+        status = 'reloaded'
+    if status != 'unchanged':
+        st.cache_data.clear()
+        load_aggregate_cache().clear()
+    messages = {
+        'unchanged': "✅ Data is up to date",
+        'appended': f"➕ Added {added:,} new rows",
+        'dimensions': f"🔄 Reloaded {', '.join(files)}",
+        'reloaded': "🔄 Data reloaded",
+    }
+    st.session_state.refresh_message = messages[status]
+
+def refresh_summary(dataset, status):
+    """
+    Fold rows appended to the CSV into a streamed SalesSummary; any other
+    change (including to the dimension tables it joins) rebuilds it on
+    next use. Returns the status as Dataset.refresh() would and the
+    number of new rows.
+    """
+    summary = dataset.model
+    if summary is None:
+        return status, 0
+    source = summary.source_status()
+    if status in ('unchanged', 'dimensions') and source == 'appended':
+        with st.spinner("Adding new rows..."):
+            dataset.model = summary.append_source()
+        dataset.version += 1
+        return 'appended', dataset.model.signature['rows'] - summary.signature['rows']
+    if status == 'reloaded' or source != 'unchanged':
+        dataset.model = None
+        dataset.version += 1
+        return 'reloaded', 0
+    return status, 0
+
+@st.cache_resource
+def load_aggregate_cache():
+    return sales_engine.AggregateCache(max_bytes=64 * 1024 * 1024)
+
+@st.cache_resource
+def load_shard_pool():
+    return sales_engine.ShardPool(QUERY_WORKERS) if QUERY_WORKERS > 1 else None
+
+@st.cache_resource
+def load_prefetcher():
+    return sales_engine.Prefetcher(PREFETCH_WORKERS)
 
 # ============================================================================
 # TOGGLE DARK MODE
@@ -375,6 +597,11 @@ def toggle_dark_mode():
 # MAIN DASHBOARD
 # ============================================================================
 
+# Loaded once per rerun: every call to load_data() replays its sidebar messages
+with timer.span("load_data") as span:
+    dataset = load_data()
+    span['rows_out'] = None if dataset.sales is None else len(dataset.sales)
+
 # Sidebar
 with st.sidebar:
     st.markdown("<h1 style='color: white; font-size: 24px;'>📊 Dashboard Controls</h1>", unsafe_allow_html=True)
@@ -392,9 +619,15 @@ with st.sidebar:
     st.markdown("### 📅 Date Range")
     min_date = pd.Timestamp('2022-01-01')
     max_date = pd.Timestamp('2024-12-31')
+    default_start = min_date
+    bounds = dataset.partition_bounds() if dataset.partitioned else None
+    if bounds is not None:
+        # Only the partitions in view are read, so open on the last quarter
+        min_date, max_date = bounds
+        default_start = max(min_date, max_date.to_period('Q').start_time)
     date_range = st.date_input(
         "Select Date Range",
-        value=(min_date.date(), max_date.date()),
+        value=(default_start.date(), max_date.date()),
         min_value=min_date.date(),
         max_value=max_date.date(),
         key="date_range"
@@ -417,6 +650,9 @@ with st.sidebar:
     # Customer Tier Filter
     st.markdown("### 👥 Customer Tier")
     tier_options = ['All Tiers', 'Platinum', 'Gold', 'Silver', 'Bronze']
+    if data_store.MISSING_MEMBER_POLICY == 'unknown':
+        # Sales of customers missing from customers.csv
+        tier_options.append(data_store.UNKNOWN_MEMBER)
     selected_tier = st.multiselect("Select Tier(s)", tier_options[1:], default=tier_options[1:], key="tier_filter")
     if not selected_tier:
         selected_tier = tier_options[1:]
@@ -427,6 +663,14 @@ with st.sidebar:
     st.markdown("### ⚙️ Settings")
     margin_threshold = st.slider("Profit Margin Alert (%)", 0, 50, 20, key="margin_threshold")
     sales_target = st.number_input("Sales Target ($M)", min_value=1.0, max_value=100.0, value=10.0, step=0.5, key="sales_target")
+    show_performance = st.checkbox("⏱️ Performance panel", value=False, key="show_performance")
+    exact_customers = st.checkbox("🎯 Exact customer counts", value=False, key="exact_customers",
+                                  help="Count distinct customers from the transactions instead of estimating "
+                                       f"them from sketches (about {DISTINCT_ERROR:.0%} error) for tables of "
+                                       f"{APPROXIMATE_MIN_ROWS:,}+ rows; smaller tables always count exactly")
+    prefetch = st.checkbox("⚡ Prefetch next views", value=False, key="prefetch",
+                           help="After each rerun, compute the other tabs, adjacent periods and "
+                                "single-region views in the background")
 
     st.markdown("---")
 
@@ -434,7 +678,7 @@ with st.sidebar:
     col1, col2 = st.columns(2)
     with col1:
         if st.button("🔄 Refresh", use_container_width=True):
-            st.cache_data.clear()
+            refresh_data(dataset)
             st.rerun()
     with col2:
         if st.button("📊 Reset", use_container_width=True):
@@ -442,6 +686,8 @@ with st.sidebar:
                 if key in st.session_state:
                     del st.session_state[key]
             st.rerun()
+    if 'refresh_message' in st.session_state:
+        st.caption(st.session_state.pop('refresh_message'))
 
 # Load CSS after sidebar (so dark_mode is known)
 load_original_css()
@@ -450,43 +696,103 @@ load_original_css()
 st.markdown("<div class='dashboard-title'>🌐 Multi-Region Sales Performance Dashboard</div>", unsafe_allow_html=True)
 st.markdown("<div class='dashboard-subtitle'>Real-time insights across North America, Europe, and Asia Pacific markets</div>", unsafe_allow_html=True)
 
-# Load Data
-sales, products, customers, regions = load_data()
-
-if sales is not None:
-    # Filter data
-    sales_filtered = sales.copy()
-    if len(date_range) == 2:
-        mask = (sales_filtered['OrderDate'] >= pd.Timestamp(date_range[0])) & (sales_filtered['OrderDate'] <= pd.Timestamp(date_range[1]))
-        sales_filtered = sales_filtered[mask]
-
-    if 'All Regions' not in selected_region and len(selected_region) > 0:
-        sales_filtered = sales_filtered[sales_filtered['Region'].isin(selected_region)]
-
-    if 'All Categories' not in selected_category and len(selected_category) > 0:
-        sales_filtered = sales_filtered[sales_filtered['Category'].isin(selected_category)]
-
-    if 'All Tiers' not in selected_tier and len(selected_tier) > 0:
-        if customers is not None and 'Tier' in customers.columns:
-            customers_tier = customers[customers['Tier'].isin(selected_tier)]
-            sales_filtered = sales_filtered[sales_filtered['CustomerID'].isin(customers_tier['CustomerID'])]
+# Load Data (the partitions of the selected range)
+if dataset.partitioned:
+    with timer.span("load_partitions") as span:
+        # A half-picked range (one date) reads from that date on rather
+        # than every partition
+        load_partitions(dataset, date_range[0] if date_range else None,
+                        date_range[1] if len(date_range) == 2 else None)
+        # No partition overlapping the range (or none at all) leaves no rows
+        span['rows_out'] = 0 if dataset.sales is None else len(dataset.sales)
+sales, products, customers, regions = dataset.frames()
+backend = sql_backend_for(dataset)
+
+if sales is not None or backend is not None or (QUERY_BACKEND == 'stream' and not dataset.partitioned):
+    # Filter data (single bitmap lookup, no copy of the full frame).
+    # Charts and additive KPIs roll up the daily cube; row-level data is
+    # only used for distinct customers and the detailed reports.
+    filter_spec = dict(
+        start=date_range[0] if len(date_range) == 2 or (date_range and dataset.partitioned) else None,
+        end=date_range[1] if len(date_range) == 2 else None,
+        regions=selected_region if 'All Regions' not in selected_region else None,
+        categories=selected_category if 'All Categories' not in selected_category else None,
+        tiers=selected_tier if 'All Tiers' not in selected_tier else None,
+    )
+    # Aggregates are shared across reruns and sessions for the same filters
+    aggregate_cache = load_aggregate_cache()
+    if st.session_state.get('prefetch_spec') != filter_spec:
+        # Background work for the previous filters is no longer likely to be used
+        load_prefetcher().cancel(st.session_state.session_id)
+    sales_filtered = cube_filtered = preview = None
+    if backend is None:
+        with timer.span("load_model"):
+            model = load_model(dataset)
+
+        approximate = not exact_customers and sales_engine.approximate_by_default(model, APPROXIMATE_MIN_ROWS)
+
+        def make_query(spec):
+            return sales_engine.Query(model, spec, aggregate_cache, dataset.version, approximate=approximate)
+        query = make_query(filter_spec)
+        filter_index = model.filter_index
+        # Large selections show sample estimates for every aggregate not yet
+        # cached, and rerun with the exact ones when the background work is
+        # done (st.fragment polls for it)
+        if PREVIEW_MIN_ROWS and model.sample is not None and hasattr(st, 'fragment') and \
+                model.daily_series.totals(**query.spec)['OrderCount'] >= PREVIEW_MIN_ROWS:
+            preview = sales_engine.PreviewQuery(query)
+        elif filter_index is not None:
+            with timer.span("filter", rows_in=filter_index.n_rows) as span:
+                sales_filtered = query.sales_filtered
+                span['rows_out'] = len(sales_filtered)
+        if preview is None:
+            with timer.span("cube_filter", rows_in=model.cube_index.n_rows) as span:
+                cube_filtered = query.cube_filtered
+                span['rows_out'] = len(cube_filtered)
+    else:
+        # Every aggregate is one SQL query; no rows are loaded up front
+        def make_query(spec):
+            return sql_backend.SqlQuery(backend, spec, aggregate_cache, (dataset.version, backend.version))
+        query = make_query(filter_spec)
+
+    fetched = []  # aggregates shown by this rerun, in order
+    previewed = []  # the ones shown as sample estimates
+
+    # Filled in once the tabs know whether anything was previewed
+    preview_notice = st.empty()
+
+    def cached(name):
+        fetched.append(name)
+        if preview is not None and not query.is_cached(name):
+            previewed.append(name)
+            with timer.span(name, rows_in=len(model.sample.sales)) as span:
+                value, _ = preview.fetch(name)
+                span['cache'] = 'preview'
+                span['rows_out'] = len(value) if isinstance(value, pd.DataFrame) else None
+            return value
+        source = sales_filtered if name in sales_engine.ROW_AGGREGATES else cube_filtered
+        with timer.span(name, rows_in=None if source is None else len(source)) as span:
+            value, hit = query.fetch(name)
+            span['cache'] = 'hit' if hit else 'miss'
+            span['rows_out'] = len(value) if isinstance(value, pd.DataFrame) else None
+        return value
 
     # Calculate KPIs
-    total_sales = sales_filtered['TotalSales'].sum()
-    total_profit = sales_filtered['Profit'].sum()
-    profit_margin = (total_profit / total_sales * 100) if total_sales > 0 else 0
-    avg_order_value = sales_filtered['TotalSales'].mean()
-    customer_count = sales_filtered['CustomerID'].nunique()
-
-    # Calculate growth
-    if len(date_range) == 2:
-        days_diff = (pd.Timestamp(date_range[1]) - pd.Timestamp(date_range[0])).days
-        prev_start = pd.Timestamp(date_range[0]) - pd.Timedelta(days=days_diff)
-        prev_end = pd.Timestamp(date_range[0]) - pd.Timedelta(days=1)
-        prev_sales = sales[(sales['OrderDate'] >= prev_start) & (sales['OrderDate'] <= prev_end)]['TotalSales'].sum()
-        sales_growth = ((total_sales - prev_sales) / prev_sales * 100) if prev_sales > 0 else 0
-    else:
-        sales_growth = 0
+    kpis = cached('kpis')
+    # The exact count is a prefix-sum lookup in the KPIs when previewing
+    record_count = kpis['order_count'] if preview is not None else query.count()
+    total_sales = kpis['total_sales']
+    total_profit = kpis['total_profit']
+    profit_margin = kpis['profit_margin']
+    avg_order_value = kpis['avg_order_value']
+    customer_count = kpis['customer_count']
+    # Estimated from sketches (SQL backends always count exactly)
+    customers_estimated = backend is None and (query.approximate or 'customer_count_range' in kpis)
+    customer_text = f"{'~' if customers_estimated else ''}{customer_count:,}"
+    if 'customer_count_range' in kpis:
+        low, high = kpis['customer_count_range']
+        customer_text += f" ({low:,.0f}–{high:,.0f})"
+    sales_growth = kpis['sales_growth']
 
     # KPI Row
     col1, col2, col3, col4 = st.columns(4)
@@ -521,7 +827,7 @@ if sales is not None:
             <h3>Avg Order Value</h3>
             <div class="value">{format_currency(avg_order_value)}</div>
             <div class="change">
-                👥 {customer_count:,} Customers
+                👥 {customer_text} Customers
             </div>
         </div>
         """, unsafe_allow_html=True)
@@ -546,190 +852,193 @@ if sales is not None:
         </div>
         """, unsafe_allow_html=True)
 
-    # Tabs
-    tab1, tab2, tab3, tab4, tab5 = st.tabs([
+    # Tabs (only the selected tab's aggregates and figures are computed)
+    tab1, tab2, tab3, tab4, tab5 = lazy_tabs([
         "📈 Sales Overview",
         "🌍 Regional Analysis",
         "📦 Product Performance",
         "👥 Customer Insights",
         "📊 Detailed Reports"
-    ])
+    ], key="active_tab")
 
     with tab1:
-        col1, col2 = st.columns([2, 1])
-        with col1:
-            st.markdown("<div class='chart-container'>", unsafe_allow_html=True)
-            st.subheader("Monthly Sales Trend")
-            monthly = sales_filtered.set_index('OrderDate').resample('M').agg({
-                'TotalSales': 'sum',
-                'Profit': 'sum'
-            }).reset_index()
-            monthly['ProfitMargin'] = (monthly['Profit'] / monthly['TotalSales'] * 100)
-
-            fig = go.Figure()
-            fig.add_trace(go.Scatter(
-                x=monthly['OrderDate'], y=monthly['TotalSales'],
-                name='Sales', line=dict(color=COLOR_PALETTE['primary'], width=3),
-                mode='lines+markers'
-            ))
-            fig.add_trace(go.Scatter(
-                x=monthly['OrderDate'], y=monthly['ProfitMargin'],
-                name='Profit Margin %', line=dict(color=COLOR_PALETTE['accent'], width=2, dash='dash'),
-                yaxis='y2'
-            ))
-            layout = get_plotly_layout()
-            fig.update_layout(
-                xaxis_title="Month",
-                yaxis_title="Sales ($)",
-                yaxis2=dict(title="Profit Margin (%)", overlaying='y', side='right'),
-                hovermode="x unified",
-                height=400,
-                legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
-                **layout
-            )
-            st.plotly_chart(fig, use_container_width=True)
-            st.markdown("</div>", unsafe_allow_html=True)
+        if tab_is_open(tab1):
+            col1, col2 = st.columns([2, 1])
+            with col1:
+                st.markdown("<div class='chart-container'>", unsafe_allow_html=True)
+                granularity = st.radio("Granularity", TREND_GRANULARITIES, index=2,
+                                       horizontal=True, key="trend_granularity",
+                                       label_visibility="collapsed")
+                st.subheader(f"{granularity} Sales Trend")
+                trend = cached(f'trend_{granularity.lower()}')
+
+                # Downsample to the chart's pixel budget so the payload stays
+                # flat however long the date range is
+                budget = TREND_CHART_WIDTH_PX * POINTS_PER_PIXEL
+                fig = go.Figure()
+                sales_trace, sales_points = trend_trace(
+                    trend['OrderDate'], trend['TotalSales'], budget,
+                    name='Sales', line=dict(color=COLOR_PALETTE['primary'], width=3),
+                    mode='lines+markers'
+                )
+                margin_trace, margin_points = trend_trace(
+                    trend['OrderDate'], trend['ProfitMargin'], budget,
+                    name='Profit Margin %', line=dict(color=COLOR_PALETTE['accent'], width=2, dash='dash'),
+                    yaxis='y2'
+                )
+                fig.add_trace(sales_trace)
+                fig.add_trace(margin_trace)
+                layout = get_plotly_layout()
+                fig.update_layout(
+                    xaxis_title={'Daily': "Day", 'Weekly': "Week", 'Monthly': "Month"}[granularity],
+                    yaxis_title="Sales ($)",
+                    yaxis2=dict(title="Profit Margin (%)", overlaying='y', side='right'),
+                    hovermode="x unified",
+                    height=400,
+                    legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+                    **layout
+                )
+                plot_chart(fig, timer, 'trend')
+                st.caption(f"{sales_points + margin_points:,} of {2 * len(trend):,} points plotted"
+                           + (" (downsampled)" if sales_points < len(trend) else ""))
+                st.markdown("</div>", unsafe_allow_html=True)
 
-        with col2:
-            st.markdown("<div class='chart-container'>", unsafe_allow_html=True)
-            st.subheader("Sales by Channel")
-            channel_data = sales_filtered.groupby('SalesChannel')['TotalSales'].sum().reset_index()
-            fig = px.bar(channel_data, x='SalesChannel', y='TotalSales',
-                        color='SalesChannel', text=channel_data['TotalSales'].apply(lambda x: f"${x/1000:.0f}K"),
-                        color_discrete_sequence=get_chart_colors(len(channel_data)))
-            fig.update_traces(textposition='outside')
-            layout = get_plotly_layout()
-            fig.update_layout(showlegend=False, height=400, **layout)
-            st.plotly_chart(fig, use_container_width=True)
-            st.markdown("</div>", unsafe_allow_html=True)
+            with col2:
+                st.markdown("<div class='chart-container'>", unsafe_allow_html=True)
+                st.subheader("Sales by Channel")
+                channel_data = cached('channel')
+                fig = px.bar(channel_data, x='SalesChannel', y='TotalSales', error_y=error_bars(channel_data),
+                            color='SalesChannel', text=channel_data['TotalSales'].apply(lambda x: f"${x/1000:.0f}K"),
+                            color_discrete_sequence=get_chart_colors(len(channel_data)))
+                fig.update_traces(textposition='outside')
+                layout = get_plotly_layout()
+                fig.update_layout(showlegend=False, height=400, **layout)
+                plot_chart(fig, timer, 'channel')
+                st.markdown("</div>", unsafe_allow_html=True)
 
     with tab2:
-        col1, col2 = st.columns(2)
-        with col1:
-            st.markdown("<div class='chart-container'>", unsafe_allow_html=True)
-            st.subheader("Regional Performance")
-            region_summary = sales_filtered.groupby('Region').agg({
-                'TotalSales': 'sum', 'Profit': 'sum', 'Quantity': 'sum'
-            }).reset_index()
-            fig = px.scatter(region_summary, x='TotalSales', y='Profit',
-                            size='Quantity', color='Region',
-                            hover_name='Region',
-                            color_discrete_sequence=get_chart_colors(3),
-                            height=400)
-            layout = get_plotly_layout()
-            fig.update_layout(**layout)
-            st.plotly_chart(fig, use_container_width=True)
-            st.markdown("</div>", unsafe_allow_html=True)
+        if tab_is_open(tab2):
+            col1, col2 = st.columns(2)
+            with col1:
+                st.markdown("<div class='chart-container'>", unsafe_allow_html=True)
+                st.subheader("Regional Performance")
+                region_summary = cached('region')
+                fig = px.scatter(region_summary, x='TotalSales', y='Profit',
+                                size='Quantity', color='Region',
+                                error_x=error_bars(region_summary), error_y=error_bars(region_summary, 'Profit'),
+                                hover_name='Region',
+                                color_discrete_sequence=get_chart_colors(3),
+                                height=400)
+                layout = get_plotly_layout()
+                fig.update_layout(**layout)
+                plot_chart(fig, timer, 'region')
+                st.markdown("</div>", unsafe_allow_html=True)
 
-        with col2:
-            st.markdown("<div class='chart-container'>", unsafe_allow_html=True)
-            st.subheader("Top Countries")
-            country_data = sales_filtered.groupby('Country')['TotalSales'].sum().nlargest(10).reset_index()
-            fig = px.bar(country_data, x='TotalSales', y='Country',
-                        orientation='h', color='TotalSales',
-                        color_continuous_scale='Viridis',
-                        text=country_data['TotalSales'].apply(lambda x: f"${x/1000:.0f}K"))
-            fig.update_traces(textposition='outside')
-            layout = get_plotly_layout()
-            fig.update_layout(height=400, **layout)
-            st.plotly_chart(fig, use_container_width=True)
-            st.markdown("</div>", unsafe_allow_html=True)
+            with col2:
+                st.markdown("<div class='chart-container'>", unsafe_allow_html=True)
+                st.subheader("Top Countries")
+                country_data = cached('country')
+                fig = px.bar(country_data, x='TotalSales', y='Country', error_x=error_bars(country_data),
+                            orientation='h', color='TotalSales',
+                            color_continuous_scale='Viridis',
+                            text=country_data['TotalSales'].apply(lambda x: f"${x/1000:.0f}K"))
+                fig.update_traces(textposition='outside')
+                layout = get_plotly_layout()
+                fig.update_layout(height=400, **layout)
+                plot_chart(fig, timer, 'country')
+                st.markdown("</div>", unsafe_allow_html=True)
 
     with tab3:
-        col1, col2 = st.columns(2)
-        with col1:
-            st.markdown("<div class='chart-container'>", unsafe_allow_html=True)
-            st.subheader("Top 10 Products")
-            product_data = sales_filtered.groupby('ProductName')['TotalSales'].sum().nlargest(10).reset_index()
-            fig = px.bar(product_data, x='TotalSales', y='ProductName',
-                        orientation='h', color='TotalSales',
-                        color_continuous_scale='Viridis',
-                        text=product_data['TotalSales'].apply(lambda x: f"${x/1000:.0f}K"))
-            fig.update_traces(textposition='outside')
-            layout = get_plotly_layout()
-            fig.update_layout(height=400, **layout)
-            st.plotly_chart(fig, use_container_width=True)
-            st.markdown("</div>", unsafe_allow_html=True)
-
-        with col2:
-            st.markdown("<div class='chart-container'>", unsafe_allow_html=True)
-            st.subheader("Category Performance")
-            category_data = sales_filtered.groupby('Category')['TotalSales'].sum().reset_index()
-            fig = px.pie(category_data, values='TotalSales', names='Category',
-                        hole=0.4, color_discrete_sequence=get_chart_colors(len(category_data)))
-            fig.update_traces(textposition='inside', textinfo='percent+label')
-            layout = get_plotly_layout()
-            fig.update_layout(height=400, **layout)
-            st.plotly_chart(fig, use_container_width=True)
-            st.markdown("</div>", unsafe_allow_html=True)
-
-    with tab4:
-        if customers is not None and not customers.empty:
-            st.markdown("<div class='chart-container'>", unsafe_allow_html=True)
-            st.subheader("Customer Analysis")
-            customer_analysis = sales_filtered.merge(
-                customers[['CustomerID', 'Tier', 'Segment']], on='CustomerID', how='left'
-            )
+        if tab_is_open(tab3):
             col1, col2 = st.columns(2)
             with col1:
-                segment_data = customer_analysis.groupby('Segment').agg({
-                    'CustomerID': 'nunique'
-                }).reset_index().rename(columns={'CustomerID': 'Count'})
-                fig = px.pie(segment_data, values='Count', names='Segment',
-                            title='Customer Distribution by Segment',
-                            color_discrete_sequence=get_chart_colors(len(segment_data)))
+                st.markdown("<div class='chart-container'>", unsafe_allow_html=True)
+                st.subheader("Top 10 Products")
+                product_data = cached('product')
+                fig = px.bar(product_data, x='TotalSales', y='ProductName', error_x=error_bars(product_data),
+                            orientation='h', color='TotalSales',
+                            color_continuous_scale='Viridis',
+                            text=product_data['TotalSales'].apply(lambda x: f"${x/1000:.0f}K"))
+                fig.update_traces(textposition='outside')
                 layout = get_plotly_layout()
                 fig.update_layout(height=400, **layout)
-                st.plotly_chart(fig, use_container_width=True)
+                plot_chart(fig, timer, 'product')
+                st.markdown("</div>", unsafe_allow_html=True)
+
             with col2:
-                tier_data = customer_analysis.groupby('Tier').agg({
-                    'TotalSales': 'sum'
-                }).reset_index()
-                fig = px.bar(tier_data, x='Tier', y='TotalSales',
-                            color='Tier', text=tier_data['TotalSales'].apply(lambda x: f"${x/1e6:.1f}M"),
-                            color_discrete_sequence=get_chart_colors(len(tier_data)))
-                fig.update_traces(textposition='outside')
+                st.markdown("<div class='chart-container'>", unsafe_allow_html=True)
+                st.subheader("Category Performance")
+                category_data = cached('category')
+                fig = px.pie(category_data, values='TotalSales', names='Category',
+                            hole=0.4, color_discrete_sequence=get_chart_colors(len(category_data)))
+                fig.update_traces(textposition='inside', textinfo='percent+label')
                 layout = get_plotly_layout()
-                fig.update_layout(height=400, showlegend=False, **layout)
-                st.plotly_chart(fig, use_container_width=True)
-            st.markdown("</div>", unsafe_allow_html=True)
-        else:
-            st.info("Customer data not available.")
+                fig.update_layout(height=400, **layout)
+                plot_chart(fig, timer, 'category')
+                st.markdown("</div>", unsafe_allow_html=True)
+
+    with tab4:
+        if tab_is_open(tab4):
+            if customers is not None and not customers.empty:
+                st.markdown("<div class='chart-container'>", unsafe_allow_html=True)
+                st.subheader("Customer Analysis")
+                col1, col2 = st.columns(2)
+                with col1:
+                    segment_data = cached('segment')
+                    fig = px.pie(segment_data, values='Count', names='Segment',
+                                title='Customer Distribution by Segment',
+                                color_discrete_sequence=get_chart_colors(len(segment_data)))
+                    layout = get_plotly_layout()
+                    fig.update_layout(height=400, **layout)
+                    plot_chart(fig, timer, 'segment')
+                with col2:
+                    tier_data = cached('tier')
+                    fig = px.bar(tier_data, x='Tier', y='TotalSales', error_y=error_bars(tier_data),
+                                color='Tier', text=tier_data['TotalSales'].apply(lambda x: f"${x/1e6:.1f}M"),
+                                color_discrete_sequence=get_chart_colors(len(tier_data)))
+                    fig.update_traces(textposition='outside')
+                    layout = get_plotly_layout()
+                    fig.update_layout(height=400, showlegend=False, **layout)
+                    plot_chart(fig, timer, 'tier')
+                st.markdown("</div>", unsafe_allow_html=True)
+            else:
+                st.info("Customer data not available.")
 
     with tab5:
-        st.markdown("<div class='chart-container'>", unsafe_allow_html=True)
-        st.subheader("Detailed Sales Data")
-        col1, col2, col3 = st.columns([2, 1, 1])
-        with col2:
-            if st.button("📥 Export CSV"):
-                csv = sales_filtered.to_csv(index=False)
-                st.download_button(
-                    label="Download CSV",
-                    data=csv,
-                    file_name=f"sales_{datetime.now():%Y%m%d_%H%M%S}.csv",
-                    mime="text/csv"
+        if tab_is_open(tab5):
+            st.markdown("<div class='chart-container'>", unsafe_allow_html=True)
+            st.subheader("Detailed Sales Data")
+            col1, col2, col3 = st.columns([2, 1, 1])
+            with col2:
+                export_format = st.selectbox("Export format", data_store.export_formats(),
+                                             key="export_format", label_visibility="collapsed")
+                if st.button("📥 Export"):
+                    # Rows are read one chunk at a time, whichever backend holds them
+                    export_selection((dataset.full_rows(chunk) for chunk in query.row_chunks()),
+                                     record_count, export_format)
+            with col3:
+                if st.button("📊 Summary Stats"):
+                    with st.expander("Summary Statistics"):
+                        st.dataframe(query.describe(['TotalSales','Profit','Quantity','ProfitMargin']))
+            st.markdown(f"**{record_count:,} records**")
+            search = st.text_input("🔍 Search")
+            with timer.span("search", rows_in=record_count) as span:
+                # The model holds the columns it filters and aggregates on;
+                # the table shows every column of the sales file
+                display = dataset.full_rows(query.latest(100, search))
+                span['rows_out'] = len(display)
+            with timer.span("table", rows_in=len(display)):
+                st.dataframe(
+                    display,
+                    use_container_width=True,
+                    column_config={
+                        "OrderDate": st.column_config.DateColumn("Date"),
+                        "TotalSales": st.column_config.NumberColumn("Sales", format="$%.2f"),
+                        "Profit": st.column_config.NumberColumn("Profit", format="$%.2f"),
+                        "ProfitMargin": st.column_config.NumberColumn("Margin %", format="%.1f%%")
+                    }
                 )
-        with col3:
-            if st.button("📊 Summary Stats"):
-                with st.expander("Summary Statistics"):
-                    st.dataframe(sales_filtered[['TotalSales','Profit','Quantity','ProfitMargin']].describe())
-        st.markdown(f"**{len(sales_filtered):,} records**")
-        search = st.text_input("🔍 Search")
-        display = sales_filtered.copy()
-        if search:
-            mask = display.astype(str).apply(lambda x: x.str.contains(search, case=False)).any(axis=1)
-            display = display[mask]
-        st.dataframe(
-            display.sort_values('OrderDate', ascending=False).head(100),
-            use_container_width=True,
-            column_config={
-                "OrderDate": st.column_config.DateColumn("Date"),
-                "TotalSales": st.column_config.NumberColumn("Sales", format="$%.2f"),
-                "Profit": st.column_config.NumberColumn("Profit", format="$%.2f"),
-                "ProfitMargin": st.column_config.NumberColumn("Margin %", format="%.1f%%")
-            }
-        )
-        st.markdown("</div>", unsafe_allow_html=True)
+            st.markdown("</div>", unsafe_allow_html=True)
 
     # Footer
     st.markdown("---")
@@ -737,12 +1046,68 @@ if sales is not None:
     with col1:
         st.markdown(f"**📈 Last Updated:** {datetime.now():%Y-%m-%d %H:%M}")
     with col2:
-        unique_regions = sales_filtered['Region'].nunique() if 'Region' in sales_filtered.columns else 0
-        unique_countries = sales_filtered['Country'].nunique() if 'Country' in sales_filtered.columns else 0
-        st.markdown(f"**🌐 Data Coverage:** {unique_regions} Regions, {unique_countries} Countries, {len(sales_filtered):,} Transactions")
+        st.markdown(f"**🌐 Data Coverage:** {kpis['region_count']} Regions, {kpis['country_count']} Countries, {record_count:,} Transactions")
     with col3:
         mode_text = "🌙 Dark" if st.session_state.dark_mode else "☀️ Light"
         st.markdown(f"**📊 Dashboard Version:** 3.0 | Mode: {mode_text}")
 
+    cache_stats = aggregate_cache.stats()
+    st.sidebar.caption(
+        f"🗄️ Aggregate cache: {cache_stats['hits']:,} hits / {cache_stats['misses']:,} misses · "
+        f"{cache_stats['entries']} entries · {cache_stats['bytes'] / 1024:,.0f} KB"
+    )
+    # The exact aggregates behind a preview go first
+    jobs = [(query, previewed)] if previewed else []
+    if prefetch:
+        # Warm the cache for what is likely next: this view's other tabs,
+        # then this tab for adjacent periods and single-region drill-ins
+        jobs.append((query, [name for name in sales_engine.AGGREGATES if name not in fetched]))
+        for spec in sales_engine.likely_specs(filter_spec, region_options[1:], min_date, max_date):
+            # Only from rows already loaded (partitioned data)
+            if dataset.covers(*sales_engine.date_span(spec['start'], spec['end'])):
+                jobs.append((make_query(spec), fetched))
+    if jobs:
+        load_prefetcher().submit(st.session_state.session_id, jobs)
+        st.session_state.prefetch_spec = filter_spec
+    if previewed:
+        preview_notice.caption(
+            f"⏳ Preview estimated from {preview.rows_sampled():,} sampled rows (bars show 95% confidence "
+            f"intervals, customers a likely range; sales, profit and growth are exact). "
+            f"Exact figures replace it when ready."
+        )
+
+        @st.fragment(run_every=PREVIEW_POLL_SECONDS)
+        def refine_when_ready():
+            if all(query.is_cached(name) for name in previewed):
+                st.rerun()
+        refine_when_ready()
+    if prefetch:
+        prefetch_stats = load_prefetcher().stats()
+        st.sidebar.caption(f"⚡ Prefetch: {prefetch_stats['computed']:,} computed · "
+                           f"{prefetch_stats['pending']} pending · {prefetch_stats['cancelled']:,} cancelled")
+    if backend is not None:
+        st.sidebar.caption(f"🗃️ Queries run in {backend.engine} ({backend.source})")
+    elif sales is None:
+        st.sidebar.caption(f"🧮 Streamed aggregates: {model.nbytes / 1e6:,.1f} MB in memory (rows read on demand)")
+    elif dataset.memory:
+        st.sidebar.caption(
+            f"🧮 Sales table: {dataset.memory['bytes'] / 1e6:,.1f} MB in memory "
+            f"({dataset.memory['parsed_bytes'] / 1e6:,.1f} MB as parsed)"
+        )
+
 else:
     st.error("❌ Failed to load data.")
+
+# Performance panel and log (after every stage of this rerun has run)
+if show_performance:
+    with st.sidebar.expander("⏱️ Performance", expanded=True):
+        st.caption(f"Rerun total: {timer.total_ms():,.1f} ms")
+        st.dataframe(timer.frame(), hide_index=True, use_container_width=True,
+                     column_config={"ms": st.column_config.NumberColumn("ms", format="%.1f")})
+if PERF_LOG:
+    try:
+        timer.write_jsonl(PERF_LOG, time=datetime.now().isoformat(timespec='seconds'),
+                          session=st.session_state.session_id,
+                          tab=st.session_state.get('active_tab'))
+    except OSError:
+        pass
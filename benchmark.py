@@ -0,0 +1,294 @@
+"""
+Headless benchmark of the dashboard compute pipeline.
+
+Generates datasets with data_generation.py, then times the stages app.py runs
+without a browser: load, index, filter and every named aggregate of
+sales_engine.AGGREGATES (through sales_engine.Query, or the SQL backend's
+queries), over a matrix of filter scenarios. Results are written as JSON;
+with --baseline the run exits non-zero when a stage is slower or larger than
+the stored baseline.
+
+    python benchmark.py --rows 150000 1000000 10000000 --output results.json
+    python benchmark.py --rows 150000 --baseline results.json
+    python benchmark.py --rows 1000000 --backend sqlite --query-workers 4
+
+Backend, query workers and the distinct-count error default to the same
+environment variables app.py reads.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import data_generation
+import data_store
+import sales_engine
+import sql_backend
+
+DEFAULT_ROWS = [150_000, 1_000_000, 10_000_000]
+
+# Filter scenarios, from no filter at all to a narrow drill-down
+SCENARIOS = {
+    'all': {},
+    'year_2024': dict(start='2024-01-01', end='2024-12-31'),
+    'quarter_europe': dict(start='2023-04-01', end='2023-06-30', regions=['Europe']),
+    'premium_tiers': dict(tiers=['Platinum', 'Gold']),
+    'month_drilldown': dict(start='2024-03-01', end='2024-03-31', regions=['Asia Pacific'],
+                            categories=['Electronics'], tiers=['Gold']),
+}
+SEARCH_QUERY = 'tokyo'
+
+
+# ============================================================================
+# MEASUREMENT
+# ============================================================================
+def measure(func, repeat=1, memory=True):
+    """
+    Run `func` and return (result, seconds, peak_bytes).
+
+    seconds is the best of `repeat` untraced runs; peak_bytes is the peak
+    traced allocation of one further run (None when memory=False).
+    """
+    best = None
+    result = None
+    for _ in range(max(repeat, 1)):
+        gc.collect()
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    peak = None
+    if memory:
+        result = None
+        gc.collect()
+        tracemalloc.start()
+        try:
+            result = func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, best, peak
+
+
+def max_rss_bytes():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+# ============================================================================
+# DATASETS
+# ============================================================================
+def ensure_dataset(root, rows, seed, workers):
+    """Generate a dataset of `rows` transactions under `root` unless present"""
+    data_dir = Path(root) / f'rows_{rows}'
+    if not (data_dir / data_store.SALES_FILE).exists():
+        print(f"Generating {rows:,} rows into {data_dir}...")
+        data_generation.write_dataset(rows, seed, min(rows, 1_000_000), workers,
+                                      str(data_dir), verbose=False)
+    return data_dir
+
+
+def remove_snapshot(data_dir):
+    for path in data_store.snapshot_paths(data_dir / data_store.SALES_FILE):
+        if path.exists():
+            path.unlink()
+
+
+def filter_spec(scenario):
+    """Full filter spec in the form app.py builds it"""
+    return sales_engine.filter_spec(**SCENARIOS[scenario])
+
+
+# ============================================================================
+# PIPELINE
+# ============================================================================
+def build_source(dataset, data_dir, backend, query_workers, distinct_error):
+    """What app.py queries for `backend`: a SalesModel, a SalesSummary or a SqlBackend"""
+    if backend == 'pandas':
+        pool = sales_engine.ShardPool(query_workers) if query_workers > 1 else None
+        return sales_engine.build_model(dataset, pool, distinct_error)
+    if backend == 'stream':
+        return sales_engine.build_summary(dataset, distinct_error=distinct_error)
+    return sql_backend.SqlBackend(data_dir, backend)
+
+
+def make_query(source, spec):
+    """A query for one filter spec, as app.py builds it (without the shared cache)"""
+    if isinstance(source, sql_backend.SqlBackend):
+        return sql_backend.SqlQuery(source, spec)
+    return sales_engine.Query(source, spec, approximate=sales_engine.approximate_by_default(source))
+
+
+def run_dataset(data_dir, rows, scenarios, repeat, memory, backend='pandas', query_workers=1,
+                distinct_error=None):
+    """Benchmark every stage for one dataset; returns a list of result records"""
+    results = []
+
+    def record(stage, func, scenario=None, stage_repeat=repeat):
+        value, seconds, peak = measure(func, stage_repeat, memory)
+        results.append({'rows': rows, 'scenario': scenario, 'stage': stage,
+                        'seconds': round(seconds, 6), 'peak_bytes': peak})
+        label = f"{stage}" if scenario is None else f"{scenario}/{stage}"
+        peak_text = '' if peak is None else f"  peak {peak / 1e6:,.1f} MB"
+        print(f"  {label:<32} {seconds * 1000:>10,.1f} ms{peak_text}")
+        return value
+
+    def load_csv():
+        remove_snapshot(data_dir)
+        return data_store.Dataset(data_dir)
+
+    record('load_csv', load_csv, stage_repeat=1)
+    dataset = record('load_snapshot', lambda: data_store.Dataset(data_dir), stage_repeat=1)
+    source = record('index', lambda: build_source(dataset, data_dir, backend, query_workers, distinct_error),
+                    stage_repeat=1)
+    in_memory = isinstance(source, sales_engine.SalesModel)
+    if in_memory:
+        record('search_index', lambda: source.search_index, stage_repeat=1)
+        record('customer_sketch', lambda: source.customer_sketch, stage_repeat=1)
+
+    for scenario in scenarios:
+        spec = filter_spec(scenario)
+        query = make_query(source, spec)
+        if in_memory:
+            # Shared by the aggregates of one query, as within one app rerun
+            record('filter', lambda: make_query(source, spec).sales_filtered, scenario)
+            query.sales_filtered
+        if not isinstance(source, sql_backend.SqlBackend):
+            record('cube_filter', lambda: make_query(source, spec).cube_filtered, scenario)
+            query.cube_filtered
+        for name in sales_engine.AGGREGATES:
+            record(name, lambda: query.aggregate(name), scenario)
+        if in_memory:
+            # Both ways of counting distinct customers, whichever the
+            # table size picks (see sales_engine.APPROXIMATE_MIN_ROWS)
+            exact = sales_engine.Query(source, spec)
+            exact.sales_filtered
+            record('customers_exact', exact.customer_count, scenario)
+            record('customers_sketch', sales_engine.Query(source, spec, approximate=True).customer_count, scenario)
+        record('tab_reports', lambda: query.latest(100), scenario)
+        record('search', lambda: query.latest(100, SEARCH_QUERY), scenario)
+    return results, max_rss_bytes()
+
+
+# ============================================================================
+# BASELINE COMPARISON
+# ============================================================================
+def result_key(result):
+    return result['rows'], result['scenario'], result['stage']
+
+
+def compare(results, baseline, tolerance, min_seconds):
+    """
+    Regressions of `results` against `baseline`: stages more than
+    `tolerance` (a fraction) slower, ignoring differences under
+    `min_seconds`, or with a peak allocation more than `tolerance` larger.
+    """
+    previous = {result_key(r): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        before = previous.get(result_key(result))
+        if before is None:
+            continue
+        slower = result['seconds'] - before['seconds']
+        if slower > min_seconds and result['seconds'] > before['seconds'] * (1 + tolerance):
+            regressions.append((result, before, 'seconds'))
+        if (result['peak_bytes'] is not None and before.get('peak_bytes')
+                and result['peak_bytes'] > before['peak_bytes'] * (1 + tolerance)):
+            regressions.append((result, before, 'peak_bytes'))
+    return regressions
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard compute pipeline without a browser.")
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS,
+                        help="dataset sizes to benchmark (default: 150000 1000000 10000000)")
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS),
+                        help="filter scenarios to run (default: all)")
+    parser.add_argument('--data-dir', default='benchmark_data',
+                        help="where generated datasets are kept between runs (default: benchmark_data)")
+    parser.add_argument('--seed', type=int, default=42, help="data generation seed (default: 42)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="processes used to generate datasets (default: all cores)")
+    parser.add_argument('--backend', choices=['pandas', 'stream'] + list(sql_backend.ENGINES),
+                        default=os.environ.get('DASHBOARD_BACKEND', 'pandas'),
+                        help="query backend, as app.py's DASHBOARD_BACKEND (default: pandas)")
+    parser.add_argument('--query-workers', type=int,
+                        default=int(os.environ.get('DASHBOARD_WORKERS', os.cpu_count() or 1)),
+                        help="threads aggregating row shards, as app.py's DASHBOARD_WORKERS (default: all cores)")
+    parser.add_argument('--distinct-error', type=float,
+                        default=float(os.environ.get('DASHBOARD_DISTINCT_ERROR', '0.02')),
+                        help="standard error of sketched customer counts (default: 0.02)")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="runs per query stage; the best time is kept (default: 3)")
+    parser.add_argument('--no-memory', action='store_true',
+                        help="skip the traced run that measures peak allocations")
+    parser.add_argument('--output', help="write results to this JSON file")
+    parser.add_argument('--baseline', help="compare against a previous JSON result and fail on regression")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed slowdown or memory growth as a fraction (default: 0.25)")
+    parser.add_argument('--min-seconds', type=float, default=0.005,
+                        help="ignore slowdowns smaller than this (default: 0.005)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'settings': {'repeat': args.repeat, 'memory': not args.no_memory,
+                     'float_dtype': data_store.FLOAT_DTYPE, 'backend': args.backend,
+                     'query_workers': args.query_workers, 'distinct_error': args.distinct_error},
+        'results': [],
+        'max_rss_bytes': {},
+    }
+
+    for rows in args.rows:
+        data_dir = ensure_dataset(args.data_dir, rows, args.seed, args.workers)
+        print(f"\n{rows:,} rows")
+        results, rss = run_dataset(data_dir, rows, args.scenarios, args.repeat, not args.no_memory,
+                                   args.backend, args.query_workers, args.distinct_error)
+        report['results'].extend(results)
+        report['max_rss_bytes'][str(rows)] = rss
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report['results'], baseline, args.tolerance, args.min_seconds)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {args.baseline}:")
+            for result, before, metric in regressions:
+                label = '/'.join(str(p) for p in result_key(result) if p is not None)
+                print(f"  {label}: {metric} {before[metric]:,} -> {result[metric]:,}")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
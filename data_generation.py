@@ -1,19 +1,19 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+import argparse
 import random
+import shutil
 import os
 
-print("=" * 70)
-print("GENERATING REALISTIC MULTI-REGION SALES DATASET")
-print("=" * 70)
-
-# Configuration for reproducibility
-np.random.seed(42)
-random.seed(42)
-
 # ==================== SETTINGS ====================
 n_transactions = 150000  # 150K+ records
+max_customers = None  # Rows in customers.csv (None keeps every customer)
+customer_bucket_size = 200_000  # Customers merged at a time when customers.csv is built
+seed = 42  # Configuration for reproducibility
+output_dir = 'sales_dashboard_data'
 start_date = datetime(2022, 1, 1)  # 3 years of data
 end_date = datetime(2024, 12, 31)
 
@@ -135,144 +135,189 @@ products = [
 ]
 
 # ==================== GENERATE SALES TRANSACTIONS ====================
-print("\nGenerating sales transactions...")
+REGION_NAMES = ['North America', 'Europe', 'Asia Pacific']
+REGION_WEIGHTS_BY_YEAR = {  # NA, Europe, APAC
+    2022: [0.45, 0.35, 0.20],
+    2023: [0.48, 0.33, 0.19],  # NA growing
+    2024: [0.50, 0.30, 0.20],  # NA continues growth
+}
+CHANNELS = ['Online', 'Retail Store', 'Corporate', 'Distributor']
+CHANNEL_WEIGHTS = [0.45, 0.30, 0.15, 0.10]
+SEGMENTS = ['Enterprise', 'Retail', 'SMB', 'Government']
+SEGMENT_WEIGHTS = [0.2, 0.5, 0.25, 0.05]
+FIRST_CUSTOMER_NUMBER = 1000
+FIRST_TRANSACTION_NUMBER = 202200000
+
+
+def weighted_choice(rng, weights, size):
+    """Draw indices into `weights` (rows of a 2-D array give per-draw weights)"""
+    weights = np.asarray(weights, dtype=float)
+    cumulative = np.cumsum(weights, axis=-1)
+    cumulative /= cumulative[..., -1:]
+    u = rng.random(size)
+    if cumulative.ndim == 1:
+        return np.searchsorted(cumulative, u, side='right')
+    return (u[:, None] >= cumulative).sum(axis=1)
+
+
+def uniform_index(rng, counts):
+    """Draw a uniform index in [0, counts[i]) for every element"""
+    return np.minimum((rng.random(len(counts)) * counts).astype(np.int64), counts - 1)
+
+
+def build_lookup_tables():
+    """Flatten regions_config and products into arrays for vectorized draws"""
+    country_names, margin_factors, city_names = [], [], []
+    country_start, country_count, city_start, city_count = [], [], [], []
+    for region in REGION_NAMES:
+        region_countries = regions_config[region]['countries']
+        country_start.append(len(country_names))
+        country_count.append(len(region_countries))
+        for country, info in region_countries.items():
+            country_names.append(country)
+            margin_factors.append(info['margin_factor'])
+            city_start.append(len(city_names))
+            city_count.append(len(info['cities']))
+            city_names.extend(info['cities'])
+    return {
+        'country_names': np.array(country_names),
+        'margin_factors': np.array(margin_factors),
+        'country_start': np.array(country_start),
+        'country_count': np.array(country_count),
+        'city_names': np.array(city_names),
+        'city_start': np.array(city_start),
+        'city_count': np.array(city_count),
+        'seasonality': np.array([regions_config[r]['seasonality'] for r in REGION_NAMES]),
+        'products': pd.DataFrame(products),
+    }
 
-transactions = []
-customer_counter = 1000
-customer_pool = {}
 
-# Create date array for seasonality
-date_range = pd.date_range(start=start_date, end=end_date, freq='D')
+def hashed_uniform(keys, seed):
+    """Stateless uniform draw in [0, 1) per key (splitmix64 of seed and key)"""
+    with np.errstate(over='ignore'):
+        z = np.asarray(keys, dtype=np.uint64) + np.uint64(seed) * np.uint64(0x9E3779B97F4A7C15)
+        z += np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        z ^= z >> np.uint64(31)
+    return (z >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+
+
+def customer_segments_for(customer_numbers, seed):
+    """Segment of each customer; a pure function of seed and customer number"""
+    cumulative = np.cumsum(SEGMENT_WEIGHTS) / np.sum(SEGMENT_WEIGHTS)
+    u = hashed_uniform(customer_numbers, seed)
+    return np.array(SEGMENTS)[np.searchsorted(cumulative, u, side='right')]
+
+
+def generate_transactions(n, seed, start_index=0):
+    """
+    Generate `n` sales transactions as whole arrays.
+
+    Applies the same business rules as the original row-by-row generator:
+    year-dependent region mix, uniform country/city within a region,
+    VolumeFactor-weighted products, category-dependent Poisson quantities,
+    regional, channel and seasonal pricing, country margin factors and one
+    repeat customer every third transaction.
+    """
+    # Each batch gets its own stream derived from the seed and its first row
+    rng = np.random.default_rng([seed, start_index])
+    lookup = build_lookup_tables()
+    products_df = lookup['products']
+
+    # 1. DATE (uniform over the calendar)
+    calendar = pd.date_range(start=start_date, end=end_date, freq='D')
+    day_idx = rng.integers(0, len(calendar), n)
+    order_dates = calendar[day_idx]
+    years = order_dates.year.values
+    months = order_dates.month.values
 
-for i in range(n_transactions):
-    # Progress indicator
-    if i % 50000 == 0 and i > 0:
-        print(f"   Generated {i:,} transactions...")
-    
-    # 1. DATE WITH SEASONALITY
-    order_date = random.choice(date_range)
-    month_idx = order_date.month - 1
-    
     # 2. REGION SELECTION WITH GROWTH TRENDS
-    if order_date.year == 2022:
-        region_weights = [0.45, 0.35, 0.20]  # NA, Europe, APAC
-    elif order_date.year == 2023:
-        region_weights = [0.48, 0.33, 0.19]  # NA growing
-    else:  # 2024
-        region_weights = [0.50, 0.30, 0.20]  # NA continues growth
-    
-    region = random.choices(
-        ['North America', 'Europe', 'Asia Pacific'],
-        weights=region_weights,
-        k=1
-    )[0]
-    
+    year_weights = np.array([REGION_WEIGHTS_BY_YEAR.get(y, REGION_WEIGHTS_BY_YEAR[2024])
+                             for y in range(start_date.year, end_date.year + 1)])
+    region_idx = weighted_choice(rng, year_weights[years - start_date.year], n)
+
     # 3. COUNTRY & CITY WITHIN REGION
-    country_info = regions_config[region]['countries']
-    country = random.choice(list(country_info.keys()))
-    city = random.choice(country_info[country]['cities'])
-    
-    # Apply regional multiplier
-    region_multiplier = country_info[country]['base_multiplier']
-    margin_factor = country_info[country]['margin_factor']
-    
+    country_idx = lookup['country_start'][region_idx] + uniform_index(rng, lookup['country_count'][region_idx])
+    city_idx = lookup['city_start'][country_idx] + uniform_index(rng, lookup['city_count'][country_idx])
+    margin_factor = lookup['margin_factors'][country_idx]
+    country_names = lookup['country_names'][country_idx]
+
     # 4. PRODUCT SELECTION WITH TRENDS
-    product_weights = [p['VolumeFactor'] for p in products]
-    product = random.choices(products, weights=product_weights, k=1)[0]
-    
-    # 5. QUANTITY - realistic distribution
-    if product['Category'] == 'Accessories':
-        quantity = np.random.poisson(3) + 1
-    elif product['Category'] == 'Electronics' and product['SubCategory'] == 'Phones':
-        quantity = np.random.poisson(1.5) + 1
-    else:
-        quantity = np.random.poisson(2) + 1
-    
-    quantity = min(quantity, 10)  # Cap at 10
-    
-    # 6. PRICING WITH REGIONAL VARIATIONS
-    base_price = product['BasePrice']
-    
-    # Regional price adjustments
-    if region == 'Europe':
-        price_multiplier = random.uniform(0.95, 1.05)
-    elif region == 'Asia Pacific' and country == 'China':
-        price_multiplier = random.uniform(0.85, 0.95)  # Competitive pricing
-    else:
-        price_multiplier = random.uniform(0.97, 1.08)
-    
-    # Channel-based pricing
-    channel = random.choices(
-        ['Online', 'Retail Store', 'Corporate', 'Distributor'],
-        weights=[0.45, 0.30, 0.15, 0.10],
-        k=1
-    )[0]
-    
-    if channel == 'Online':
-        price_multiplier *= random.uniform(0.95, 1.00)  # Online discounts
-    elif channel == 'Corporate':
-        price_multiplier *= random.uniform(0.90, 0.97)  # Corporate discounts
-    
-    # Seasonal adjustments
-    season_factor = regions_config[region]['seasonality'][month_idx]
-    price_multiplier *= season_factor
-    
-    unit_price = round(base_price * price_multiplier, 2)
-    
+    product_idx = weighted_choice(rng, products_df['VolumeFactor'].values, n)
+    category = products_df['Category'].values[product_idx]
+    sub_category = products_df['SubCategory'].values[product_idx]
+
+    # 5. QUANTITY - realistic distribution, capped at 10
+    lam = np.where(category == 'Accessories', 3.0,
+                   np.where((category == 'Electronics') & (sub_category == 'Phones'), 1.5, 2.0))
+    quantity = np.minimum(rng.poisson(lam) + 1, 10)
+
+    # 6. PRICING WITH REGIONAL, CHANNEL AND SEASONAL VARIATIONS
+    is_europe = region_idx == REGION_NAMES.index('Europe')
+    is_china = (region_idx == REGION_NAMES.index('Asia Pacific')) & (country_names == 'China')
+    low = np.where(is_europe, 0.95, np.where(is_china, 0.85, 0.97))
+    high = np.where(is_europe, 1.05, np.where(is_china, 0.95, 1.08))
+    price_multiplier = rng.uniform(low, high)
+
+    channel_idx = weighted_choice(rng, CHANNEL_WEIGHTS, n)
+    channel = np.array(CHANNELS)[channel_idx]
+    is_online = channel == 'Online'
+    is_corporate = channel == 'Corporate'
+    channel_discount = rng.random(n)
+    price_multiplier *= np.where(is_online, 0.95 + channel_discount * 0.05,
+                                 np.where(is_corporate, 0.90 + channel_discount * 0.07, 1.0))
+    price_multiplier *= lookup['seasonality'][region_idx, months - 1]
+
+    base_price = products_df['BasePrice'].values[product_idx]
+    unit_price = np.round(base_price * price_multiplier, 2)
+
     # 7. COST WITH MARGIN TARGETS
-    base_cost = product['Cost']
-    cost_variation = random.uniform(0.95, 1.05)
-    cost_price = round(base_cost * cost_variation * margin_factor, 2)
-    
-    # 8. CUSTOMER GENERATION WITH SEGMENTS
-    if i % 3 == 0:  # 33% repeat customers
-        if customer_pool:
-            customer_id = random.choice(list(customer_pool.keys()))
-            customer_segment = customer_pool[customer_id]['segment']
-        else:
-            customer_id = f"C{customer_counter}"
-            customer_counter += 1
-            customer_segment = random.choices(
-                ['Enterprise', 'Retail', 'SMB', 'Government'],
-                weights=[0.2, 0.5, 0.25, 0.05],
-                k=1
-            )[0]
-            customer_pool[customer_id] = {'segment': customer_segment}
-    else:
-        customer_id = f"C{customer_counter}"
-        customer_counter += 1
-        customer_segment = random.choices(
-            ['Enterprise', 'Retail', 'SMB', 'Government'],
-            weights=[0.2, 0.5, 0.25, 0.05],
-            k=1
-        )[0]
-        customer_pool[customer_id] = {'segment': customer_segment}
-    
+    cost_variation = rng.uniform(0.95, 1.05, n)
+    cost_price = np.round(products_df['Cost'].values[product_idx] * cost_variation * margin_factor, 2)
+
+    # 8. CUSTOMERS: every third transaction re-uses an earlier customer.
+    # Row p creates customer number p - (p - 1) // 3, so numbering and
+    # segments do not depend on how the rows are split into batches.
+    positions = start_index + np.arange(n, dtype=np.int64)
+    is_new = (positions % 3 != 0) | (positions == 0)
+    created_before = np.where(positions > 0, positions - (positions - 1) // 3, 0)
+    customer_idx = created_before.copy()
+    customer_idx[~is_new] = uniform_index(rng, created_before[~is_new])
+    segments = customer_segments_for(customer_idx, seed)
+    customer_ids = 'C' + pd.Series(FIRST_CUSTOMER_NUMBER + customer_idx).astype(str)
+
     # 9. CALCULATE FINANCIALS
-    total_sales = round(quantity * unit_price, 2)
-    total_cost = round(quantity * cost_price, 2)
-    profit = round(total_sales - total_cost, 2)
-    profit_margin = round((profit / total_sales * 100) if total_sales > 0 else 0, 2)
-    
-    # 10. BUILD TRANSACTION RECORD
-    transaction = {
-        'TransactionID': f"T{202200000 + i}",
-        'OrderDate': order_date.strftime('%Y-%m-%d'),
-        'OrderYear': order_date.year,
-        'OrderMonth': order_date.strftime('%Y-%m'),
-        'OrderQuarter': f"Q{((order_date.month - 1) // 3) + 1}",
-        'Weekday': order_date.strftime('%A'),
-        'IsWeekend': 1 if order_date.weekday() >= 5 else 0,
-        'Region': region,
-        'Country': country,
-        'City': city,
-        'ProductID': product['ProductID'],
-        'ProductName': product['ProductName'],
-        'Category': product['Category'],
-        'SubCategory': product['SubCategory'],
-        'Brand': product['Brand'],
-        'CustomerID': customer_id,
-        'CustomerSegment': customer_segment,
+    total_sales = np.round(quantity * unit_price, 2)
+    total_cost = np.round(quantity * cost_price, 2)
+    profit = np.round(total_sales - total_cost, 2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        profit_margin = np.round(np.where(total_sales > 0, profit / total_sales * 100, 0), 2)
+    discount = np.where(unit_price < base_price, np.round((1 - unit_price / base_price) * 100, 2), 0)
+    shipping = np.where(is_online, np.round(rng.uniform(5, 50, n), 2), 0)
+
+    # 10. BUILD TRANSACTION TABLE (date strings via per-day lookups)
+    date_str = calendar.strftime('%Y-%m-%d').values
+    month_str = calendar.strftime('%Y-%m').values
+    weekday_str = calendar.strftime('%A').values
+    df = pd.DataFrame({
+        'TransactionID': 'T' + pd.Series(FIRST_TRANSACTION_NUMBER + positions).astype(str),
+        'OrderDate': date_str[day_idx],
+        'OrderYear': years,
+        'OrderMonth': month_str[day_idx],
+        'OrderQuarter': 'Q' + pd.Series((months - 1) // 3 + 1).astype(str),
+        'Weekday': weekday_str[day_idx],
+        'IsWeekend': (calendar.dayofweek.values[day_idx] >= 5).astype(int),
+        'Region': np.array(REGION_NAMES)[region_idx],
+        'Country': country_names,
+        'City': lookup['city_names'][city_idx],
+        'ProductID': products_df['ProductID'].values[product_idx],
+        'ProductName': products_df['ProductName'].values[product_idx],
+        'Category': category,
+        'SubCategory': sub_category,
+        'Brand': products_df['Brand'].values[product_idx],
+        'CustomerID': customer_ids,
+        'CustomerSegment': segments,
         'SalesChannel': channel,
         'Quantity': quantity,
         'UnitPrice': unit_price,
@@ -281,172 +326,355 @@ for i in range(n_transactions):
         'TotalCost': total_cost,
         'Profit': profit,
         'ProfitMargin': profit_margin,
-        'DiscountApplied': round((1 - (unit_price / base_price)) * 100, 2) if unit_price < base_price else 0,
-        'ShippingCost': round(random.uniform(5, 50), 2) if channel == 'Online' else 0
-    }
-    
-    transactions.append(transaction)
+        'DiscountApplied': discount,
+        'ShippingCost': shipping,
+    })
+    return df
 
-# Create sales DataFrame
-df_sales = pd.DataFrame(transactions)
-print(f"Generated {len(df_sales):,} sales transactions")
 
-# ==================== CREATE PRODUCTS DATAFRAME ====================
-print("\nCreating products master data...")
-df_products = pd.DataFrame(products)
+# ==================== BATCH SUMMARIES ====================
+# Per-customer counts behind PreferredChannel, Region and Country
+CUSTOMER_COUNT_COLUMNS = ['SalesChannel', 'Region', 'Country']
+# Where per-customer partials wait, under the output folder, until
+# customers.csv is built
+CUSTOMER_SPILL_DIR = '_customers'
 
-# Calculate actual performance from sales data
-product_stats = df_sales.groupby('ProductID').agg({
-    'TotalSales': 'sum',
-    'Profit': 'sum',
-    'Quantity': 'sum'
-}).reset_index()
 
-product_stats['AvgPrice'] = df_sales.groupby('ProductID')['UnitPrice'].mean().values
-product_stats['AvgMargin'] = df_sales.groupby('ProductID')['ProfitMargin'].mean().values
+def customer_numbers(customer_ids):
+    return customer_ids.str[1:].astype(np.int64) - FIRST_CUSTOMER_NUMBER
 
-df_products = df_products.merge(product_stats, on='ProductID', how='left')
-df_products['PriceRange'] = pd.cut(df_products['BasePrice'], 
-                                   bins=[0, 100, 300, 700, 2000], 
-                                   labels=['Budget', 'Mid-Range', 'Premium', 'Luxury'])
 
-# ==================== CREATE CUSTOMERS DATAFRAME ====================
-print("\nCreating customers data...")
+def summarize_transactions(df_sales, customer_limit=None):
+    """
+    Mergeable partial aggregates of one batch of transactions.
 
-customers_data = []
-for cust_id, info in list(customer_pool.items())[:1000]:  # Limit to 1000 unique customers
-    # Get customer's transactions
-    cust_transactions = df_sales[df_sales['CustomerID'] == cust_id]
-    
-    if len(cust_transactions) > 0:
-        first_purchase = cust_transactions['OrderDate'].min()
-        last_purchase = cust_transactions['OrderDate'].max()
-        total_spent = cust_transactions['TotalSales'].sum()
-        purchase_count = len(cust_transactions)
-        avg_order_value = total_spent / purchase_count
-        
-        # Determine customer tier
-        if total_spent > 50000:
-            tier = 'Platinum'
-        elif total_spent > 20000:
-            tier = 'Gold'
-        elif total_spent > 5000:
-            tier = 'Silver'
-        else:
-            tier = 'Bronze'
-        
-        customers_data.append({
-            'CustomerID': cust_id,
-            'CustomerName': f"{info['segment']}_Customer_{cust_id[1:]}",
-            'Segment': info['segment'],
-            'Tier': tier,
-            'FirstPurchaseDate': first_purchase,
-            'LastPurchaseDate': last_purchase,
-            'TotalPurchaseValue': round(total_spent, 2),
-            'NumberOfOrders': purchase_count,
-            'AvgOrderValue': round(avg_order_value, 2),
-            'PreferredChannel': cust_transactions['SalesChannel'].mode()[0] if len(cust_transactions) > 0 else 'Online',
-            'Region': cust_transactions['Region'].mode()[0] if len(cust_transactions) > 0 else 'North America',
-            'Country': cust_transactions['Country'].mode()[0] if len(cust_transactions) > 0 else 'USA'
-        })
-
-df_customers = pd.DataFrame(customers_data)
+    Every dimension table and the printed summary are built from these, so
+    batches can be generated independently and combined at the end.
+    """
+    measures = dict(
+        TotalSales=('TotalSales', 'sum'),
+        Profit=('Profit', 'sum'),
+        MarginSum=('ProfitMargin', 'sum'),
+        Rows=('TotalSales', 'size'),
+    )
+    partials = {
+        'products': df_sales.groupby('ProductID').agg(
+            Quantity=('Quantity', 'sum'), UnitPriceSum=('UnitPrice', 'sum'), **measures),
+        'regions': df_sales.groupby('Region').agg(**measures),
+        'city_years': df_sales.groupby(['City', 'OrderYear'])['TotalSales'].sum(),
+    }
 
-# ==================== CREATE REGIONS DATAFRAME ====================
-print("\nCreating regions and targets data...")
-
-regions_list = []
-for region, config in regions_config.items():
-    for country, country_info in config['countries'].items():
-        for city in country_info['cities']:
-            # Base target with growth
-            base_target_2022 = random.randint(800000, 2500000)
-            growth_rate = config['growth_rate']
-            
-            # Add some variability
-            city_factor = random.uniform(0.8, 1.2)
-            
-            regions_list.append({
-                'Region': region,
-                'Country': country,
-                'City': city,
-                'RegionalManager': random.choice(['John Smith', 'Sarah Chen', 'Mike Johnson', 
-                                                'Emma Wilson', 'David Brown', 'Lisa Wang']),
-                'Currency': config['currency'],
-                'MarketSize': random.choice(['Large', 'Medium', 'Small']),
-                'Target_2022': round(base_target_2022 * city_factor),
-                'Target_2023': round(base_target_2022 * city_factor * (1 + growth_rate)),
-                'Target_2024': round(base_target_2022 * city_factor * (1 + growth_rate) ** 2),
-                'ActualSales_2022': 0,  # Will be calculated
-                'ActualSales_2023': 0,
-                'ActualSales_2024': 0,
-                'Population': random.randint(100000, 10000000),
-                'GDP_Per_Capita': random.randint(25000, 85000)
+    customers = df_sales
+    if customer_limit is not None:
+        customers = df_sales[customer_numbers(df_sales['CustomerID']) < customer_limit]
+    # min/max of date strings would take pandas' per-group Python path;
+    # dates are formatted again when customers.csv is built
+    customers = customers.assign(OrderDay=pd.to_datetime(customers['OrderDate'], format='%Y-%m-%d'))
+    partials['customers'] = customers.groupby('CustomerID', sort=False).agg(
+        Segment=('CustomerSegment', 'first'),
+        FirstPurchaseDate=('OrderDay', 'min'),
+        LastPurchaseDate=('OrderDay', 'max'),
+        TotalPurchaseValue=('TotalSales', 'sum'),
+        NumberOfOrders=('TotalSales', 'size'),
+    )
+    for column in CUSTOMER_COUNT_COLUMNS:
+        partials[f'customer_{column}'] = customers.groupby(['CustomerID', column], sort=False).size()
+    return partials
+
+
+def merge_summaries(summaries):
+    """Combine batch summaries in batch order"""
+    merged = {}
+    for key in summaries[0]:
+        parts = pd.concat([s[key] for s in summaries])
+        if key == 'customers':
+            merged[key] = parts.groupby(level=0, sort=False).agg({
+                'Segment': 'first', 'FirstPurchaseDate': 'min', 'LastPurchaseDate': 'max',
+                'TotalPurchaseValue': 'sum', 'NumberOfOrders': 'sum',
             })
+        else:
+            merged[key] = parts.groupby(level=list(range(parts.index.nlevels)), sort=False).sum()
+    return merged
+
+
+def spill_customers(summary, spill_dir, bucket_size):
+    """
+    Move the per-customer partials out of a batch summary, appending them
+    to one CSV per bucket of `bucket_size` customer numbers under spill_dir.
+
+    Batches are spilled in order, so each bucket file lists a customer's
+    partials in batch order, as merge_summaries() would see them.
+    """
+    customers = summary.pop('customers').reset_index()
+    counts = pd.concat([
+        summary.pop(f'customer_{column}').rename('n').rename_axis(['CustomerID', 'Value']).reset_index()
+        .assign(Column=column)
+        for column in CUSTOMER_COUNT_COLUMNS])
+    for name, frame in (('customers', customers), ('customer_counts', counts)):
+        buckets = (customer_numbers(frame['CustomerID']) // bucket_size).values
+        for bucket, rows in frame.groupby(buckets, sort=True):
+            path = os.path.join(spill_dir, f'{name}-{bucket:06d}.csv')
+            rows.to_csv(path, mode='a', index=False, header=not os.path.exists(path))
+
+
+def read_customer_bucket(spill_dir, bucket):
+    """Merged per-customer partials of one spilled bucket, keyed like merge_summaries()"""
+    customers = pd.read_csv(os.path.join(spill_dir, f'customers-{bucket:06d}.csv'),
+                            parse_dates=['FirstPurchaseDate', 'LastPurchaseDate'])
+    summary = merge_summaries([{'customers': customers.set_index('CustomerID')}])
+    counts = pd.read_csv(os.path.join(spill_dir, f'customer_counts-{bucket:06d}.csv'))
+    for column, rows in counts.groupby('Column', sort=False):
+        summary[f'customer_{column}'] = (rows.groupby(['CustomerID', 'Value'], sort=False)['n'].sum()
+                                         .rename_axis(['CustomerID', column]))
+    return summary
 
-df_regions = pd.DataFrame(regions_list)
 
-# Calculate actual sales by city and year
-for idx, row in df_regions.iterrows():
-    for year in [2022, 2023, 2024]:
-        sales_data = df_sales[
-            (df_sales['City'] == row['City']) & 
-            (df_sales['OrderYear'] == year)
-        ]
-        df_regions.at[idx, f'ActualSales_{year}'] = sales_data['TotalSales'].sum()
-
-# Calculate target achievement
-for year in [2022, 2023, 2024]:
-    df_regions[f'Achievement_{year}'] = round(
-        df_regions[f'ActualSales_{year}'] / df_regions[f'Target_{year}'] * 100, 2
+# ==================== CREATE PRODUCTS DATAFRAME ====================
+def build_products(product_stats):
+    """Product master data plus actual performance from the sales summary"""
+    df_products = pd.DataFrame(products)
+    stats = pd.DataFrame({
+        'TotalSales': product_stats['TotalSales'],
+        'Profit': product_stats['Profit'],
+        'Quantity': product_stats['Quantity'],
+        'AvgPrice': product_stats['UnitPriceSum'] / product_stats['Rows'],
+        'AvgMargin': product_stats['MarginSum'] / product_stats['Rows'],
+    })
+    df_products = df_products.merge(stats, left_on='ProductID', right_index=True, how='left')
+    df_products['PriceRange'] = pd.cut(df_products['BasePrice'],
+                                       bins=[0, 100, 300, 700, 2000],
+                                       labels=['Budget', 'Mid-Range', 'Premium', 'Luxury'])
+    return df_products
+
+
+# ==================== CREATE CUSTOMERS DATAFRAME ====================
+def preferred_value(counts, column):
+    """Most frequent value of `column` per customer (ties: alphabetical, like .mode()[0])"""
+    counts = counts.rename('n').reset_index()
+    counts = counts.sort_values(['n', column], ascending=[False, True], kind='stable')
+    return counts.drop_duplicates('CustomerID').set_index('CustomerID')[column]
+
+
+CUSTOMER_COLUMNS = ['CustomerID', 'CustomerName', 'Segment', 'Tier', 'FirstPurchaseDate', 'LastPurchaseDate',
+                    'TotalPurchaseValue', 'NumberOfOrders', 'AvgOrderValue', 'PreferredChannel',
+                    'Region', 'Country']
+
+
+def build_customers(summary, limit=None):
+    """
+    Build the customer dimension from the merged batch summaries.
+
+    Customers are listed in creation order; `limit` caps their number.
+    """
+    df = summary['customers'].copy()
+    df['TotalPurchaseValue'] = df['TotalPurchaseValue'].round(2)
+    df['AvgOrderValue'] = (df['TotalPurchaseValue'] / df['NumberOfOrders']).round(2)
+    for column in ['FirstPurchaseDate', 'LastPurchaseDate']:
+        df[column] = df[column].dt.strftime('%Y-%m-%d')
+    df['PreferredChannel'] = preferred_value(summary['customer_SalesChannel'], 'SalesChannel')
+    for column in ['Region', 'Country']:
+        df[column] = preferred_value(summary[f'customer_{column}'], column)
+    df = df.reset_index()
+
+    df = df.iloc[np.argsort(customer_numbers(df['CustomerID']).values, kind='stable')]
+    if limit is not None:
+        df = df.head(limit)
+    df['CustomerName'] = df['Segment'] + '_Customer_' + df['CustomerID'].str[1:]
+    df['Tier'] = np.select(
+        [df['TotalPurchaseValue'] > 50000, df['TotalPurchaseValue'] > 20000, df['TotalPurchaseValue'] > 5000],
+        ['Platinum', 'Gold', 'Silver'],
+        default='Bronze'
     )
+    return df[CUSTOMER_COLUMNS].reset_index(drop=True)
+
+
+def write_customers(spill_dir, path, limit=None):
+    """
+    Write customers.csv from spilled per-customer partials, one bucket at
+    a time in customer-number order, so memory holds one bucket's
+    customers however many there are. Returns the number written.
+    """
+    buckets = sorted(int(name[len('customers-'):-len('.csv')]) for name in os.listdir(spill_dir)
+                     if name.startswith('customers-'))
+    written = 0
+    with open(path, 'w', newline='') as out:
+        out.write(','.join(CUSTOMER_COLUMNS) + '\n')
+        for bucket in buckets:
+            if limit is not None and written >= limit:
+                break
+            df = build_customers(read_customer_bucket(spill_dir, bucket),
+                                 None if limit is None else limit - written)
+            df.to_csv(out, index=False, header=False)
+            written += len(df)
+    return written
+
+
+# ==================== CREATE REGIONS DATAFRAME ====================
+def build_regions(city_year_sales, rng):
+    """Regional targets (drawn from `rng`, a seeded random.Random) plus actual sales by city and year"""
+    regions_list = []
+    for region, config in regions_config.items():
+        for country, country_info in config['countries'].items():
+            for city in country_info['cities']:
+                # Base target with growth
+                base_target_2022 = rng.randint(800000, 2500000)
+                growth_rate = config['growth_rate']
+
+                # Add some variability
+                city_factor = rng.uniform(0.8, 1.2)
+
+                regions_list.append({
+                    'Region': region,
+                    'Country': country,
+                    'City': city,
+                    'RegionalManager': rng.choice(['John Smith', 'Sarah Chen', 'Mike Johnson',
+                                             'Emma Wilson', 'David Brown', 'Lisa Wang']),
+                    'Currency': config['currency'],
+                    'MarketSize': rng.choice(['Large', 'Medium', 'Small']),
+                    'Target_2022': round(base_target_2022 * city_factor),
+                    'Target_2023': round(base_target_2022 * city_factor * (1 + growth_rate)),
+                    'Target_2024': round(base_target_2022 * city_factor * (1 + growth_rate) ** 2),
+                    'ActualSales_2022': 0.0,  # Will be calculated
+                    'ActualSales_2023': 0.0,
+                    'ActualSales_2024': 0.0,
+                    'Population': rng.randint(100000, 10000000),
+                    'GDP_Per_Capita': rng.randint(25000, 85000)
+                })
+
+    df_regions = pd.DataFrame(regions_list)
+
+    # Calculate actual sales by city and year
+    actual_sales = city_year_sales.unstack(fill_value=0.0)
+    for year in [2022, 2023, 2024]:
+        year_sales = actual_sales[year] if year in actual_sales.columns else pd.Series(dtype=float)
+        df_regions[f'ActualSales_{year}'] = df_regions['City'].map(year_sales).fillna(0.0)
+
+    # Calculate target achievement
+    for year in [2022, 2023, 2024]:
+        df_regions[f'Achievement_{year}'] = round(
+            df_regions[f'ActualSales_{year}'] / df_regions[f'Target_{year}'] * 100, 2
+        )
+    return df_regions
+
 
 # ==================== CREATE DATE DIMENSION TABLE ====================
-print("\nCreating date dimension table...")
-
-date_range = pd.date_range(start='2022-01-01', end='2024-12-31', freq='D')
-df_dates = pd.DataFrame({'Date': date_range})
-
-df_dates['DateKey'] = df_dates['Date'].dt.strftime('%Y%m%d')
-df_dates['Year'] = df_dates['Date'].dt.year
-df_dates['Quarter'] = df_dates['Date'].dt.quarter
-df_dates['Month'] = df_dates['Date'].dt.month
-df_dates['MonthName'] = df_dates['Date'].dt.strftime('%B')
-df_dates['Week'] = df_dates['Date'].dt.isocalendar().week
-df_dates['DayOfWeek'] = df_dates['Date'].dt.dayofweek
-df_dates['DayName'] = df_dates['Date'].dt.strftime('%A')
-df_dates['IsWeekend'] = (df_dates['Date'].dt.dayofweek >= 5).astype(int)
-df_dates['IsHoliday'] = 0  # Can be enhanced with holiday logic
-df_dates['DayOfYear'] = df_dates['Date'].dt.dayofyear
-
-# Add fiscal year (starting April)
-df_dates['FiscalYear'] = df_dates['Date'].apply(
-    lambda x: x.year if x.month >= 4 else x.year - 1
-)
-df_dates['FiscalQuarter'] = df_dates.apply(
-    lambda x: ((x.Date.month - 4) % 12) // 3 + 1, axis=1
-)
-
-# ==================== SAVE ALL FILES ====================
-print("\nSaving files to CSV...")
-
-# Create directory if it doesn't exist
-os.makedirs('sales_dashboard_data', exist_ok=True)
-
-# Save all files
-df_sales.to_csv('sales_dashboard_data/sales_transactions.csv', index=False)
-df_products.to_csv('sales_dashboard_data/products.csv', index=False)
-df_customers.to_csv('sales_dashboard_data/customers.csv', index=False)
-df_regions.to_csv('sales_dashboard_data/regions.csv', index=False)
-df_dates.to_csv('sales_dashboard_data/dates.csv', index=False)
-
-print("\n" + "=" * 70)
-print("DATASET GENERATION COMPLETE!")
-print("=" * 70)
-print(f"""
-Files saved in 'sales_dashboard_data/' folder:
-
-1. sales_transactions.csv - {len(df_sales):,} transactions
+def build_dates():
+    date_range = pd.date_range(start='2022-01-01', end='2024-12-31', freq='D')
+    df_dates = pd.DataFrame({'Date': date_range})
+
+    df_dates['DateKey'] = df_dates['Date'].dt.strftime('%Y%m%d')
+    df_dates['Year'] = df_dates['Date'].dt.year
+    df_dates['Quarter'] = df_dates['Date'].dt.quarter
+    df_dates['Month'] = df_dates['Date'].dt.month
+    df_dates['MonthName'] = df_dates['Date'].dt.strftime('%B')
+    df_dates['Week'] = df_dates['Date'].dt.isocalendar().week
+    df_dates['DayOfWeek'] = df_dates['Date'].dt.dayofweek
+    df_dates['DayName'] = df_dates['Date'].dt.strftime('%A')
+    df_dates['IsWeekend'] = (df_dates['Date'].dt.dayofweek >= 5).astype(int)
+    df_dates['IsHoliday'] = 0  # Can be enhanced with holiday logic
+    df_dates['DayOfYear'] = df_dates['Date'].dt.dayofyear
+
+    # Add fiscal year (starting April)
+    df_dates['FiscalYear'] = df_dates['Date'].apply(
+        lambda x: x.year if x.month >= 4 else x.year - 1
+    )
+    df_dates['FiscalQuarter'] = df_dates.apply(
+        lambda x: ((x.Date.month - 4) % 12) // 3 + 1, axis=1
+    )
+    return df_dates
+
+
+# ==================== CHUNKED GENERATION ====================
+def write_partitions(df_sales, partition_dir, file_name):
+    """Write a chunk as one file per month under year=YYYY/month=MM/"""
+    months = df_sales['OrderDate'].str[:7]
+    for month, rows in df_sales.groupby(months, sort=True):
+        month_dir = os.path.join(partition_dir, f'year={month[:4]}', f'month={month[5:]}')
+        os.makedirs(month_dir, exist_ok=True)
+        rows.to_csv(os.path.join(month_dir, file_name), index=False)
+
+
+def generate_chunk(task):
+    """Generate one chunk, write it to its part file(s) and return its summary"""
+    start_index, n, seed, part_path, customer_limit, partition_dir = task
+    df_sales = generate_transactions(n, seed, start_index=start_index)
+    if partition_dir is not None:
+        write_partitions(df_sales, partition_dir, os.path.basename(part_path))
+    else:
+        df_sales.to_csv(part_path, index=False, header=(start_index == 0))
+    return summarize_transactions(df_sales, customer_limit)
+
+
+def generate_sales_file(n, seed, chunk_size, workers, out_dir, customer_limit=None, partitioned=False):
+    """
+    Generate `n` transactions in fixed-size chunks and stream them to
+    sales_transactions.csv.
+
+    Chunk k covers rows [k * chunk_size, (k + 1) * chunk_size) and draws from
+    a stream seeded by (seed, first row), so the output depends only on the
+    seed and chunk size, never on the number of workers. Chunks are written
+    to part files by the workers and appended in order by this process, so
+    memory holds at most one chunk per worker plus the summaries. The
+    per-customer partials, which grow with the row count, are spilled to
+    CUSTOMER_SPILL_DIR as each chunk arrives (see write_customers()).
+
+    With `partitioned`, each chunk is instead split by month into
+    sales_transactions/year=YYYY/month=MM/part-NNNNN.csv and nothing is
+    appended.
+    """
+    part_dir = os.path.join(out_dir, '_parts')
+    os.makedirs(part_dir, exist_ok=True)
+    partition_dir = os.path.join(out_dir, 'sales_transactions')
+    if os.path.isdir(partition_dir):
+        # Partitions of an earlier run would mix with (or, for the loader,
+        # take precedence over) this run's output
+        shutil.rmtree(partition_dir)
+    partition_dir = partition_dir if partitioned else None
+    spill_dir = os.path.join(out_dir, CUSTOMER_SPILL_DIR)
+    if os.path.isdir(spill_dir):
+        shutil.rmtree(spill_dir)
+    os.makedirs(spill_dir)
+    tasks = [(start, min(chunk_size, n - start), seed,
+              os.path.join(part_dir, f'part-{start // chunk_size:05d}.csv'), customer_limit, partition_dir)
+             for start in range(0, n, chunk_size)]
+
+    summaries = []
+    sales_path = os.path.join(out_dir, 'sales_transactions.csv')
+    with (nullcontext() if partitioned else open(sales_path, 'wb')) as out:
+        if workers > 1 and len(tasks) > 1:
+            pool = ProcessPoolExecutor(max_workers=workers)
+            results = pool.map(generate_chunk, tasks)
+        else:
+            pool = None
+            results = map(generate_chunk, tasks)
+        try:
+            for task, summary in zip(tasks, results):
+                if not partitioned:
+                    with open(task[3], 'rb') as part:
+                        shutil.copyfileobj(part, out)
+                    os.remove(task[3])
+                spill_customers(summary, spill_dir, customer_bucket_size)
+                summaries.append(summary)
+                print(f"   Generated {task[0] + task[1]:,} transactions...")
+        finally:
+            if pool is not None:
+                pool.shutdown()
+    os.rmdir(part_dir)
+    return merge_summaries(summaries)
+
+
+# ==================== REPORTING ====================
+def print_report(summary, df_products, n_customers, df_regions, out_dir):
+    totals = summary['products'][['TotalSales', 'Profit', 'MarginSum', 'Rows']].sum()
+    n_rows = int(totals['Rows'])
+
+    print("\n" + "=" * 70)
+    print("DATASET GENERATION COMPLETE!")
+    print("=" * 70)
+    print(f"""
+Files saved in '{out_dir}/' folder:
+
+1. sales_transactions{'/' if os.path.isdir(os.path.join(out_dir, 'sales_transactions')) else '.csv'} - {n_rows:,} transactions
    - 2022-2024 data with realistic patterns
    - Built-in business insights
    - Multi-region coverage
@@ -456,7 +684,7 @@ Files saved in 'sales_dashboard_data/' folder:
    - Price ranges: Budget to Luxury
    - Trend indicators
 
-3. customers.csv - {len(df_customers)} customers
+3. customers.csv - {n_customers} customers
    - Segments: Enterprise, Retail, SMB, Government
    - Tiers: Bronze to Platinum
    - Purchase history
@@ -472,9 +700,9 @@ Files saved in 'sales_dashboard_data/' folder:
    - Time intelligence ready
 
 DATASET SUMMARY:
-- Total Sales: ${df_sales['TotalSales'].sum():,.2f}
-- Total Profit: ${df_sales['Profit'].sum():,.2f}
-- Average Margin: {df_sales['ProfitMargin'].mean():.1f}%
+- Total Sales: ${totals['TotalSales']:,.2f}
+- Total Profit: ${totals['Profit']:,.2f}
+- Average Margin: {totals['MarginSum'] / n_rows:.1f}%
 - Time Period: 3 years (2022-2024)
 - Regions: North America, Europe, Asia Pacific
 - Countries: 12
@@ -490,44 +718,39 @@ NEXT STEPS:
    - Electronics category is most profitable
 """)
 
-# Create a quick analysis summary
-print("\nQUICK INSIGHTS (for your dashboard narrative):")
-print("-" * 50)
-
-# Regional performance
-regional_stats = df_sales.groupby('Region').agg({
-    'TotalSales': 'sum',
-    'Profit': 'sum',
-    'ProfitMargin': 'mean'
-}).round(2)
-
-print("REGIONAL PERFORMANCE:")
-for region in regional_stats.index:
-    stats = regional_stats.loc[region]
-    print(f"  {region}: ${stats['TotalSales']/1e6:.1f}M sales, "
-          f"${stats['Profit']/1e6:.1f}M profit, "
-          f"{stats['ProfitMargin']:.1f}% margin")
-
-# Top products
-top_products = df_sales.groupby('ProductName').agg({
-    'TotalSales': 'sum',
-    'ProfitMargin': 'mean'
-}).nlargest(5, 'TotalSales')
-
-print(f"\nTOP 5 PRODUCTS BY SALES:")
-for idx, (product, row) in enumerate(top_products.iterrows(), 1):
-    print(f"  {idx}. {product}: ${row['TotalSales']/1e6:.2f}M, "
-          f"{row['ProfitMargin']:.1f}% margin")
-
-# Save summary file
-with open('sales_dashboard_data/DATASET_SUMMARY.md', 'w') as f:
-    f.write(f"""# Multi-Region Sales Dataset Summary
+    # Create a quick analysis summary
+    print("\nQUICK INSIGHTS (for your dashboard narrative):")
+    print("-" * 50)
+
+    # Regional performance
+    regional_stats = summary['regions'].sort_index()
+    regional_stats['ProfitMargin'] = regional_stats['MarginSum'] / regional_stats['Rows']
+    regional_stats = regional_stats.round(2)
+
+    print("REGIONAL PERFORMANCE:")
+    for region in regional_stats.index:
+        stats = regional_stats.loc[region]
+        print(f"  {region}: ${stats['TotalSales']/1e6:.1f}M sales, "
+              f"${stats['Profit']/1e6:.1f}M profit, "
+              f"{stats['ProfitMargin']:.1f}% margin")
+
+    # Top products
+    top_products = df_products.set_index('ProductName')[['TotalSales', 'AvgMargin']].nlargest(5, 'TotalSales')
+
+    print(f"\nTOP 5 PRODUCTS BY SALES:")
+    for idx, (product, row) in enumerate(top_products.iterrows(), 1):
+        print(f"  {idx}. {product}: ${row['TotalSales']/1e6:.2f}M, "
+              f"{row['AvgMargin']:.1f}% margin")
+
+    # Save summary file
+    with open(os.path.join(out_dir, 'DATASET_SUMMARY.md'), 'w') as f:
+        f.write(f"""# Multi-Region Sales Dataset Summary
 
 ## Dataset Overview
-- **Total Transactions**: {len(df_sales):,}
+- **Total Transactions**: {n_rows:,}
 - **Time Period**: January 2022 - December 2024
-- **Total Sales Value**: ${df_sales['TotalSales'].sum():,.2f}
-- **Total Profit**: ${df_sales['Profit'].sum():,.2f}
+- **Total Sales Value**: ${totals['TotalSales']:,.2f}
+- **Total Profit**: ${totals['Profit']:,.2f}
 
 ## Business Insights Built-in
 
@@ -567,4 +790,79 @@ sales[OrderDate] -> dates[Date]
 5. Sales Channel Growth
 """)
 
-print("\nReady for Power BI import! Start building your dashboard.")
+
+# ==================== MAIN ====================
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate the multi-region sales dataset.")
+    parser.add_argument('--rows', type=int, default=n_transactions,
+                        help=f"number of transactions (default: {n_transactions:,})")
+    parser.add_argument('--seed', type=int, default=seed, help=f"random seed (default: {seed})")
+    parser.add_argument('--chunk-size', type=int, default=None,
+                        help="rows per chunk; output is identical for a given seed and chunk size "
+                             "(default: one chunk)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="processes generating chunks in parallel (default: 1)")
+    parser.add_argument('--max-customers', type=int, default=max_customers,
+                        help="cap on customers.csv rows (default: all)")
+    parser.add_argument('--output-dir', default=output_dir,
+                        help=f"output folder (default: {output_dir})")
+    parser.add_argument('--partitioned', action='store_true',
+                        help="write sales as sales_transactions/year=YYYY/month=MM/*.csv instead of one CSV, "
+                             "so the dashboard reads only the months in view")
+    return parser.parse_args()
+
+
+def write_dataset(rows, seed, chunk_size, workers, out_dir, customer_limit=None, verbose=True,
+                  partitioned=False):
+    """
+    Generate the sales file and every dimension table into `out_dir`.
+
+    Returns (summary, products, number of customers, regions); customers.csv
+    is written bucket by bucket and never held whole.
+    """
+    log = print if verbose else (lambda *args, **kwargs: None)
+    # Create directory if it doesn't exist
+    os.makedirs(out_dir, exist_ok=True)
+
+    log("\nGenerating sales transactions...")
+    summary = generate_sales_file(rows, seed, chunk_size or rows, workers, out_dir, customer_limit, partitioned)
+    log(f"Generated {rows:,} sales transactions")
+
+    log("\nCreating products master data...")
+    df_products = build_products(summary['products'])
+
+    log("\nCreating customers data...")
+    spill_dir = os.path.join(out_dir, CUSTOMER_SPILL_DIR)
+    n_customers = write_customers(spill_dir, os.path.join(out_dir, 'customers.csv'), customer_limit)
+    shutil.rmtree(spill_dir)
+
+    log("\nCreating regions and targets data...")
+    df_regions = build_regions(summary['city_years'], random.Random(seed))
+
+    log("\nCreating date dimension table...")
+    df_dates = build_dates()
+
+    log("\nSaving files to CSV...")
+    df_products.to_csv(os.path.join(out_dir, 'products.csv'), index=False)
+    df_regions.to_csv(os.path.join(out_dir, 'regions.csv'), index=False)
+    df_dates.to_csv(os.path.join(out_dir, 'dates.csv'), index=False)
+    return summary, df_products, n_customers, df_regions
+
+
+def main():
+    args = parse_args()
+
+    print("=" * 70)
+    print("GENERATING REALISTIC MULTI-REGION SALES DATASET")
+    print("=" * 70)
+
+    summary, df_products, n_customers, df_regions = write_dataset(
+        args.rows, args.seed, args.chunk_size, args.workers, args.output_dir, args.max_customers,
+        partitioned=args.partitioned)
+
+    print_report(summary, df_products, n_customers, df_regions, args.output_dir)
+    print("\nReady for Power BI import! Start building your dashboard.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,867 @@
+"""
+Data loading and export helpers for the Sales Performance Dashboard.
+
+The first load of sales_transactions.csv writes a typed Parquet snapshot next
+to the CSV. Later loads read the snapshot instead of parsing the CSV. The CSV
+is tracked by the byte offset and row count read so far plus a fingerprint
+of its header and last rows, so when the file has only grown (the nightly
+export appends to it) just the new tail is parsed.
+"""
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+SALES_FILE = 'sales_transactions.csv'
+SNAPSHOT_VERSION = 2
+# Bytes before the read offset covered by the content fingerprint
+FINGERPRINT_BYTES = 64 * 1024
+
+# Float dtype for the monetary columns once loaded. 'float32' halves them
+# but keeps only about 7 significant digits, so cents are lost from about
+# $100k up: use it only where rows are never shown or exported exactly
+FLOAT_DTYPE = 'float64'
+# String columns with at most this share of distinct values become categorical
+CATEGORY_MAX_RATIO = 0.5
+# Rows parsed at a time when the CSV is streamed rather than loaded whole
+CSV_CHUNK_ROWS = 200_000
+
+# Sales columns the query structures hold (filters, KPIs, charts and search);
+# row-level views and exports add the rest back (Dataset.full_rows())
+SALES_COLUMNS = [
+    'TransactionID', 'OrderDate', 'MonthYear',
+    'Region', 'Country', 'City',
+    'ProductID', 'ProductName', 'Category', 'SubCategory',
+    'CustomerID', 'CustomerSegment', 'SalesChannel',
+    'Quantity', 'UnitPrice', 'TotalSales', 'Profit', 'ProfitMargin',
+]
+
+
+# ============================================================================
+# CSV PARSING
+# ============================================================================
+def prepare_sales(sales):
+    """Add the derived date columns to freshly parsed sales rows"""
+    sales['OrderDate'] = pd.to_datetime(sales['OrderDate'])
+    # Derived per distinct month rather than formatted once per row
+    codes, months = pd.factorize(sales['OrderDate'].dt.to_period('M'))
+    sales['MonthYear'] = pd.Categorical.from_codes(codes, months.astype(str))
+    return sales
+
+
+def read_sales_csv(csv_path, length=None):
+    """Parse the first `length` bytes of the sales CSV (default: all of it)"""
+    if length is None or length == os.path.getsize(csv_path):
+        return prepare_sales(pd.read_csv(csv_path))
+    with open(csv_path, 'rb') as f:
+        return prepare_sales(pd.read_csv(io.BytesIO(f.read(length))))
+
+
+def sales_file_columns(path):
+    """Column names of a sales CSV, from its header"""
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def read_sales_tail(csv_path, offset, length):
+    """Parse the rows between byte `offset` and `length` using the file's header"""
+    header = pd.read_csv(csv_path, nrows=0).columns
+    with open(csv_path, 'rb') as f:
+        f.seek(offset)
+        data = f.read(length - offset)
+    return prepare_sales(pd.read_csv(io.BytesIO(data), header=None, names=header))
+
+
+class ByteWindow(io.RawIOBase):
+    """Read-only stream over bytes [offset, end) of a file"""
+
+    def __init__(self, path, offset, end):
+        self.file = open(path, 'rb')
+        self.file.seek(offset)
+        self.remaining = end - offset
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = self.file.readinto(memoryview(buffer)[:max(0, min(len(buffer), self.remaining))])
+        self.remaining -= n
+        return n
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+
+def iter_sales_csv(csv_path, offset=0, length=None, chunk_rows=CSV_CHUNK_ROWS, columns=None):
+    """
+    Parse the rows between byte `offset` and `length` in chunks of
+    `chunk_rows`, so memory is bounded by the chunk rather than the file.
+    """
+    length = complete_length(csv_path, os.path.getsize(csv_path)) if length is None else length
+    header = pd.read_csv(csv_path, nrows=0).columns
+    options = {} if offset == 0 else dict(header=None, names=header)
+    usecols = None if columns is None else [c for c in header if c in set(columns)]
+    with io.BufferedReader(ByteWindow(csv_path, offset, length)) as window:
+        for chunk in pd.read_csv(window, chunksize=chunk_rows, usecols=usecols, **options):
+            yield prepare_sales(chunk)
+
+
+def select_columns(frame, columns):
+    """Keep the requested columns that exist in the frame, in frame order"""
+    if columns is None:
+        return frame
+    wanted = set(columns)
+    return frame[[c for c in frame.columns if c in wanted]]
+
+
+# ============================================================================
+# COMPACT DTYPES
+# ============================================================================
+def compact_sales(sales, float_dtype=None):
+    """
+    Shrink the in-memory layout of the sales table.
+
+    Low-cardinality strings become categoricals and integers are downcast
+    to the smallest type that holds them; both are lossless. Float columns
+    are cast to `float_dtype` when given.
+    """
+    columns = {}
+    for column in sales.columns:
+        values = sales[column]
+        if values.dtype == object:
+            if values.nunique() <= CATEGORY_MAX_RATIO * len(values):
+                columns[column] = values.astype('category')
+        elif pd.api.types.is_integer_dtype(values.dtype):
+            columns[column] = pd.to_numeric(values, downcast='integer')
+        elif pd.api.types.is_float_dtype(values.dtype) and float_dtype is not None:
+            columns[column] = values.astype(float_dtype)
+    return sales.assign(**columns) if columns else sales
+
+
+def concat_frames(frames):
+    """pd.concat that keeps categorical columns categorical across frames"""
+    frames = [f for f in frames if f is not None]
+    first = frames[0]
+    columns = {}
+    for column in first.columns:
+        if isinstance(first[column].dtype, pd.CategoricalDtype):
+            categories = pd.Index([])
+            for frame in frames:
+                if column in frame.columns:
+                    values = frame[column]
+                    new = values.cat.categories if isinstance(values.dtype, pd.CategoricalDtype) else pd.Index(values.dropna().unique())
+                    categories = categories.append(new.difference(categories, sort=False))
+            columns[column] = pd.CategoricalDtype(categories)
+    if columns:
+        frames = [f.astype({c: d for c, d in columns.items() if c in f.columns}) for f in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+def merge_by_date(sales, rows):
+    """
+    `rows` merged into the date-ordered `sales` so the result stays in
+    OrderDate order (ties keep existing rows first); rows dated on or
+    after the last one are simply appended.
+    """
+    rows = rows.take(np.argsort(rows['OrderDate'].values, kind='stable')).reset_index(drop=True)
+    if sales is None or len(sales) == 0:
+        return rows
+    dates = sales['OrderDate'].values
+    if len(rows) == 0 or rows['OrderDate'].values[0] >= dates[-1]:
+        return concat_frames([sales, rows])
+    # Back-dated rows: interleave the two sorted runs instead of re-sorting
+    at = np.searchsorted(dates, rows['OrderDate'].values, side='right') + np.arange(len(rows))
+    order = np.empty(len(sales) + len(rows), dtype=np.int64)
+    placed = np.zeros(len(order), dtype=bool)
+    placed[at] = True
+    order[at] = np.arange(len(sales), len(order))
+    order[~placed] = np.arange(len(sales))
+    return concat_frames([sales, rows]).take(order).reset_index(drop=True)
+
+
+def memory_report(before, after):
+    """Per-column dtype and bytes of two versions of a frame, plus a total row"""
+    report = pd.DataFrame({
+        'dtype_before': before.dtypes.astype(str),
+        'bytes_before': before.memory_usage(deep=True, index=False),
+        'dtype_after': after.dtypes.astype(str).reindex(before.columns),
+        'bytes_after': after.memory_usage(deep=True, index=False).reindex(before.columns),
+    })
+    report.loc['Total'] = ['', report['bytes_before'].sum(), '', report['bytes_after'].sum()]
+    return report
+
+
+# ============================================================================
+# SOURCE TRACKING
+# ============================================================================
+def complete_length(csv_path, size=None):
+    """Length of the file up to its last newline, ignoring a half-written row"""
+    size = os.path.getsize(csv_path) if size is None else size
+    with open(csv_path, 'rb') as f:
+        pos = size
+        while pos > 0:
+            start = max(0, pos - 65536)
+            f.seek(start)
+            block = f.read(pos - start)
+            newline = block.rfind(b'\n')
+            if newline >= 0:
+                return start + newline + 1
+            pos = start
+    return 0
+
+
+def content_fingerprint(csv_path, length):
+    """Hash of the header line and the last rows before byte `length`"""
+    digest = hashlib.sha1()
+    with open(csv_path, 'rb') as f:
+        header = f.readline()
+        digest.update(header)
+        start = max(len(header), length - FINGERPRINT_BYTES)
+        f.seek(start)
+        digest.update(f.read(max(0, length - start)))
+    return digest.hexdigest()
+
+
+def source_signature(csv_path, length=None, rows=None):
+    """Identify the CSV contents read so far: byte offset, rows and fingerprint"""
+    stat = os.stat(csv_path)
+    length = complete_length(csv_path, stat.st_size) if length is None else length
+    return {
+        'version': SNAPSHOT_VERSION,
+        'source': csv_path.name,
+        'size': length,
+        'rows': rows,
+        'mtime_ns': stat.st_mtime_ns,
+        'fingerprint': content_fingerprint(csv_path, length),
+    }
+
+
+def source_status(csv_path, signature):
+    """
+    Compare the CSV with a signature from source_signature().
+
+    Returns 'unchanged', 'appended' (the file has only grown: the bytes up
+    to the recorded offset still fingerprint the same) or 'changed'.
+    """
+    if signature is None or signature.get('version') != SNAPSHOT_VERSION:
+        return 'changed'
+    stat = os.stat(csv_path)
+    if stat.st_size == signature['size'] and stat.st_mtime_ns == signature['mtime_ns']:
+        return 'unchanged'
+    if stat.st_size <= signature['size']:
+        return 'changed'
+    if content_fingerprint(csv_path, signature['size']) != signature['fingerprint']:
+        return 'changed'
+    if complete_length(csv_path, stat.st_size) == signature['size']:
+        # Only a partial row has been written so far
+        return 'unchanged'
+    return 'appended'
+
+
+# ============================================================================
+# PARQUET SNAPSHOT
+# ============================================================================
+def snapshot_paths(csv_path):
+    """Return (snapshot file, metadata file) stored next to the CSV"""
+    return csv_path.with_suffix('.parquet'), csv_path.with_suffix('.snapshot.json')
+
+
+def read_snapshot_meta(csv_path):
+    """The signature the snapshot was written for, or None if unusable"""
+    snapshot_path, meta_path = snapshot_paths(csv_path)
+    if not PARQUET_AVAILABLE or not snapshot_path.exists() or not meta_path.exists():
+        return None
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_snapshot(sales, csv_path, signature):
+    """Write the snapshot atomically; returns False if the directory is read-only"""
+    if not PARQUET_AVAILABLE:
+        return False
+    snapshot_path, meta_path = snapshot_paths(csv_path)
+    tmp_snapshot = snapshot_path.with_name(snapshot_path.name + '.tmp')
+    tmp_meta = meta_path.with_name(meta_path.name + '.tmp')
+    try:
+        sales.to_parquet(tmp_snapshot, index=False)
+        with open(tmp_meta, 'w', encoding='utf-8') as f:
+            json.dump(signature, f)
+        os.replace(tmp_snapshot, snapshot_path)
+        os.replace(tmp_meta, meta_path)
+        return True
+    except OSError:
+        for path in (tmp_snapshot, tmp_meta):
+            if path.exists():
+                path.unlink()
+        return False
+
+
+def read_snapshot(csv_path, columns=None):
+    snapshot_path, _ = snapshot_paths(csv_path)
+    if columns is not None:
+        wanted = set(columns)
+        columns = [c for c in pq.read_schema(snapshot_path).names if c in wanted]
+    return pd.read_parquet(snapshot_path, columns=columns)
+
+
+def frame_bytes(frame):
+    return int(frame.memory_usage(deep=True, index=False).sum())
+
+
+def load_sales_state(csv_path, columns=SALES_COLUMNS, float_dtype=FLOAT_DTYPE):
+    """
+    Load the sales table, preferring the Parquet snapshot.
+
+    Returns (sales, signature, source) where source is 'snapshot' or 'csv'
+    and signature records how far into the CSV the table reaches. A
+    snapshot of an earlier, shorter version of the CSV is topped up with
+    the appended rows and rewritten. The snapshot keeps full precision;
+    the returned table is compacted to `float_dtype`. The signature's
+    'parsed_bytes' is the size the selected columns had as parsed.
+    """
+    meta = read_snapshot_meta(csv_path)
+    status = source_status(csv_path, meta) if meta is not None else 'changed'
+    if status == 'unchanged':
+        return compact_sales(read_snapshot(csv_path, columns), float_dtype), meta, 'snapshot'
+    if status == 'appended':
+        signature = source_signature(csv_path)
+        tail = read_sales_tail(csv_path, meta['size'], signature['size'])
+        signature['parsed_bytes'] = meta.get('parsed_bytes', 0) + frame_bytes(select_columns(tail, columns))
+        sales = concat_frames([read_snapshot(csv_path), compact_sales(tail)])
+        signature['rows'] = len(sales)
+        write_snapshot(sales, csv_path, signature)
+        return compact_sales(select_columns(sales, columns), float_dtype), signature, 'snapshot'
+
+    # Take the signature before parsing, and parse only up to its offset,
+    # so rows appended during the parse are picked up by the next refresh.
+    signature = source_signature(csv_path)
+    sales = read_sales_csv(csv_path, signature['size'])
+    signature['rows'] = len(sales)
+    signature['parsed_bytes'] = frame_bytes(select_columns(sales, columns))
+    sales = compact_sales(sales)
+    write_snapshot(sales, csv_path, signature)
+    return compact_sales(select_columns(sales, columns), float_dtype), signature, 'csv'
+
+
+def load_sales(csv_path, columns=SALES_COLUMNS, float_dtype=FLOAT_DTYPE):
+    """
+    Load the sales table, preferring the Parquet snapshot.
+
+    Returns (sales, source) where source is 'snapshot' or 'csv'.
+    """
+    sales, _, source = load_sales_state(csv_path, columns, float_dtype)
+    return sales, source
+
+
+# ============================================================================
+# PARTITIONED LAYOUT
+# ============================================================================
+# Directory that replaces SALES_FILE in a partitioned data folder: one CSV
+# or more per year=YYYY/month=MM/ (or year=YYYY/) subdirectory
+PARTITION_DIR = 'sales_transactions'
+
+
+def partition_period(path, root):
+    """(first day, last day) covered by a partition file, from its key=value directories"""
+    keys = dict(part.split('=', 1) for part in path.relative_to(root).parts[:-1] if '=' in part)
+    year = int(keys['year'])
+    if 'month' in keys:
+        first = pd.Timestamp(year=year, month=int(keys['month']), day=1)
+        return first, first + pd.offsets.MonthEnd(0)
+    return pd.Timestamp(year=year, month=1, day=1), pd.Timestamp(year=year, month=12, day=31)
+
+
+def list_partitions(root):
+    """{partition file: (first day, last day)} in date order"""
+    periods = {path: partition_period(path, root) for path in root.rglob('*.csv')
+               if 'year=' in path.relative_to(root).as_posix()}
+    return dict(sorted(periods.items(), key=lambda item: (item[1][0], str(item[0]))))
+
+
+def overlaps(period, start=None, end=None):
+    """Whether a (first day, last day) period meets an inclusive date range (None: open)"""
+    first, last = period
+    return (start is None or last >= pd.Timestamp(start)) and (end is None or first <= pd.Timestamp(end))
+
+
+# ============================================================================
+# STAR JOIN
+# ============================================================================
+# Dimension attributes copied onto the sales rows at load time:
+# dimension table -> (key column, attributes)
+DENORMALIZED_ATTRIBUTES = {
+    'customers': ('CustomerID', ['Tier', 'Segment', 'PreferredChannel']),
+    'products': ('ProductID', ['Brand', 'PriceRange']),
+}
+CUSTOMER_ATTRIBUTES = DENORMALIZED_ATTRIBUTES['customers'][1]
+# Attribute value of sales rows whose key is missing from the dimension table
+UNKNOWN_MEMBER = 'Unknown'
+# 'unknown' files such rows under UNKNOWN_MEMBER: they count in every total
+# and can be selected in the filters like any other member. 'exclude' leaves
+# the attributes missing, so the rows match no attribute filter.
+MISSING_MEMBER_POLICY = 'unknown'
+
+
+def key_positions(keys, dimension_keys):
+    """Position of each sales key in the (unique) dimension keys, -1 when missing"""
+    lookup = pd.Index(dimension_keys)
+    if isinstance(keys.dtype, pd.CategoricalDtype):
+        # One hash lookup per distinct key, then an integer gather per row
+        positions = lookup.get_indexer(keys.cat.categories)
+        codes = keys.cat.codes.values
+        return np.where(codes >= 0, positions[codes], -1)
+    return lookup.get_indexer(keys)
+
+
+def denormalize(sales, dimensions, policy=MISSING_MEMBER_POLICY):
+    """
+    Copy dimension attributes onto the sales rows as categorical columns.
+
+    `dimensions` maps the names in DENORMALIZED_ATTRIBUTES to their tables.
+    Each key is resolved to a dimension row once; every attribute is then
+    an integer gather of that row's code, so filters and charts on these
+    attributes need no join.
+    """
+    columns = {}
+    for name, (key, attributes) in DENORMALIZED_ATTRIBUTES.items():
+        table = dimensions.get(name)
+        if table is None or key not in table.columns or key not in sales.columns:
+            continue
+        table = table.drop_duplicates(key)
+        positions = key_positions(sales[key], table[key].values)
+        for attribute in attributes:
+            if attribute not in table.columns:
+                continue
+            values = pd.Categorical(table[attribute])
+            categories = values.categories
+            codes = np.where(positions >= 0, values.codes[np.maximum(positions, 0)], -1)
+            if policy == 'unknown':
+                if UNKNOWN_MEMBER not in categories:
+                    categories = categories.append(pd.Index([UNKNOWN_MEMBER]))
+                codes = np.where(codes >= 0, codes, categories.get_loc(UNKNOWN_MEMBER))
+            columns[attribute] = pd.Categorical.from_codes(codes, categories)
+    return sales.assign(**columns) if columns else sales
+
+
+def same_attributes(old, new):
+    """True if two denormalized tables hold the same attribute values"""
+    for _, attributes in DENORMALIZED_ATTRIBUTES.values():
+        for attribute in attributes:
+            if (attribute in old.columns) != (attribute in new.columns):
+                return False
+            if attribute not in old.columns:
+                continue
+            categories = old[attribute].cat.categories.union(new[attribute].cat.categories)
+            before = old[attribute].cat.set_categories(categories).cat.codes.values
+            after = new[attribute].cat.set_categories(categories).cat.codes.values
+            if not np.array_equal(before, after):
+                return False
+    return True
+
+
+# ============================================================================
+# DATASET
+# ============================================================================
+# Dimension tables loaded next to the sales CSV (attribute name -> file)
+DIMENSION_FILES = {
+    'products': 'products.csv',
+    'customers': 'customers.csv',
+    'regions': 'regions.csv',
+    'dates': 'dates.csv',
+}
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class Dataset:
+    """
+    The sales table and dimension tables of one data directory.
+
+    refresh() picks up changes on disk. When sales_transactions.csv has
+    only grown, just the appended rows are parsed; a full reload happens
+    only if earlier content changed. The sales table is kept compact (see
+    compact_sales), sorted by OrderDate and carries the customer and
+    product attributes (see denormalize). `model` is a slot for query
+    structures derived from the tables, maintained by the caller.
+
+    In a partitioned folder (see PARTITION_DIR) no sales are loaded up
+    front: load_range() reads the partitions a date range needs, and each
+    partition file is tracked (and snapshotted) like the single CSV.
+    """
+
+    def __init__(self, data_dir=None, columns=SALES_COLUMNS, float_dtype=FLOAT_DTYPE, sales=True):
+        self.data_dir = None if data_dir is None else Path(data_dir)
+        # sales=False loads only the dimension tables (the sales rows are
+        # queried elsewhere, e.g. by sql_backend) and refresh() ignores the CSV
+        self.with_sales = sales
+        self.columns = columns
+        self.float_dtype = float_dtype
+        self.sales = None
+        self.signature = None
+        self.source = None
+        self.dimension_signatures = {}
+        self.version = 0
+        self.memory = {}
+        self.model = None
+        # Source columns left out of `sales`, read on first row-level use
+        self._details = None
+        self._header = None
+        self.lock = threading.RLock()
+        # Loaded partition file -> its source signature (partitioned folders only)
+        self.partitions = {}
+        for name in DIMENSION_FILES:
+            setattr(self, name, None)
+        if data_dir is not None:
+            for name in DIMENSION_FILES:
+                self.load_dimension(name)
+            if sales and not self.partitioned:
+                self.load_sales()
+
+    @classmethod
+    def from_frames(cls, sales, products=None, customers=None, regions=None):
+        """Wrap in-memory tables (e.g. sample data) that never change"""
+        dataset = cls()
+        dataset.products, dataset.customers, dataset.regions = products, customers, regions
+        dataset.sales = denormalize(sales, dataset.dimensions())
+        dataset.source = 'memory'
+        dataset.memory = {'parsed_bytes': frame_bytes(sales), 'bytes': frame_bytes(sales)}
+        return dataset
+
+    @property
+    def csv_path(self):
+        return self.data_dir / SALES_FILE
+
+    @property
+    def partitioned(self):
+        return self.data_dir is not None and (self.data_dir / PARTITION_DIR).is_dir()
+
+    def partition_bounds(self):
+        """(first day, last day) covered by the partitions on disk, or None without any"""
+        periods = list(list_partitions(self.data_dir / PARTITION_DIR).values())
+        if not periods:
+            return None
+        return periods[0][0], max(last for _, last in periods)
+
+    def frames(self):
+        return self.sales, self.products, self.customers, self.regions
+
+    def dimensions(self):
+        return {name: getattr(self, name) for name in DIMENSION_FILES}
+
+    def _detail_columns(self, frame):
+        """The detail columns of freshly parsed rows, indexed by TransactionID"""
+        columns = ['TransactionID'] + list(self._details.columns)
+        return compact_sales(frame.reindex(columns=columns), self.float_dtype).set_index('TransactionID')
+
+    def details(self):
+        """
+        The source columns `sales` leaves out, indexed by TransactionID;
+        read from the snapshots (or files) on first use and extended by
+        refresh()
+        """
+        with self.lock:
+            if self._details is None:
+                paths = list(self.partitions) if self.partitioned else [self.csv_path]
+                header = sales_file_columns(paths[0])
+                held = set(self.columns) | set(self.sales.columns)
+                columns = ['TransactionID'] + [c for c in header if c not in held]
+                parts = [load_sales_state(path, columns, self.float_dtype)[0] for path in paths]
+                self._details = concat_frames(parts).set_index('TransactionID')[columns[1:]]
+                self._header = header
+            return self._details
+
+    def full_rows(self, rows):
+        """
+        Rows of `sales` with the source columns it leaves out added back,
+        in the files' column order, for the detail table and exports. Rows
+        the details do not cover are left empty in those columns.
+        """
+        if self.columns is None or self.sales is None or self.data_dir is None:
+            return rows
+        details = self.details()
+        extra = [c for c in details.columns if c not in rows.columns]
+        if not extra:
+            return rows
+        added = details[extra].reindex(rows['TransactionID'].values)
+        added.index = rows.index
+        full = pd.concat([rows, added], axis=1)
+        order = [c for c in self._header if c in full.columns]
+        return full[order + [c for c in full.columns if c not in set(order)]]
+
+    def load_sales(self):
+        self._details = None
+        if self.partitioned:
+            # Reload the partitions loaded so far
+            paths, self.partitions, self.sales = list(self.partitions), {}, None
+            self._add_partitions([path for path in paths if path.exists()])
+            return
+        sales, self.signature, self.source = load_sales_state(self.csv_path, self.columns, self.float_dtype)
+        order = np.argsort(sales['OrderDate'].values, kind='stable')
+        self.sales = denormalize(sales.take(order).reset_index(drop=True), self.dimensions())
+        self.memory = {'parsed_bytes': self.signature.get('parsed_bytes', 0), 'bytes': frame_bytes(self.sales)}
+
+    def _add_partitions(self, paths):
+        """
+        Add the rows of new partition files, and of rows appended to loaded
+        ones, to the sales table; returns those rows.
+        """
+        parts = []
+        for path in paths:
+            loaded = self.partitions.get(path)
+            if loaded is None:
+                part, self.partitions[path], self.source = load_sales_state(path, self.columns, self.float_dtype)
+            else:
+                signature = source_signature(path)
+                part = select_columns(read_sales_tail(path, loaded['size'], signature['size']), self.columns)
+                signature['rows'] = loaded['rows'] + len(part)
+                signature['parsed_bytes'] = loaded.get('parsed_bytes', 0) + frame_bytes(part)
+                part = compact_sales(part, self.float_dtype)
+                self.partitions[path] = signature
+            parts.append(part)
+        if not parts:
+            return None
+        # Re-read with the new partitions on the next row-level use
+        self._details = None
+        rows = denormalize(merge_by_date(None, concat_frames(parts)), self.dimensions())
+        # Earlier months loaded later are merged in, not appended
+        self.sales = merge_by_date(self.sales, rows)
+        self.memory = {'parsed_bytes': sum(s.get('parsed_bytes', 0) for s in self.partitions.values()),
+                       'bytes': frame_bytes(self.sales)}
+        return rows
+
+    def load_range(self, start=None, end=None):
+        """
+        Load the partitions that overlap start..end (None: open-ended) and
+        are not loaded yet. Returns their rows, which extend the sales
+        table like appended rows (see refresh()), or None if nothing was
+        read. Does nothing for a folder with a single sales CSV.
+        """
+        with self.lock:
+            if not self.partitioned:
+                return None
+            # The version stays: rows of other dates leave every result
+            # computed for an already loaded range as it was
+            return self._add_partitions([
+                path for path, period in list_partitions(self.data_dir / PARTITION_DIR).items()
+                if path not in self.partitions and overlaps(period, start, end)
+            ])
+
+    def covers(self, start=None, end=None):
+        """Whether the rows of start..end are all loaded (always true without partitions)"""
+        if not self.partitioned:
+            return True
+        return all(path in self.partitions
+                   for path, period in list_partitions(self.data_dir / PARTITION_DIR).items()
+                   if overlaps(period, start, end))
+
+    def partition_changes(self):
+        """
+        Compare the loaded partitions with the files on disk. Returns
+        (status, paths) like source_status(): 'appended' lists new files
+        for months already loaded and loaded files that only grew.
+        """
+        on_disk = list_partitions(self.data_dir / PARTITION_DIR)
+        grown = []
+        for path, signature in self.partitions.items():
+            status = source_status(path, signature) if path in on_disk else 'changed'
+            if status == 'changed':
+                return 'changed', []
+            if status == 'appended':
+                grown.append(path)
+        loaded = {on_disk[path] for path in self.partitions}
+        new = [path for path, period in on_disk.items() if path not in self.partitions and period in loaded]
+        return ('appended' if grown or new else 'unchanged'), grown + new
+
+    def load_dimension(self, name):
+        """(Re)load one dimension table; returns True if it changed"""
+        path = self.data_dir / DIMENSION_FILES[name]
+        signature = file_signature(path) if path.exists() else None
+        if signature == self.dimension_signatures.get(name, False):
+            return False
+        setattr(self, name, pd.read_csv(path) if signature is not None else None)
+        self.dimension_signatures[name] = signature
+        return True
+
+    def refresh(self):
+        """
+        Pick up changes to the data files.
+
+        Returns (status, tail): status is 'unchanged', 'appended' (tail
+        holds the new sales rows, in date order but possibly dated before
+        rows already loaded; existing rows and their customer and product
+        attributes are unchanged), 'dimensions' (only dimension tables the
+        query structures do not depend on changed; tail is the list of
+        their files) or 'reloaded' (derived structures must be rebuilt).
+        """
+        with self.lock:
+            if self.data_dir is None:
+                return 'unchanged', None
+            changed = {name for name in DIMENSION_FILES if self.load_dimension(name)}
+            # Re-resolve the attributes of the rows already loaded; if any
+            # value changed, derived structures must be rebuilt
+            attributes_changed = False
+            if self.sales is not None and changed & set(DENORMALIZED_ATTRIBUTES):
+                updated = denormalize(self.sales, self.dimensions())
+                attributes_changed = not same_attributes(self.sales, updated)
+                if attributes_changed:
+                    self.sales = updated
+
+            if self.partitioned:
+                status, paths = self.partition_changes()
+            else:
+                status = source_status(self.csv_path, self.signature) if self.with_sales else 'unchanged'
+            tail = None
+            if status == 'appended' and self.partitioned:
+                tail = self._add_partitions(paths)
+            elif status == 'appended':
+                signature = source_signature(self.csv_path)
+                tail = read_sales_tail(self.csv_path, self.signature['size'], signature['size'])
+                if self._details is not None:
+                    self._details = pd.concat([self._details, self._detail_columns(tail)])
+                tail = select_columns(tail, self.columns)
+                signature['rows'] = self.signature['rows'] + len(tail)
+                signature['parsed_bytes'] = self.signature.get('parsed_bytes', 0) + frame_bytes(tail)
+                tail = denormalize(compact_sales(tail, self.float_dtype), self.dimensions())
+                # Back-dated rows are merged in so the table stays in date order
+                self.sales = merge_by_date(self.sales, tail)
+                self.signature = signature
+                self.memory = {'parsed_bytes': signature['parsed_bytes'], 'bytes': frame_bytes(self.sales)}
+            elif status == 'changed':
+                self.load_sales()
+
+            if status == 'unchanged' and not changed:
+                return 'unchanged', None
+            self.version += 1
+            # Without loaded rows, changed attribute tables cannot be checked
+            unchecked = self.sales is None and changed & set(DENORMALIZED_ATTRIBUTES)
+            if status == 'changed' or 'dates' in changed or attributes_changed or unchecked:
+                return 'reloaded', None
+            if tail is None:
+                return 'dimensions', [DIMENSION_FILES[name] for name in sorted(changed)]
+            return 'appended', tail
+
+
+# ============================================================================
+# EXPORT
+# ============================================================================
+# Label -> (file extension, MIME type)
+EXPORT_FORMATS = {
+    'CSV (gzip)': ('csv.gz', 'application/gzip'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'CSV': ('csv', 'text/csv'),
+}
+EXPORT_CHUNK_ROWS = 100_000
+
+
+def export_formats():
+    """Export formats usable in this environment"""
+    return [f for f in EXPORT_FORMATS if f != 'Parquet' or PARQUET_AVAILABLE]
+
+
+def selection_positions(n_rows, rows):
+    """Row positions for a selection given as None (all), a slice or positions"""
+    if rows is None:
+        return np.arange(n_rows)
+    if isinstance(rows, slice):
+        return np.arange(*rows.indices(n_rows))
+    return np.asarray(rows)
+
+
+def selection_chunks(frame, rows=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """The selected rows of `frame` as frames of at most chunk_rows (at least one, maybe empty)"""
+    positions = selection_positions(len(frame), rows)
+    for start in range(0, max(len(positions), 1), chunk_rows):
+        yield frame.take(positions[start:start + chunk_rows])
+
+
+def write_export(chunks, path, fmt, total=None, progress=None):
+    """
+    Write rows arriving as an iterable of frames to `path` one chunk at a time.
+
+    Memory use is bounded by the chunk size rather than the selection
+    size. `progress(done, total)` is called after every chunk. Sources
+    yield at least one (possibly empty) frame, so an empty export still
+    gets its columns.
+    """
+    done = 0
+    writer = None
+    empty = None
+    opener = gzip.open if fmt == 'CSV (gzip)' else open
+    out = None if fmt == 'Parquet' else opener(path, 'wt', newline='', encoding='utf-8')
+    try:
+        for chunk in chunks:
+            if len(chunk) == 0:
+                empty = chunk.head(0) if empty is None else empty
+                continue
+            if fmt == 'Parquet':
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table.cast(writer.schema))
+            else:
+                chunk.to_csv(out, index=False, header=(done == 0))
+            done += len(chunk)
+            if progress is not None:
+                progress(done, total)
+        if fmt == 'Parquet' and writer is None and empty is not None:
+            pq.write_table(pa.Table.from_pandas(empty, preserve_index=False), path)
+        elif done == 0 and empty is not None and out is not None:
+            empty.to_csv(out, index=False)
+    finally:
+        if writer is not None:
+            writer.close()
+        if out is not None:
+            out.close()
+    return done
+
+
+# ============================================================================
+# MEMORY REPORT
+# ============================================================================
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Compare the memory of the sales table as parsed and as the dashboard holds it.")
+    parser.add_argument('data_dir', nargs='?', default='sales_dashboard_data',
+                        help="folder containing sales_transactions.csv (default: sales_dashboard_data)")
+    parser.add_argument('--float-dtype', default=FLOAT_DTYPE,
+                        help=f"dtype for float columns (default: {FLOAT_DTYPE})")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    csv_path = Path(args.data_dir) / SALES_FILE
+    parsed = select_columns(read_sales_csv(csv_path), SALES_COLUMNS)
+    # Object columns as the dashboard used to hold them
+    parsed['MonthYear'] = parsed['MonthYear'].astype(str)
+    report = memory_report(parsed, compact_sales(parsed, args.float_dtype))
+    with pd.option_context('display.width', 120, 'display.max_rows', None):
+        print(report.to_string(formatters={
+            'bytes_before': '{:,}'.format, 'bytes_after': '{:,}'.format}))
+    before, after = report.loc['Total', 'bytes_before'], report.loc['Total', 'bytes_after']
+    print(f"\n{len(parsed):,} rows: {before / 1e6:,.1f} MB -> {after / 1e6:,.1f} MB "
+          f"({after / before:.0%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1885 @@
+"""
+In-memory query structures for the Sales Performance Dashboard.
+
+Everything here is built once per loaded dataset and then shared, read-only,
+across reruns and sessions. When rows are appended to the dataset, new
+versions are extended from the existing ones rather than rebuilt.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+import data_store
+from data_store import concat_frames
+
+# Dimensions that get per-value bitmaps in the filter index
+FILTER_DIMENSIONS = ['Region', 'Category', 'Tier', 'SalesChannel']
+
+
+# ============================================================================
+# FILTER INDEX
+# ============================================================================
+def dimension_column(frame, dim, customers=None):
+    """Values of a filter dimension for each row, or None if unavailable"""
+    # data_store.Dataset denormalizes Tier onto the rows; the lookup below
+    # only serves frames built without it
+    if dim in frame.columns:
+        return frame[dim]
+    if dim == 'Tier' and customers is not None and 'Tier' in customers.columns:
+        # Customers missing from customers.csv get NaN and match no tier
+        tier_map = customers.drop_duplicates('CustomerID').set_index('CustomerID')['Tier']
+        return frame['CustomerID'].map(tier_map)
+    return None
+
+
+def _extend_bitmap(bitmap, keep, bits):
+    """Packed bitmap of the first `keep` bits of `bitmap` followed by `bits`"""
+    whole = keep // 8
+    head = np.unpackbits(bitmap[whole:whole + 1])[:keep % 8]
+    return np.concatenate([bitmap[:whole], np.packbits(np.concatenate([head, bits.astype(np.uint8)]))])
+
+
+class FilterIndex:
+    """
+    Bitmap index over the sidebar filter dimensions.
+
+    The sales frame is sorted by OrderDate once, so a date range is a
+    contiguous slice found with two binary searches. Each dimension value
+    has a packed bitmap (one bit per row); a filter combination is the
+    bitwise AND of the OR of the selected values' bitmaps, evaluated only
+    over the bytes covering the date slice.
+    """
+
+    def __init__(self, sales, customers=None):
+        dates = sales['OrderDate'].values
+        if (dates[1:] >= dates[:-1]).all() and isinstance(sales.index, pd.RangeIndex):
+            # Already in date order (e.g. data_store.Dataset): share, don't copy
+            self.sales = sales
+        else:
+            order = np.argsort(dates, kind='stable')
+            self.sales = sales.iloc[order].reset_index(drop=True)
+        self.n_rows = len(self.sales)
+        self.dates = self.sales['OrderDate'].values
+
+        self.codes = {}
+        self.values = {}
+        self.bitmaps = {}
+        self.has_missing = {}
+        for dim in FILTER_DIMENSIONS:
+            column = dimension_column(self.sales, dim, customers)
+            if column is None:
+                continue
+            codes, uniques = pd.factorize(column)
+            self.codes[dim] = codes.astype(np.int16)
+            self.values[dim] = {value: code for code, value in enumerate(uniques)}
+            self.bitmaps[dim] = [np.packbits(codes == code) for code in range(len(uniques))]
+            self.has_missing[dim] = bool((codes < 0).any())
+
+    def append(self, rows, customers=None, combine=None):
+        """
+        Return a new index with `rows` added.
+
+        Only the part of the index from the first day in `rows` onwards is
+        re-sorted and re-encoded, so adding recent transactions costs time
+        in proportion to them rather than to the whole history. `combine`,
+        if given, is applied to that suffix before sorting (the cube uses
+        it to merge cells for the same day).
+        """
+        if len(rows) == 0:
+            return self
+        first_day = pd.Timestamp(rows['OrderDate'].min()).normalize()
+        keep = self.date_bounds(start=first_day)[0]
+        suffix = concat_frames([self.sales.iloc[keep:], rows.reindex(columns=self.sales.columns)])
+        if combine is not None:
+            suffix = combine(suffix)
+        suffix = suffix.iloc[np.argsort(suffix['OrderDate'].values, kind='stable')]
+
+        index = FilterIndex.__new__(FilterIndex)
+        index.sales = concat_frames([self.sales.iloc[:keep], suffix])
+        index.n_rows = len(index.sales)
+        index.dates = index.sales['OrderDate'].values
+        index.codes, index.values, index.bitmaps, index.has_missing = {}, {}, {}, {}
+        for dim, codes in self.codes.items():
+            local, uniques = pd.factorize(dimension_column(suffix, dim, customers))
+            values = dict(self.values[dim])
+            for value in uniques:
+                values.setdefault(value, len(values))
+            to_global = np.array([values[value] for value in uniques], dtype=np.int16)
+            suffix_codes = np.where(local >= 0, to_global[local] if len(uniques) else -1, -1).astype(np.int16)
+
+            index.codes[dim] = np.concatenate([codes[:keep], suffix_codes])
+            index.values[dim] = values
+            empty = np.zeros((keep + 7) // 8, dtype=np.uint8)
+            index.bitmaps[dim] = [
+                _extend_bitmap(self.bitmaps[dim][code] if code < len(self.bitmaps[dim]) else empty,
+                               keep, suffix_codes == code)
+                for code in range(len(values))
+            ]
+            index.has_missing[dim] = bool((index.codes[dim] < 0).any())
+        return index
+
+    def date_bounds(self, start=None, end=None):
+        """Return the [lo, hi) row slice for an inclusive date range"""
+        lo = 0 if start is None else int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(start)), side='left'))
+        hi = self.n_rows if end is None else int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(end)), side='right'))
+        return lo, max(lo, hi)
+
+    def _dimension_mask(self, dim, selected, byte_lo, byte_hi):
+        """Packed mask for one dimension, or None if it excludes nothing"""
+        if selected is None or dim not in self.bitmaps:
+            return None
+        lookup = self.values[dim]
+        codes = {lookup[v] for v in selected if v in lookup}
+        if len(codes) == len(lookup) and not self.has_missing[dim]:
+            return None
+        mask = np.zeros(byte_hi - byte_lo, dtype=np.uint8)
+        for code in codes:
+            mask |= self.bitmaps[dim][code][byte_lo:byte_hi]
+        return mask
+
+    def select(self, start=None, end=None, regions=None, categories=None, tiers=None, channels=None):
+        """
+        Resolve a filter combination to row positions in self.sales.
+
+        None means "no filter" for a dimension. Returns a slice when no
+        dimension filter applies, otherwise an array of row positions.
+        """
+        lo, hi = self.date_bounds(start, end)
+        byte_lo, byte_hi = lo // 8, (hi + 7) // 8
+
+        combined = None
+        for dim, selected in (('Region', regions), ('Category', categories),
+                              ('Tier', tiers), ('SalesChannel', channels)):
+            mask = self._dimension_mask(dim, selected, byte_lo, byte_hi)
+            if mask is None:
+                continue
+            combined = mask if combined is None else combined & mask
+
+        if combined is None:
+            return slice(lo, hi)
+        bits = np.unpackbits(combined)[lo - byte_lo * 8:hi - byte_lo * 8]
+        return np.flatnonzero(bits) + lo
+
+    def signature(self, start=None, end=None, regions=None, categories=None, tiers=None, channels=None):
+        """
+        Canonical, hashable form of a filter combination.
+
+        Selections are sorted and de-duplicated, unknown values dropped, and
+        a selection that excludes nothing becomes None, so equivalent
+        sidebar states share one key.
+        """
+        key = [None if start is None else pd.Timestamp(start).isoformat(),
+               None if end is None else pd.Timestamp(end).isoformat()]
+        for dim, selected in (('Region', regions), ('Category', categories),
+                              ('Tier', tiers), ('SalesChannel', channels)):
+            if selected is None or dim not in self.values:
+                key.append(None)
+                continue
+            known = tuple(sorted({v for v in selected if v in self.values[dim]}))
+            covers_all = len(known) == len(self.values[dim]) and not self.has_missing[dim]
+            key.append(None if covers_all else known)
+        return tuple(key)
+
+    def take(self, rows):
+        """Return the sales rows for a selection from select()"""
+        if isinstance(rows, slice):
+            if rows.start == 0 and rows.stop == self.n_rows:
+                return self.sales
+            return self.sales.iloc[rows]
+        return self.sales.take(rows)
+
+    def latest(self, rows, n):
+        """Positions of the n most recent rows of a selection, newest first"""
+        if isinstance(rows, slice):
+            return np.arange(rows.stop - 1, max(rows.start, rows.stop - n) - 1, -1)
+        return rows[::-1][:n]
+
+    def filter(self, start=None, end=None, regions=None, categories=None, tiers=None, channels=None):
+        """Return the matching rows of the sales frame"""
+        return self.take(self.select(start, end, regions, categories, tiers, channels))
+
+
+def filter_mask(frame, start=None, end=None, regions=None, categories=None, tiers=None, channels=None):
+    """
+    Boolean mask of the rows of `frame` matching a filter, by scanning it.
+    Same semantics as FilterIndex.select, for frames that are read once
+    (e.g. CSV chunks) and not worth indexing.
+    """
+    mask = np.ones(len(frame), dtype=bool)
+    dates = frame['OrderDate'].values
+    if start is not None:
+        mask &= dates >= np.datetime64(pd.Timestamp(start))
+    if end is not None:
+        mask &= dates <= np.datetime64(pd.Timestamp(end))
+    for dim, selected in (('Region', regions), ('Category', categories),
+                          ('Tier', tiers), ('SalesChannel', channels)):
+        column = None if selected is None else dimension_column(frame, dim)
+        if column is not None:
+            mask &= column.isin(list(selected)).values
+    return mask
+
+
+# ============================================================================
+# DAILY CUBE
+# ============================================================================
+CUBE_DIMENSIONS = ['OrderDate', 'Region', 'Country', 'Category', 'ProductName',
+                   'SalesChannel', 'Tier', 'Segment']
+CUBE_MEASURES = ['TotalSales', 'Profit', 'Quantity']
+
+
+def customer_attributes(sales, customers, columns=('Tier', 'Segment')):
+    """
+    Look up customer attributes missing from the sales rows (NaN when the
+    customer is unknown). Columns the rows already carry are not joined.
+    """
+    attributes = {}
+    columns = [c for c in columns if c not in sales.columns]
+    if customers is None or not columns:
+        return attributes
+    lookup = customers.drop_duplicates('CustomerID').set_index('CustomerID')
+    for column in columns:
+        if column in lookup.columns:
+            attributes[column] = sales['CustomerID'].map(lookup[column])
+    return attributes
+
+
+def build_cube(sales, customers=None):
+    """
+    Roll transactions up to one row per day x dimension cell.
+
+    Each cell holds the additive measures (sums of TotalSales, Profit and
+    Quantity plus OrderCount), so any filter combination and any coarser
+    grouping can be answered by summing cells. Tier and Segment come from
+    the rows when denormalized, otherwise from `customers` (NaN when the
+    customer is missing).
+    """
+    frame = sales[[c for c in CUBE_DIMENSIONS + CUBE_MEASURES if c in sales.columns]].copy()
+    frame['OrderDate'] = frame['OrderDate'].dt.normalize()
+    # Rows are stored compactly (data_store.FLOAT_DTYPE, downcast integers);
+    # the sums every chart total is built from accumulate at full width
+    for column in CUBE_MEASURES:
+        if column in frame.columns:
+            wide = 'float64' if pd.api.types.is_float_dtype(frame[column]) else 'int64'
+            frame[column] = frame[column].astype(wide)
+    for column, values in customer_attributes(sales, customers).items():
+        frame[column] = values.values
+
+    dimensions = [c for c in CUBE_DIMENSIONS if c in frame.columns]
+    aggregations = {m: (m, 'sum') for m in CUBE_MEASURES if m in frame.columns}
+    aggregations['OrderCount'] = ('OrderDate', 'size')
+    return frame.groupby(dimensions, dropna=False, sort=False, observed=True).agg(**aggregations).reset_index()
+
+
+def merge_cube_cells(cube):
+    """Sum cube rows that share a cell, e.g. after appending new cells"""
+    dimensions = [c for c in CUBE_DIMENSIONS if c in cube.columns]
+    return cube.groupby(dimensions, dropna=False, sort=False, observed=True).sum().reset_index()
+
+
+# ============================================================================
+# SEARCH INDEX
+# ============================================================================
+SEARCH_COLUMNS = ['TransactionID', 'CustomerID', 'ProductID', 'ProductName', 'Category',
+                  'SubCategory', 'Region', 'Country', 'City', 'CustomerSegment', 'SalesChannel']
+
+
+def _trigram_keys(chars, start):
+    """Pack three consecutive code points (21 bits each) into one uint64 key"""
+    return ((chars[:, start].astype(np.uint64) << np.uint64(42))
+            | (chars[:, start + 1].astype(np.uint64) << np.uint64(21))
+            | chars[:, start + 2].astype(np.uint64))
+
+
+class SearchIndex:
+    """
+    Case-insensitive search over the string dimensions of the sales frame.
+
+    The distinct values of every searched column form a vocabulary. A
+    trigram index over the vocabulary narrows a query to candidate values,
+    which are verified with a substring (or prefix) test; each matching
+    value then maps to its rows through a posting list. Numeric columns
+    are never converted to strings.
+    """
+
+    def __init__(self, sales, columns=SEARCH_COLUMNS):
+        self.n_rows = len(sales)
+        vocabulary, postings, counts = [], [], []
+        for column in columns:
+            if column not in sales.columns:
+                continue
+            codes, uniques = pd.factorize(sales[column])
+            if len(uniques) == 0 or not isinstance(uniques[0], str):
+                continue
+            valid = codes >= 0
+            postings.append(np.flatnonzero(valid)[np.argsort(codes[valid], kind='stable')])
+            counts.append(np.bincount(codes[valid], minlength=len(uniques)))
+            vocabulary.append(np.asarray(uniques, dtype=str))
+
+        self.text = np.char.lower(np.concatenate(vocabulary)) if vocabulary else np.array([], dtype=str)
+        self.rows = np.concatenate(postings).astype(np.int64) if postings else np.array([], dtype=np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum(np.concatenate(counts))]) if counts else np.array([0])
+        self._build_trigrams()
+
+    def _build_trigrams(self):
+        width = self.text.dtype.itemsize // 4
+        lengths = np.char.str_len(self.text)
+        chars = self.text.view(np.uint32).reshape(len(self.text), width) if width else None
+        keys, entries = [], []
+        for start in range(max(width - 2, 0)):
+            valid = np.flatnonzero(lengths >= start + 3)
+            keys.append(_trigram_keys(chars[valid], start))
+            entries.append(valid)
+        keys = np.concatenate(keys) if keys else np.array([], dtype=np.uint64)
+        entries = np.concatenate(entries) if entries else np.array([], dtype=np.int64)
+
+        order = np.lexsort((entries, keys))
+        keys, entries = keys[order], entries[order]
+        distinct = np.ones(len(keys), dtype=bool)
+        distinct[1:] = (keys[1:] != keys[:-1]) | (entries[1:] != entries[:-1])
+        keys, entries = keys[distinct], entries[distinct]
+
+        self.gram_keys, gram_starts = np.unique(keys, return_index=True)
+        self.gram_offsets = np.append(gram_starts, len(keys))
+        self.gram_entries = entries
+
+    def _candidates(self, query):
+        """Vocabulary entries containing every trigram of the query"""
+        if len(query) < 3:
+            return np.arange(len(self.text))
+        chars = np.array([query], dtype=str).view(np.uint32).reshape(1, -1)
+        candidates = None
+        for start in range(len(query) - 2):
+            key = _trigram_keys(chars, start)[0]
+            pos = np.searchsorted(self.gram_keys, key)
+            if pos == len(self.gram_keys) or self.gram_keys[pos] != key:
+                return np.array([], dtype=np.int64)
+            entries = self.gram_entries[self.gram_offsets[pos]:self.gram_offsets[pos + 1]]
+            candidates = entries if candidates is None else np.intersect1d(candidates, entries, assume_unique=True)
+            if len(candidates) == 0:
+                break
+        return candidates
+
+    def _entry_rows(self, entries):
+        """Sorted, de-duplicated rows of the given vocabulary entries"""
+        starts = self.offsets[entries]
+        lengths = self.offsets[entries + 1] - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.array([], dtype=np.int64)
+        # Gather all posting lists at once: position i of the output reads
+        # self.rows[start of its entry + offset within that entry]
+        shift = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[self.rows[shift + np.arange(total)]] = True
+        return np.flatnonzero(mask)
+
+    def search(self, query, within=None, prefix=False):
+        """
+        Return sorted row positions whose searched columns contain `query`
+        (or start with it when prefix=True), restricted to `within` (a slice
+        or array of row positions, e.g. from FilterIndex.select).
+        """
+        query = query.strip().lower()
+        if not query:
+            rows = np.arange(self.n_rows)
+        else:
+            candidates = self._candidates(query)
+            text = self.text[candidates]
+            hits = np.char.startswith(text, query) if prefix else np.char.find(text, query) >= 0
+            rows = self._entry_rows(candidates[hits])
+
+        if within is None:
+            return rows
+        if isinstance(within, slice):
+            return rows[(rows >= within.start) & (rows < within.stop)]
+        return np.intersect1d(rows, within, assume_unique=True)
+
+
+def search_mask(frame, query, columns=SEARCH_COLUMNS):
+    """Boolean mask of the rows of `frame` that SearchIndex.search would return"""
+    query = query.strip().lower()
+    if not query:
+        return np.ones(len(frame), dtype=bool)
+    mask = np.zeros(len(frame), dtype=bool)
+    for column in columns:
+        if column not in frame.columns:
+            continue
+        codes, uniques = pd.factorize(frame[column])
+        if len(uniques) == 0 or not isinstance(uniques[0], str):
+            continue
+        # Test each distinct value once, then map the hits to the rows
+        hits = np.append(np.char.find(np.char.lower(np.asarray(uniques, dtype=str)), query) >= 0, False)
+        mask |= hits[codes]
+    return mask
+
+
+# ============================================================================
+# AGGREGATE CACHE
+# ============================================================================
+def estimate_bytes(value):
+    """Approximate memory held by a cached aggregate"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return 64 + sum(estimate_bytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return 64 + sum(estimate_bytes(v) for v in value)
+    return 64
+
+
+class AggregateCache:
+    """
+    Size-bounded LRU cache of computed aggregates, shared across sessions.
+
+    Keys are (filter signature, aggregate name). Cached values are shared
+    objects and must not be mutated by callers.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def __contains__(self, key):
+        # A lookup that counts as neither hit nor miss
+        with self.lock:
+            return key in self.entries
+
+    def get_or_compute(self, key, compute):
+        return self.fetch(key, compute)[0]
+
+    def fetch(self, key, compute):
+        """Return (value, hit) where hit tells whether the value was cached"""
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0], True
+            self.misses += 1
+
+        # Computed outside the lock; concurrent misses may compute twice
+        value = compute()
+        self.put(key, value)
+        return value, False
+
+    def put(self, key, value):
+        size = estimate_bytes(value)
+        with self.lock:
+            if key in self.entries:
+                self.bytes -= self.entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self.entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self.entries), 'bytes': self.bytes}
+
+
+# ============================================================================
+# DAILY PREFIX SUMS
+# ============================================================================
+SERIES_DIMENSIONS = ['Region', 'Category', 'Tier', 'SalesChannel']
+SERIES_MEASURES = ['TotalSales', 'Profit', 'OrderCount']
+
+
+def previous_period(start, end):
+    """The equally long (first day, last day) period that ends the day before `start`"""
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    length = end - start + pd.Timedelta(days=1)
+    return start - length, start - pd.Timedelta(days=1)
+
+
+def date_span(start, end):
+    """
+    The dates the aggregates of a start..end filter read: the range and,
+    for KPI growth, its previous period. None stays open-ended.
+    """
+    if start is None or end is None:
+        return start, end
+    return previous_period(start, end)[0], end
+
+
+def combo_mask(combos, regions=None, categories=None, tiers=None, channels=None):
+    """Which rows of a table of dimension combinations match a filter"""
+    mask = np.ones(len(combos), dtype=bool)
+    for dim, selected in (('Region', regions), ('Category', categories),
+                          ('Tier', tiers), ('SalesChannel', channels)):
+        if selected is not None and dim in combos.columns:
+            mask &= combos[dim].isin(list(selected)).values
+    return mask
+
+
+class DailySeries:
+    """
+    Cumulative daily totals per filter-dimension combination.
+
+    Built from the daily cube over a dense calendar: cumulative[m][d, c] is
+    the sum of measure m over days before d for combination c. A range
+    total for any filter is then two row lookups and a masked sum over
+    the combinations, whatever the number of transactions. Dates outside
+    the calendar contribute nothing.
+    """
+
+    def __init__(self, cube, calendar=None):
+        days = cube['OrderDate'].dt.normalize()
+        first, last = days.min(), days.max()
+        if calendar is not None and len(calendar):
+            first, last = min(first, calendar.min()), max(last, calendar.max())
+        self.first_day = pd.Timestamp(first).normalize()
+        self.n_days = (pd.Timestamp(last).normalize() - self.first_day).days + 1
+
+        dims = [d for d in SERIES_DIMENSIONS if d in cube.columns]
+        groups = cube.groupby(dims, dropna=False, sort=False, observed=True)
+        combo_idx = groups.ngroup().values
+        self.combos = cube[dims].drop_duplicates().reset_index(drop=True)
+        day_idx = (days - self.first_day).dt.days.values
+
+        self.cumulative = {}
+        for measure in SERIES_MEASURES:
+            if measure not in cube.columns:
+                continue
+            daily = np.zeros((self.n_days + 1, len(self.combos)))
+            np.add.at(daily, (day_idx + 1, combo_idx), cube[measure].values)
+            self.cumulative[measure] = np.cumsum(daily, axis=0)
+
+    def append(self, cube):
+        """
+        Return a new series with the cells of another cube added.
+
+        The calendar and the set of combinations grow as needed; the cost
+        depends on the new cells and the size of the series, not on the
+        number of transactions behind it.
+        """
+        if len(cube) == 0:
+            return self
+        days = cube['OrderDate'].dt.normalize()
+        last = max(self.first_day + pd.Timedelta(days=self.n_days - 1), days.max())
+        series = DailySeries.__new__(DailySeries)
+        series.first_day = min(self.first_day, pd.Timestamp(days.min()).normalize())
+        series.n_days = (pd.Timestamp(last).normalize() - series.first_day).days + 1
+
+        # Existing combinations keep their column; new ones are numbered after them
+        dims = list(self.combos.columns)
+        both = pd.concat([self.combos, cube[dims]], ignore_index=True)
+        combo_idx = both.groupby(dims, dropna=False, sort=False, observed=True).ngroup().values[len(self.combos):]
+        series.combos = both.drop_duplicates().reset_index(drop=True)
+        day_idx = (days - series.first_day).dt.days.values
+
+        front = (self.first_day - series.first_day).days
+        back = front + self.n_days + 1
+        series.cumulative = {}
+        for measure, cumulative in self.cumulative.items():
+            grown = np.zeros((series.n_days + 1, len(series.combos)))
+            grown[front:back, :cumulative.shape[1]] = cumulative
+            grown[back:, :cumulative.shape[1]] = cumulative[-1]
+            if measure in cube.columns:
+                daily = np.zeros_like(grown)
+                np.add.at(daily, (day_idx + 1, combo_idx), cube[measure].values)
+                grown += np.cumsum(daily, axis=0)
+            series.cumulative[measure] = grown
+        return series
+
+    def combo_mask(self, regions=None, categories=None, tiers=None, channels=None):
+        return combo_mask(self.combos, regions, categories, tiers, channels)
+
+    def _day_position(self, date, default):
+        if date is None:
+            return default
+        offset = (pd.Timestamp(date).normalize() - self.first_day).days
+        return min(max(offset, 0), self.n_days)
+
+    def totals(self, start=None, end=None, regions=None, categories=None, tiers=None, channels=None):
+        """Sum of every measure over an inclusive date range and filter"""
+        lo = self._day_position(start, 0)
+        hi = self._day_position(None if end is None else pd.Timestamp(end) + pd.Timedelta(days=1), self.n_days)
+        hi = max(lo, hi)
+        mask = self.combo_mask(regions, categories, tiers, channels)
+        return {m: float((cum[hi] - cum[lo])[mask].sum()) for m, cum in self.cumulative.items()}
+
+    def growth(self, start, end, measure='TotalSales', **filters):
+        """
+        Percent change of a measure against the equally long period that
+        ends the day before `start`. Returns (current, previous, growth).
+        """
+        current = self.totals(start, end, **filters)[measure]
+        previous = self.totals(*previous_period(start, end), **filters)[measure]
+        growth = ((current - previous) / previous * 100) if previous > 0 else 0
+        return current, previous, growth
+
+
+# ============================================================================
+# DISTINCT CUSTOMER SKETCHES
+# ============================================================================
+# Cells of the customer sketch: the filter dimensions plus Segment
+SKETCH_DIMENSIONS = SERIES_DIMENSIONS + ['Segment']
+# 2^12 registers per union: about 1.6% standard error
+HLL_PRECISION = 12
+# Smaller tables count distinct customers exactly by default. On one core
+# (benchmark.py customers_exact / customers_sketch, every row selected) the
+# exact count takes 34 ms at 150k rows and 390 ms at 1M, the sketch 3 ms
+# and 16 ms: below 1M rows exactness costs less than a chart render
+APPROXIMATE_MIN_ROWS = 1_000_000
+
+
+def approximate_by_default(model, min_rows=APPROXIMATE_MIN_ROWS):
+    """Whether a model's queries estimate distinct customers unless told otherwise"""
+    return model.filter_index is None or model.filter_index.n_rows >= min_rows
+
+
+def hll_precision(error):
+    """Smallest precision whose standard error (1.04 / sqrt(2^p)) is at most `error`"""
+    return int(min(max(np.ceil(np.log2((1.04 / error) ** 2)), 4), 16))
+
+
+def hll_hashes(values):
+    """64-bit hashes of a column (each distinct value hashed once); missing values are dropped"""
+    codes, uniques = pd.factorize(values)
+    hashes = pd.util.hash_array(np.asarray(uniques, dtype=object))
+    return hashes[codes[codes >= 0]], codes >= 0
+
+
+def _bit_length(values):
+    """Bit length of each uint64, exact (0 for 0)"""
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(high > 0, 32 + np.frexp(high)[1], np.frexp(low)[1])
+
+
+def hll_registers(hashes, precision=HLL_PRECISION):
+    """
+    HyperLogLog (register, rank) of each hash: the top `precision` bits
+    pick the register, the rank is the position of the first 1 bit in
+    the remaining bits.
+    """
+    width = 64 - precision
+    registers = (hashes >> np.uint64(width)).astype(np.uint32)
+    rest = hashes & np.uint64((1 << width) - 1)
+    ranks = width - _bit_length(rest) + 1
+    return registers, ranks.astype(np.uint8)
+
+
+def hll_estimate(registers):
+    """Distinct-count estimate from a dense array of register ranks"""
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.ldexp(1.0, -registers.astype(np.int64)).sum()
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros:
+        # Small-range correction (linear counting)
+        estimate = m * np.log(m / zeros)
+    return int(round(estimate))
+
+
+class CustomerSketch:
+    """
+    HyperLogLog sketches of the distinct customers of every day x cell,
+    rolled up by month.
+
+    Each level is stored sparsely as one entry per (period, cell,
+    register) that some customer reached, holding the register's maximum
+    rank, sorted by period; a level has at most periods x cells x 2^p
+    entries however many rows it covers. The distinct customers of a date
+    range and filter are estimated from the union (element-wise maximum)
+    of the month entries of the whole months in the range and the day
+    entries of the days around them, so the rows themselves are not
+    needed. Cells are the SKETCH_DIMENSIONS combinations; `combos`
+    numbers them.
+    """
+
+    def __init__(self, sales=None, precision=HLL_PRECISION):
+        self.precision = precision
+        self.combos = pd.DataFrame(columns=SKETCH_DIMENSIONS)
+        self.daily = self._empty_level()
+        self.monthly = self._empty_level()
+        self._pending = []
+        if sales is not None:
+            self._add(sales)
+            self._flush()
+
+    @staticmethod
+    def _empty_level():
+        """(periods, cells, registers, ranks) of a level without entries"""
+        return (np.array([], dtype=np.int64), np.array([], dtype=np.int64),
+                np.array([], dtype=np.uint32), np.array([], dtype=np.uint8))
+
+    def _cell_ids(self, rows):
+        """Cell number of each row; new combinations are numbered after the known ones"""
+        dims = [d for d in SKETCH_DIMENSIONS if d in rows.columns]
+        # Groups are numbered in order of first appearance, the order
+        # drop_duplicates() keeps, so known combinations keep their numbers
+        local = rows.groupby(dims, dropna=False, sort=False, observed=True).ngroup().values
+        known = self.combos.reindex(columns=dims).astype(object)
+        both = pd.concat([known, rows[dims].drop_duplicates().astype(object)], ignore_index=True)
+        ids = both.groupby(dims, dropna=False, sort=False).ngroup().values[len(known):]
+        self.combos = both.drop_duplicates().reset_index(drop=True)
+        return ids[local]
+
+    def _add(self, rows):
+        """Queue the entries of `rows`; _flush() merges them in"""
+        hashes, valid = hll_hashes(rows['CustomerID'])
+        rows = rows[valid] if not valid.all() else rows
+        registers, ranks = hll_registers(hashes, self.precision)
+        days = rows['OrderDate'].values.astype('datetime64[D]').astype(np.int64)
+        self._pending.append(self._merge((days, self._cell_ids(rows), registers, ranks)))
+        # Merge once the queue outgrows the merged entries, so folding in
+        # many chunks costs time in proportion to the total
+        if sum(len(part[0]) for part in self._pending) > max(len(self.daily[0]), 1_000_000):
+            self._flush()
+
+    def _merge(self, *levels):
+        """One entry per (period, cell, register) of `levels`, ordered by period, with the maximum rank"""
+        periods, cells, registers, ranks = (np.concatenate(columns) for columns in zip(*levels))
+        first = periods.min() if len(periods) else 0
+        key = ((((periods - first) * max(len(self.combos), 1) + cells) << self.precision)
+               | registers.astype(np.int64))
+        order = np.lexsort((ranks, key))
+        key = key[order]
+        keep = order[np.flatnonzero(np.append(key[1:] != key[:-1], True))]
+        return periods[keep], cells[keep], registers[keep], ranks[keep]
+
+    def _flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._merge(*self._pending), []
+        self.daily = self._merge(self.daily, pending)
+        months = pending[0].astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+        self.monthly = self._merge(self.monthly, (months,) + pending[1:])
+
+    def copy(self):
+        # Entry arrays are replaced, never written to, so they can be shared
+        sketch = CustomerSketch.__new__(CustomerSketch)
+        sketch.__dict__.update(self.__dict__)
+        sketch._pending = []
+        return sketch
+
+    def append(self, rows):
+        """Return a sketch that also covers `rows`"""
+        sketch = self.copy()
+        sketch._add(rows)
+        sketch._flush()
+        return sketch
+
+    @property
+    def nbytes(self):
+        return int(sum(column.nbytes for column in self.daily + self.monthly))
+
+    @property
+    def error(self):
+        """Relative standard error of the estimates"""
+        return 1.04 / np.sqrt(1 << self.precision)
+
+    def _spans(self, start, end):
+        """
+        (level, first period, last period) spans covering start..end: the
+        whole months in the range from the monthly level, the days
+        before and after them from the daily level
+        """
+        first = None if start is None else np.datetime64(pd.Timestamp(start), 'D')
+        last = None if end is None else np.datetime64(pd.Timestamp(end), 'D')
+        # Whole months: from the month `first` starts or the one after,
+        # to the month `last` ends or the one before
+        month_lo = month_hi = None
+        if first is not None:
+            month_lo = first.astype('datetime64[M]')
+            month_lo += int(first > month_lo.astype('datetime64[D]'))
+        if last is not None:
+            month_hi = (last + 1).astype('datetime64[M]') - 1
+        if month_lo is not None and month_hi is not None and month_lo > month_hi:
+            return [(self.daily, first, last)]
+        spans = [(self.monthly, month_lo, month_hi)]
+        if first is not None:
+            spans.append((self.daily, first, month_lo.astype('datetime64[D]') - 1))
+        if last is not None:
+            spans.append((self.daily, (month_hi + 1).astype('datetime64[D]'), last))
+        return spans
+
+    def _entries(self, start=None, end=None, regions=None, categories=None, tiers=None, channels=None):
+        """(cells, registers, ranks) of the entries for a date range and filter"""
+        selected = combo_mask(self.combos, regions, categories, tiers, channels)
+        parts = [self._empty_level()[1:]]
+        for (periods, cells, registers, ranks), lo, hi in self._spans(start, end):
+            lo = 0 if lo is None else np.searchsorted(periods, lo.astype(np.int64))
+            hi = len(periods) if hi is None else np.searchsorted(periods, hi.astype(np.int64), side='right')
+            if hi <= lo or not len(selected):
+                continue
+            positions = lo + np.flatnonzero(selected[cells[lo:hi]])
+            parts.append((cells[positions], registers[positions], ranks[positions]))
+        return (np.concatenate(columns) for columns in zip(*parts))
+
+    def count(self, start=None, end=None, regions=None, categories=None, tiers=None, channels=None):
+        """Estimated distinct customers for a date range and filter"""
+        _, registers, ranks = self._entries(start, end, regions, categories, tiers, channels)
+        union = np.zeros(1 << self.precision, dtype=np.uint8)
+        np.maximum.at(union, registers, ranks)
+        return hll_estimate(union)
+
+    def count_by(self, dimension, start=None, end=None, regions=None, categories=None, tiers=None,
+                 channels=None):
+        """Estimated distinct customers per value of a sketch dimension, as [dimension, Count]"""
+        cells, registers, ranks = self._entries(start, end, regions, categories, tiers, channels)
+        codes, values = pd.factorize(self.combos[dimension])
+        groups = codes[cells]
+        registers, ranks, groups = registers[groups >= 0], ranks[groups >= 0], groups[groups >= 0]
+        m = 1 << self.precision
+        unions = np.zeros(len(values) * m, dtype=np.uint8)
+        np.maximum.at(unions, groups * m + registers, ranks)
+        present = np.unique(groups)
+        counts = [hll_estimate(unions[g * m:(g + 1) * m]) for g in present]
+        result = pd.DataFrame({dimension: np.asarray(values, dtype=object)[present], 'Count': counts})
+        return result.sort_values(dimension).reset_index(drop=True)
+
+
+# ============================================================================
+# STRATIFIED SAMPLE
+# ============================================================================
+SAMPLE_ROWS = 100_000
+SAMPLE_MIN_STRATUM_ROWS = 30
+SAMPLE_COLUMNS = CUBE_DIMENSIONS + ['CustomerID'] + CUBE_MEASURES
+# Normal quantile of the two-sided 95% confidence intervals
+CONFIDENCE_Z = 1.96
+
+
+class StratifiedSample:
+    """
+    A weighted row sample for previewing aggregates with confidence intervals.
+
+    Rows are drawn without replacement within each Region x Category x
+    order month stratum: about `rows` in all, in proportion to the strata
+    sizes but at least `min_rows` from every stratum (all of a smaller
+    one), so small segments survive. Appended rows are sampled into strata
+    of their own, which leaves the existing weights valid.
+    """
+
+    def __init__(self, sales=None, customers=None, rows=SAMPLE_ROWS, min_rows=SAMPLE_MIN_STRATUM_ROWS, seed=0):
+        self.rows = rows
+        self.min_rows = min_rows
+        self.rng = np.random.default_rng(seed)
+        self.sales = None  # sampled rows with their Stratum and Weight
+        self.population = np.array([], dtype=np.int64)  # rows per stratum
+        self.sampled = np.array([], dtype=np.int64)  # sampled rows per stratum
+        self.population_rows = 0
+        if sales is not None:
+            self._add(sales, customers)
+
+    def _add(self, sales, customers=None):
+        month = sales['OrderDate'].values.astype('datetime64[M]')
+        strata = sales.groupby([sales['Region'], sales['Category'], month],
+                               dropna=False, sort=False, observed=True).ngroup().values
+        population = np.bincount(strata)
+        self.population_rows += len(sales)
+        fraction = min(1.0, self.rows / self.population_rows)
+        sampled = np.minimum(population, np.maximum(np.round(population * fraction).astype(np.int64), self.min_rows))
+
+        # A random order grouped by stratum: each stratum's first rows are its sample
+        order = self.rng.permutation(len(sales))
+        order = order[np.argsort(strata[order], kind='stable')]
+        starts = np.cumsum(population) - population
+        rank = np.arange(len(order)) - starts[strata[order]]
+        keep = np.sort(order[rank < sampled[strata[order]]])
+
+        rows = sales.iloc[keep][[c for c in SAMPLE_COLUMNS if c in sales.columns]]
+        rows = rows.assign(**customer_attributes(rows, customers)).reset_index(drop=True)
+        if 'CustomerID' in rows.columns:
+            # Grouped on by distinct(); categories group far faster than strings
+            rows['CustomerID'] = rows['CustomerID'].astype('category')
+        rows['Stratum'] = strata[keep] + len(self.population)
+        rows['Weight'] = (population / sampled)[strata[keep]]
+        self.sales = concat_frames([self.sales, rows])
+        self.population = np.concatenate([self.population, population])
+        self.sampled = np.concatenate([self.sampled, sampled])
+
+    def append(self, rows, customers=None):
+        """Return a sample that also covers `rows`"""
+        sample = StratifiedSample.__new__(StratifiedSample)
+        sample.__dict__.update(self.__dict__)
+        sample._add(rows, customers)
+        return sample
+
+    def cells(self, spec):
+        """The sampled rows matching a filter spec, weighted up to stand in for cube cells"""
+        rows = self.sales[filter_mask(self.sales, **spec)]
+        weighted = {m: rows[m] * rows['Weight'] for m in CUBE_MEASURES if m in rows.columns}
+        return rows.assign(OrderCount=rows['Weight'], **weighted)
+
+    def estimate(self, spec, by=None, measures=('TotalSales',), top=None):
+        """
+        Estimated totals of `measures` over the rows matching a filter spec,
+        per value of `by` (the `top` largest by the first measure) or as one
+        row, each with a '<measure>_ci' column: the half-width of its 95%
+        confidence interval.
+        """
+        measures = list(measures)
+        rows = self.sales[filter_mask(self.sales, **spec)]
+        values = rows[measures].astype(np.float64)
+        keys = ([rows[by]] if by is not None else []) + [rows['Stratum']]
+        sums = values.groupby(keys, observed=True).sum()
+        squares = (values ** 2).groupby(keys, observed=True).sum()
+
+        # Stratified estimator of a domain total: rows outside the filter
+        # count as zeros of their stratum
+        stratum = sums.index.get_level_values('Stratum')
+        population, sampled = self.population[stratum], self.sampled[stratum]
+        spread = squares.sub((sums ** 2).div(sampled, axis=0)).div(np.maximum(sampled - 1, 1), axis=0)
+        variance = spread.mul(population ** 2 * (1 - sampled / population) / sampled, axis=0)
+        totals = sums.mul(population / sampled, axis=0)
+        if by is not None:
+            totals = totals.groupby(level=0, observed=True).sum()
+            variance = variance.groupby(level=0, observed=True).sum()
+        else:
+            totals, variance = totals.sum().to_frame().T, variance.sum().to_frame().T
+        for measure in measures:
+            totals[f'{measure}_ci'] = CONFIDENCE_Z * np.sqrt(variance[measure].clip(lower=0))
+        if top is not None:
+            totals = totals.nlargest(top, measures[0])
+        return totals.reset_index(drop=by is None)
+
+    def distinct(self, spec, column='CustomerID', by=None):
+        """
+        Estimated distinct values of `column` among the rows matching a
+        filter spec, per value of `by` or as one row: [by, Count, Low, High].
+
+        Uses the guaranteed-error estimator: a value sampled once stands
+        for the square root of its row's weight (between one value, if it
+        repeats in the population, and `weight` values, if none do); a
+        value sampled more than once counts once. Low is the number of
+        distinct values sampled and High the count with every
+        once-sampled value taken as unique.
+        """
+        rows = self.sales[filter_mask(self.sales, **spec)]
+        keys = ([rows[by]] if by is not None else []) + [rows[column]]
+        seen = rows.groupby(keys, observed=True)['Weight'].agg(['size', 'first'])
+        once = (seen['size'] == 1).values
+        parts = pd.DataFrame({
+            'Count': np.where(once, np.sqrt(seen['first']), 1.0),
+            'Low': 1.0,
+            'High': np.where(once, seen['first'], 1.0),
+        }, index=seen.index)
+        if by is not None:
+            return parts.groupby(level=0, observed=True).sum().reset_index()
+        return parts.sum().to_frame().T
+
+
+# ============================================================================
+# PARALLEL PARTIAL AGGREGATES
+# ============================================================================
+# Frames with fewer rows are aggregated in one piece: below this, splitting
+# and merging cost more than the extra cores save
+PARALLEL_MIN_ROWS = 1_000_000
+# How each partial aggregate is merged across shards
+MERGE_FUNCTIONS = {'sum': 'sum', 'count': 'sum', 'size': 'sum', 'min': 'min', 'max': 'max'}
+
+
+class ShardPool:
+    """
+    Evaluates mergeable partial aggregates over row shards in parallel.
+
+    map_reduce() splits a frame into one contiguous shard per worker, runs
+    `partial` on each shard on a thread (or process) pool and merges the
+    results with `combine`. Frames under `min_rows`, or a single worker,
+    run `partial` once on the whole frame. Threads share the frame;
+    processes sidestep the GIL but copy each shard to a worker, so
+    `partial` must then be a picklable module-level function.
+    """
+
+    def __init__(self, workers=None, kind='thread', min_rows=PARALLEL_MIN_ROWS):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.min_rows = min_rows
+        executor = ProcessPoolExecutor if kind == 'process' else ThreadPoolExecutor
+        self.executor = executor(max_workers=self.workers) if self.workers > 1 else None
+
+    def shards(self, frame):
+        bounds = np.linspace(0, len(frame), self.workers + 1).astype(int)
+        return [frame.iloc[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+    def map_reduce(self, frame, partial, combine):
+        if self.executor is None or len(frame) < self.min_rows:
+            return combine([partial(frame)])
+        return combine(list(self.executor.map(partial, self.shards(frame))))
+
+
+def map_reduce(pool, frame, partial, combine):
+    """pool.map_reduce, or the single pass when there is no pool"""
+    if pool is None:
+        return combine([partial(frame)])
+    return pool.map_reduce(frame, partial, combine)
+
+
+def grouped_partial(frame, by, aggregations):
+    """Per-group aggregates of one shard; `aggregations` maps output -> (column, function)"""
+    return frame.groupby(by, observed=True).agg(**aggregations)
+
+
+def combine_grouped(parts, aggregations):
+    if len(parts) == 1:
+        return parts[0]
+    merged = pd.concat(parts)
+    functions = {output: MERGE_FUNCTIONS[function] for output, (_, function) in aggregations.items()}
+    return merged.groupby(level=list(range(merged.index.nlevels)), observed=True).agg(functions)
+
+
+def grouped_totals(frame, by, aggregations, pool=None):
+    """
+    frame.groupby(by).agg(**aggregations), computed as mergeable partials
+    (sum, count, size, min and max) over shards when a pool is given
+    """
+    return map_reduce(pool, frame, partial(grouped_partial, by=by, aggregations=aggregations),
+                      partial(combine_grouped, aggregations=aggregations))
+
+
+def distinct_partial(values):
+    """Distinct non-missing values of one shard (codes, for a categorical)"""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes = values.cat.codes.values
+        return np.unique(codes[codes >= 0])
+    return pd.unique(values.dropna().values)
+
+
+def combine_distinct(parts):
+    return len(parts[0]) if len(parts) == 1 else len(pd.unique(np.concatenate(parts)))
+
+
+def distinct_count(values, pool=None):
+    """values.nunique(), as a union of per-shard distinct sets when a pool is given"""
+    return map_reduce(pool, values, distinct_partial, combine_distinct)
+
+
+def distinct_rows_partial(frame, columns):
+    return frame[columns].drop_duplicates()
+
+
+def combine_distinct_rows(parts):
+    return parts[0] if len(parts) == 1 else pd.concat(parts).drop_duplicates()
+
+
+def trend_partial(frame, freq):
+    return frame.set_index('OrderDate').resample(freq).agg({'TotalSales': 'sum', 'Profit': 'sum'})
+
+
+def combine_trend(parts, freq):
+    # Re-resampling also fills periods that fall between two shards
+    return parts[0] if len(parts) == 1 else pd.concat(parts).resample(freq).sum()
+
+
+def combine_cube(parts):
+    return parts[0] if len(parts) == 1 else merge_cube_cells(concat_frames(parts))
+
+
+def moments_partial(frame):
+    """Count, mean, sum of squared deviations (m2), min and max of each column of one shard"""
+    values = frame.astype(np.float64)
+    count = values.count()
+    mean = values.mean().fillna(0.0)
+    return pd.DataFrame({'count': count, 'mean': mean, 'm2': ((values - mean) ** 2).sum(),
+                         'min': values.min(), 'max': values.max()})
+
+
+def combine_moments(parts):
+    """Merge moments_partial() results (Chan et al.'s pairwise update of mean and m2)"""
+    merged = parts[0]
+    for part in parts[1:]:
+        count = merged['count'] + part['count']
+        weight = part['count'] / count.clip(lower=1)
+        delta = part['mean'] - merged['mean']
+        merged = pd.DataFrame({
+            'count': count,
+            'mean': merged['mean'] + delta * weight,
+            'm2': merged['m2'] + part['m2'] + delta ** 2 * merged['count'] * weight,
+            'min': np.fmin(merged['min'], part['min']),
+            'max': np.fmax(merged['max'], part['max']),
+        })
+    return merged
+
+
+def describe_moments(moments):
+    """DataFrame.describe()'s count, mean, std, min and max rows from merged moments"""
+    count = moments['count']
+    return pd.DataFrame({
+        'count': count.astype(np.float64),
+        'mean': moments['mean'].where(count > 0),
+        'std': np.sqrt(moments['m2'] / (count - 1)).where(count > 1),
+        'min': moments['min'],
+        'max': moments['max'],
+    }).T
+
+
+# ============================================================================
+# SALES MODEL
+# ============================================================================
+class SalesModel:
+    """
+    The query structures for one version of the sales data.
+
+    Holds the filter index over transactions, the filter index over the
+    daily cube, the daily prefix sums and a stratified row sample for
+    previews; the search index and the customer sketch (with
+    `sketch_precision`) are built on first use. A model is shared
+    read-only: append() returns the next version, extended from this one
+    rather than rebuilt.
+    """
+
+    def __init__(self, sales, customers=None, calendar=None, pool=None, sketch_precision=HLL_PRECISION):
+        self.customers = customers
+        # ShardPool for row-level aggregates over large frames (None: single pass)
+        self.pool = pool
+        self.sketch_precision = sketch_precision
+        self.filter_index = FilterIndex(sales, customers)
+        self.cube_index = FilterIndex(map_reduce(pool, sales, partial(build_cube, customers=customers), combine_cube))
+        self.daily_series = DailySeries(self.cube_index.sales, calendar)
+        self.sample = StratifiedSample(self.filter_index.sales, customers)
+        self._search_index = None
+        self._customer_sketch = None
+        self._lock = threading.Lock()
+
+    @property
+    def search_index(self):
+        with self._lock:
+            if self._search_index is None:
+                self._search_index = SearchIndex(self.filter_index.sales)
+            return self._search_index
+
+    def _sketch_rows(self, rows, customers):
+        """Rows with the Tier and Segment the sketch cells need"""
+        return rows.assign(**customer_attributes(rows, customers))
+
+    @property
+    def sketch_ready(self):
+        """Whether the customer sketch is built (using it would not start a pass over the rows)"""
+        return self._customer_sketch is not None
+
+    @property
+    def customer_sketch(self):
+        with self._lock:
+            if self._customer_sketch is None:
+                self._customer_sketch = CustomerSketch(self._sketch_rows(self.filter_index.sales, self.customers),
+                                                       self.sketch_precision)
+            return self._customer_sketch
+
+    def append(self, rows, customers=None):
+        """
+        Return a model that also covers `rows` (newly arrived transactions).
+
+        `customers` must keep the attributes of every existing customer;
+        it may add new ones.
+        """
+        if len(rows) == 0:
+            return self
+        customers = self.customers if customers is None else customers
+        cells = build_cube(rows, customers)
+        model = SalesModel.__new__(SalesModel)
+        model.customers = customers
+        model.pool = self.pool
+        model.filter_index = self.filter_index.append(rows, customers)
+        model.cube_index = self.cube_index.append(cells, combine=merge_cube_cells)
+        model.daily_series = self.daily_series.append(cells)
+        model.sample = self.sample.append(rows, customers)
+        model.sketch_precision = self.sketch_precision
+        model._search_index = None
+        model._customer_sketch = None
+        if self._customer_sketch is not None:
+            model._customer_sketch = self._customer_sketch.append(self._sketch_rows(rows, customers))
+        model._lock = threading.Lock()
+        return model
+
+
+# ============================================================================
+# STREAMED SUMMARY
+# ============================================================================
+class SalesSummary:
+    """
+    The query structures of a sales CSV, built without holding its rows.
+
+    The file is read in chunks of `chunk_rows`; each chunk is denormalized,
+    folded into the daily cube and the customer sketch, and dropped, so
+    memory is bounded by one chunk plus the aggregates. Has the interface
+    of SalesModel with `filter_index` and `search_index` set to None:
+    aggregates come from the cube, distinct customers from the sketch,
+    and row-level requests (the detail table, search, exports) rescan the
+    file. Shared read-only like SalesModel; append_source() returns the
+    next version.
+    """
+    filter_index = None
+    search_index = None
+    sample = None
+    pool = None
+    # Bytes of scan results (latest rows, summary statistics) kept per summary
+    row_cache_bytes = 16 * 1024 * 1024
+
+    def __init__(self, csv_path, dimensions, calendar=None, chunk_rows=data_store.CSV_CHUNK_ROWS,
+                 float_dtype=data_store.FLOAT_DTYPE, sketch_precision=HLL_PRECISION):
+        self.csv_path = csv_path
+        self.dimensions = dimensions
+        self.customers = dimensions.get('customers')
+        self.chunk_rows = chunk_rows
+        self.float_dtype = float_dtype
+        self.signature = data_store.source_signature(csv_path)
+        self.customer_sketch = CustomerSketch(precision=sketch_precision)
+        cube = self._fold(0, self.signature['size'], self.customer_sketch)
+        self.cube_index = FilterIndex(cube)
+        self.daily_series = DailySeries(cube, calendar)
+        # Scan results for this version of the file, so reruns and repeated
+        # searches do not read it again; keyed by Query.row_key()
+        self.row_cache = AggregateCache(self.row_cache_bytes)
+
+    def _chunks(self, offset, length, columns=data_store.SALES_COLUMNS):
+        for chunk in data_store.iter_sales_csv(self.csv_path, offset, length, self.chunk_rows, columns):
+            yield data_store.denormalize(data_store.compact_sales(chunk, self.float_dtype), self.dimensions)
+
+    def _fold(self, offset, length, sketch):
+        """Cube cells of the rows between two byte offsets, also added to `sketch`"""
+        cube, pending, rows = None, [], 0
+        for chunk in self._chunks(offset, length):
+            rows += len(chunk)
+            sketch._add(chunk)
+            pending.append(build_cube(chunk))
+            # Merge once the new cells outnumber the merged ones, so the
+            # total merging cost stays proportional to the cells
+            if sum(len(cells) for cells in pending) > (0 if cube is None else len(cube)):
+                cube = merge_cube_cells(concat_frames([cube] + pending))
+                pending = []
+        sketch._flush()
+        self.signature['rows'] = (self.signature.get('rows') or 0) + rows
+        return merge_cube_cells(concat_frames([cube] + pending)) if pending else cube
+
+    def source_status(self):
+        """data_store.source_status() of the CSV against what the summary covers"""
+        return data_store.source_status(self.csv_path, self.signature)
+
+    def append_source(self):
+        """Return a summary that also covers the rows appended to the CSV since"""
+        summary = SalesSummary.__new__(SalesSummary)
+        summary.__dict__.update(self.__dict__)
+        summary.signature = dict(data_store.source_signature(self.csv_path), rows=self.signature['rows'])
+        summary.customer_sketch = self.customer_sketch.copy()
+        cells = summary._fold(self.signature['size'], summary.signature['size'], summary.customer_sketch)
+        summary.cube_index = self.cube_index.append(cells, combine=merge_cube_cells)
+        summary.daily_series = self.daily_series.append(cells)
+        summary.row_cache = AggregateCache(self.row_cache_bytes)
+        return summary
+
+    @property
+    def nbytes(self):
+        """Memory held by the aggregates"""
+        return (int(self.cube_index.sales.memory_usage(deep=True).sum()) + self.customer_sketch.nbytes
+                + sum(cumulative.nbytes for cumulative in self.daily_series.cumulative.values()))
+
+    def scan_chunks(self, spec, search='', columns=None):
+        """
+        Rows matching a filter spec (and `search`), one CSV chunk at a time
+        in file order, with every column of the file unless `columns` is given
+        """
+        for chunk in self._chunks(0, self.signature['size'], columns):
+            mask = filter_mask(chunk, **spec)
+            if search:
+                mask &= search_mask(chunk, search)
+            yield chunk[mask]
+
+    def scan(self, spec, n=None, search=''):
+        """
+        Rows matching a filter spec (and `search`), read from the CSV in
+        OrderDate order; with `n`, only the n most recent, newest first.
+        """
+        parts, latest = [], None
+        for rows in self.scan_chunks(spec, search):
+            if n is None:
+                parts.append(rows)
+                continue
+            # Keep a running top n; the stable sort leaves equal dates in file order
+            latest = concat_frames([latest, rows])
+            latest = latest.iloc[np.argsort(latest['OrderDate'].values, kind='stable')[-n:]]
+        if n is not None:
+            return latest.iloc[::-1].reset_index(drop=True) if latest is not None else pd.DataFrame()
+        rows = concat_frames(parts) if parts else pd.DataFrame()
+        return rows.iloc[np.argsort(rows['OrderDate'].values, kind='stable')].reset_index(drop=True) \
+            if len(rows) else rows
+
+    def describe(self, spec, columns):
+        """
+        Count, mean, std, min and max of `columns` over the rows matching a
+        filter spec, merged from per-chunk moments in one pass; quartiles
+        would need the rows, so they are left out.
+        """
+        parts = [moments_partial(rows[columns])
+                 for rows in self.scan_chunks(spec, columns=data_store.SALES_COLUMNS) if len(rows)]
+        if not parts:
+            return pd.DataFrame(index=['count'], columns=columns, data=[[0.0] * len(columns)])
+        return describe_moments(combine_moments(parts))
+
+
+# ============================================================================
+# DASHBOARD AGGREGATES
+# ============================================================================
+def kpi_values(daily_series, filter_spec, cube_filtered, customer_count):
+    """Headline KPIs for one filter combination"""
+    # Range totals and growth are prefix-sum lookups on the daily series;
+    # growth compares against the equally long period before the range,
+    # under the same region/category/tier filters.
+    totals = daily_series.totals(**filter_spec)
+    total_sales = totals['TotalSales']
+    total_profit = totals['Profit']
+    order_count = totals['OrderCount']
+
+    if filter_spec['start'] is not None and filter_spec['end'] is not None:
+        dimension_filters = {k: v for k, v in filter_spec.items() if k not in ('start', 'end')}
+        _, _, sales_growth = daily_series.growth(filter_spec['start'], filter_spec['end'], **dimension_filters)
+    else:
+        sales_growth = 0
+
+    return {
+        'total_sales': total_sales,
+        'total_profit': total_profit,
+        'profit_margin': (total_profit / total_sales * 100) if total_sales > 0 else 0,
+        'avg_order_value': (total_sales / order_count) if order_count > 0 else 0,
+        'order_count': int(order_count),
+        'customer_count': customer_count,
+        'sales_growth': sales_growth,
+        'region_count': cube_filtered['Region'].nunique() if 'Region' in cube_filtered.columns else 0,
+        'country_count': cube_filtered['Country'].nunique() if 'Country' in cube_filtered.columns else 0,
+    }
+
+
+def sales_trend(cube_filtered, freq='ME', pool=None):
+    """Sales, profit and margin per period (a pandas resample frequency)"""
+    trend = map_reduce(pool, cube_filtered, partial(trend_partial, freq=freq),
+                       partial(combine_trend, freq=freq)).reset_index()
+    trend['ProfitMargin'] = (trend['Profit'] / trend['TotalSales'] * 100)
+    return trend
+
+
+def sales_by(cube_filtered, dimension, top=None, pool=None):
+    """Total sales per value of a dimension, optionally only the `top` largest"""
+    totals = grouped_totals(cube_filtered, dimension, {'TotalSales': ('TotalSales', 'sum')}, pool)['TotalSales']
+    if top is not None:
+        totals = totals.nlargest(top)
+    return totals.reset_index()
+
+
+def region_performance(cube_filtered, pool=None):
+    return grouped_totals(cube_filtered, 'Region', {
+        'TotalSales': ('TotalSales', 'sum'), 'Profit': ('Profit', 'sum'), 'Quantity': ('Quantity', 'sum')
+    }, pool).reset_index()
+
+
+def segment_customers(sales_filtered, customers, pool=None):
+    """Distinct customers per segment"""
+    if 'Segment' in sales_filtered.columns:
+        # Denormalized at load time: no join needed
+        if pool is not None:
+            # Distinct (segment, customer) pairs merge across shards
+            sales_filtered = pool.map_reduce(
+                sales_filtered, partial(distinct_rows_partial, columns=['Segment', 'CustomerID']),
+                combine_distinct_rows)
+        return sales_filtered.groupby('Segment', observed=True).agg({
+            'CustomerID': 'nunique'
+        }).reset_index().rename(columns={'CustomerID': 'Count'})
+    customer_analysis = sales_filtered[['CustomerID']].merge(
+        customers[['CustomerID', 'Segment']], on='CustomerID', how='left'
+    )
+    return customer_analysis.groupby('Segment').agg({
+        'CustomerID': 'nunique'
+    }).reset_index().rename(columns={'CustomerID': 'Count'})
+
+
+# ============================================================================
+# QUERIES
+# ============================================================================
+# Dashboard aggregates by name, each computed from a Query
+AGGREGATES = {
+    'kpis': lambda q: kpi_values(q.model.daily_series, q.spec, q.cube_filtered, q.customer_count()),
+    'trend_daily': lambda q: sales_trend(q.cube_filtered, 'D', q.model.pool),
+    'trend_weekly': lambda q: sales_trend(q.cube_filtered, 'W', q.model.pool),
+    'trend_monthly': lambda q: sales_trend(q.cube_filtered, 'ME', q.model.pool),
+    'channel': lambda q: sales_by(q.cube_filtered, 'SalesChannel', pool=q.model.pool),
+    'region': lambda q: region_performance(q.cube_filtered, q.model.pool),
+    'country': lambda q: sales_by(q.cube_filtered, 'Country', 10, q.model.pool),
+    'product': lambda q: sales_by(q.cube_filtered, 'ProductName', 10, q.model.pool),
+    'category': lambda q: sales_by(q.cube_filtered, 'Category', pool=q.model.pool),
+    'segment': lambda q: q.customers_by_segment(),
+    'tier': lambda q: sales_by(q.cube_filtered, 'Tier', pool=q.model.pool),
+}
+
+# Aggregates computed from transaction rows rather than cube cells (from
+# the customer sketch when the model holds no rows)
+ROW_AGGREGATES = {'kpis', 'segment'}
+
+
+def filter_spec(start=None, end=None, regions=None, categories=None, tiers=None, channels=None):
+    """
+    A complete filter spec. Dates may be strings or dates; None means no
+    filter for that key.
+    """
+    return {
+        'start': None if start is None else pd.Timestamp(start).date(),
+        'end': None if end is None else pd.Timestamp(end).date(),
+        'regions': None if regions is None else list(regions),
+        'categories': None if categories is None else list(categories),
+        'tiers': None if tiers is None else list(tiers),
+        'channels': None if channels is None else list(channels),
+    }
+
+
+def signature_index(model):
+    """The filter index that defines a model's filter values: rows, or cube cells without them"""
+    return model.filter_index if model.filter_index is not None else model.cube_index
+
+
+class Query:
+    """
+    One filter spec evaluated against a SalesModel (or a SalesSummary).
+
+    The filtered rows and cube cells are computed on first use and shared
+    by every aggregate of the query. With an AggregateCache, results are
+    keyed by the canonical filter signature, so equivalent specs (and
+    repeated reruns) compute each aggregate once. With `approximate`,
+    distinct customers are estimated from the model's customer sketch
+    instead of counted from the rows (a model without rows always
+    estimates).
+    """
+
+    def __init__(self, model, spec, cache=None, version=0, approximate=False):
+        self.model = model
+        self.spec = filter_spec(**spec)
+        self.signature = signature_index(model).signature(**self.spec)
+        self.cache = cache
+        self.version = version
+        self.approximate = approximate or model.filter_index is None
+        self._selection = None
+        self._sales_filtered = None
+        self._cube_filtered = None
+
+    @property
+    def selection(self):
+        if self._selection is None:
+            self._selection = self.model.filter_index.select(**self.spec)
+        return self._selection
+
+    @property
+    def sales_filtered(self):
+        if self._sales_filtered is None:
+            self._sales_filtered = self.model.filter_index.take(self.selection)
+        return self._sales_filtered
+
+    @property
+    def cube_filtered(self):
+        if self._cube_filtered is None:
+            self._cube_filtered = self.model.cube_index.filter(**self.spec)
+        return self._cube_filtered
+
+    def fetch(self, name):
+        """Return (result, hit) for a named aggregate; hit is False without a cache"""
+        compute = AGGREGATES[name]
+        if self.cache is None:
+            return compute(self), False
+        return self.cache.fetch(self.key(name), lambda: compute(self))
+
+    def key(self, name):
+        return (self.version, self.signature, name, self.approximate and name in ROW_AGGREGATES)
+
+    def is_cached(self, name):
+        return self.cache is not None and self.key(name) in self.cache
+
+    def aggregate(self, name):
+        return self.fetch(name)[0]
+
+    def customer_count(self):
+        """Distinct customers: estimated from the sketch or counted from the rows"""
+        if self.approximate:
+            return self.model.customer_sketch.count(**self.spec)
+        return distinct_count(self.sales_filtered['CustomerID'], self.model.pool)
+
+    def customers_by_segment(self):
+        if self.approximate:
+            return self.model.customer_sketch.count_by('Segment', **self.spec)
+        return segment_customers(self.sales_filtered, self.model.customers, self.model.pool)
+
+    def count(self):
+        if self.model.filter_index is None:
+            return self.aggregate('kpis')['order_count']
+        return len(self.sales_filtered)
+
+    def rows(self, columns=None):
+        """The matching rows in OrderDate order"""
+        rows = self.sales_filtered if self.model.filter_index is not None else self.model.scan(self.spec)
+        return rows if columns is None else rows[columns]
+
+    def row_chunks(self, chunk_rows=data_store.EXPORT_CHUNK_ROWS):
+        """
+        The matching rows as frames of at most chunk_rows, for exports
+        (a streamed summary yields one filtered CSV chunk at a time).
+        """
+        if self.model.filter_index is None:
+            return self.model.scan_chunks(self.spec)
+        return data_store.selection_chunks(self.model.filter_index.sales, self.selection, chunk_rows)
+
+    def row_key(self, name, *args):
+        """Key of a streamed summary's row_cache entry for this query"""
+        return (self.version, self.signature, name) + args
+
+    def describe(self, columns):
+        """Summary statistics of `columns` over the matching rows, as DataFrame.describe()"""
+        if self.model.filter_index is None:
+            return self.model.row_cache.get_or_compute(
+                self.row_key('describe', tuple(columns)), lambda: self.model.describe(self.spec, columns))
+        return self.rows(columns).describe()
+
+    def latest(self, n, search=''):
+        """The n most recent matching rows, newest first, optionally searched"""
+        if self.model.filter_index is None:
+            return self.model.row_cache.get_or_compute(
+                self.row_key('latest', n, search), lambda: self.model.scan(self.spec, n, search))
+        filter_index = self.model.filter_index
+        rows = self.model.search_index.search(search, within=self.selection) if search else self.selection
+        # Index rows are in OrderDate order, so the newest are the last ones
+        return filter_index.take(filter_index.latest(rows, n))
+
+
+# Stand-ins for the dashboard aggregates, computed from a PreviewQuery
+PREVIEW_AGGREGATES = {
+    'kpis': lambda p: p.kpis(),
+    'trend_daily': lambda p: sales_trend(p.cube_filtered, 'D'),
+    'trend_weekly': lambda p: sales_trend(p.cube_filtered, 'W'),
+    'trend_monthly': lambda p: sales_trend(p.cube_filtered, 'ME'),
+    'channel': lambda p: p.estimate('SalesChannel'),
+    'region': lambda p: p.estimate('Region', ['TotalSales', 'Profit', 'Quantity']),
+    'country': lambda p: p.estimate('Country', top=10),
+    'product': lambda p: p.estimate('ProductName', top=10),
+    'category': lambda p: p.estimate('Category'),
+    'segment': lambda p: p.customers_by_segment(),
+    'tier': lambda p: p.estimate('Tier'),
+}
+
+
+class PreviewQuery:
+    """
+    Quick approximations of a Query's aggregates from the model's
+    stratified sample, shown while the exact ones are computed.
+
+    Chart totals carry '<measure>_ci' columns with the half-widths of
+    their 95% confidence intervals. KPI totals and growth are exact (they
+    are prefix-sum lookups). Distinct customers come from the customer
+    sketch once it is built and from the sample until then, so a preview
+    never waits for a pass over the rows; the KPIs give their range as
+    'customer_count_range'. Previews are not cached.
+    """
+
+    def __init__(self, query):
+        self.query = query
+        self.model = query.model
+        self.spec = query.spec
+        self._cube_filtered = None
+
+    @property
+    def cube_filtered(self):
+        """Weighted sample rows matching the spec, in place of cube cells"""
+        if self._cube_filtered is None:
+            self._cube_filtered = self.model.sample.cells(self.spec)
+        return self._cube_filtered
+
+    def fetch(self, name):
+        return PREVIEW_AGGREGATES[name](self), False
+
+    def estimate(self, dimension, measures=('TotalSales',), top=None):
+        return self.model.sample.estimate(self.spec, dimension, measures, top)
+
+    def customer_count(self):
+        """Estimated distinct customers as (estimate, low, high)"""
+        if self.model.sketch_ready:
+            sketch = self.model.customer_sketch
+            count = sketch.count(**self.spec)
+            margin = CONFIDENCE_Z * sketch.error * count
+            return count, count - margin, count + margin
+        estimate = self.model.sample.distinct(self.spec).iloc[0]
+        return int(round(estimate['Count'])), estimate['Low'], estimate['High']
+
+    def customers_by_segment(self):
+        if self.model.sketch_ready:
+            return self.model.customer_sketch.count_by('Segment', **self.spec)
+        counts = self.model.sample.distinct(self.spec, by='Segment')
+        return counts.assign(Count=counts['Count'].round().astype(int))[['Segment', 'Count']]
+
+    def kpis(self):
+        customer_count, low, high = self.customer_count()
+        kpis = kpi_values(self.model.daily_series, self.spec, self.cube_filtered, customer_count)
+        kpis['customer_count_range'] = (low, high)
+        return kpis
+
+    def rows_sampled(self):
+        return len(self.cube_filtered)
+
+
+def dataset_calendar(dataset):
+    if dataset.dates is not None and 'Date' in dataset.dates.columns:
+        return pd.to_datetime(dataset.dates['Date'])
+    return None
+
+
+def build_model(dataset, pool=None, distinct_error=None):
+    """
+    SalesModel for a data_store.Dataset, using its dates table as the
+    calendar. `distinct_error` is the standard error the customer sketch
+    is sized for (default: HLL_PRECISION).
+    """
+    precision = HLL_PRECISION if distinct_error is None else hll_precision(distinct_error)
+    return SalesModel(dataset.sales, dataset.customers, dataset_calendar(dataset), pool, precision)
+
+
+def build_summary(dataset, chunk_rows=data_store.CSV_CHUNK_ROWS, distinct_error=None):
+    """SalesSummary streamed from a data_store.Dataset's CSV (the dataset need not hold its sales)"""
+    precision = HLL_PRECISION if distinct_error is None else hll_precision(distinct_error)
+    return SalesSummary(dataset.csv_path, dataset.dimensions(), dataset_calendar(dataset),
+                        chunk_rows, dataset.float_dtype, precision)
+
+
+# ============================================================================
+# BATCH EVALUATION
+# ============================================================================
+# Dimensions a spec grid can split by: grid name -> (filter key, index dimension)
+GRID_DIMENSIONS = {
+    'region': ('regions', 'Region'),
+    'category': ('categories', 'Category'),
+    'tier': ('tiers', 'Tier'),
+    'channel': ('channels', 'SalesChannel'),
+}
+# Calendar periods a spec grid can split by: grid name -> pandas period frequency
+GRID_PERIODS = {'year': 'Y', 'quarter': 'Q', 'month': 'M'}
+
+
+def spec_grid(model, by=('region', 'quarter'), start=None, end=None):
+    """
+    Every combination of the values of the `by` dimensions and periods,
+    as {name: spec}. Periods cover the model's date range, or start..end.
+    """
+    index = signature_index(model)
+    dates = index.dates
+    first = pd.Timestamp(start if start is not None else dates[0])
+    last = pd.Timestamp(end if end is not None else dates[-1])
+    axes = []
+    for key in by:
+        if key in GRID_PERIODS:
+            periods = pd.period_range(first, last, freq=GRID_PERIODS[key])
+            axes.append([(str(p), {'start': p.start_time, 'end': p.end_time}) for p in periods])
+        else:
+            filter_key, dim = GRID_DIMENSIONS[key]
+            values = sorted(index.values.get(dim, {}), key=str)
+            axes.append([(str(v), {filter_key: [v]}) for v in values])
+
+    specs = {}
+    for combination in product(*axes):
+        spec = {}
+        for _, part in combination:
+            spec.update(part)
+        specs[' | '.join(label for label, _ in combination)] = filter_spec(**spec)
+    return specs
+
+
+def evaluate_batch(model, specs, names=None, cache=None, version=0):
+    """
+    Evaluate aggregates for many filter specs in one pass.
+
+    `specs` maps a name to a spec; returns {aggregate name: frame} where
+    each frame stacks the per-spec results with a leading 'spec' column
+    (KPIs become one row per spec). The model and, when given, the cache
+    are shared by every spec.
+    """
+    names = list(AGGREGATES) if names is None else names
+    parts = {name: [] for name in names}
+    for spec_name, spec in specs.items():
+        query = Query(model, spec, cache, version)
+        for name in names:
+            result = query.aggregate(name)
+            frame = pd.DataFrame([result]) if isinstance(result, dict) else result.copy()
+            frame.insert(0, 'spec', spec_name)
+            parts[name].append(frame)
+    return {name: pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+            for name, frames in parts.items()}
+
+
+# ============================================================================
+# PREFETCH
+# ============================================================================
+def adjacent_periods(start, end):
+    """
+    The periods just before and after start..end, as (first day, last day):
+    the neighbouring months or quarters when the range is a whole month or
+    quarter, otherwise equally long ranges.
+    """
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    for freq in ('M', 'Q'):
+        period = start.to_period(freq)
+        if period.start_time == start and period.end_time.normalize() == end:
+            return [(p.start_time, p.end_time.normalize()) for p in (period - 1, period + 1)]
+    length = end - start + pd.Timedelta(days=1)
+    return [previous_period(start, end), (end + pd.Timedelta(days=1), end + length)]
+
+
+def likely_specs(spec, regions, first_day=None, last_day=None):
+    """
+    Filter specs a user is likely to look at after `spec`, most likely
+    first: the adjacent periods of its date range (within first_day ..
+    last_day) and a drill-in to each of its regions (`regions` when it has
+    no region filter).
+    """
+    spec = filter_spec(**spec)
+    specs = []
+    if spec['start'] is not None and spec['end'] is not None:
+        for start, end in adjacent_periods(spec['start'], spec['end']):
+            if (first_day is None or end >= pd.Timestamp(first_day)) and \
+                    (last_day is None or start <= pd.Timestamp(last_day)):
+                specs.append(dict(spec, start=start, end=end))
+    selected = spec['regions'] if spec['regions'] is not None else list(regions)
+    if len(selected) > 1:
+        specs.extend(dict(spec, regions=[region]) for region in selected)
+    return specs
+
+
+class Prefetcher:
+    """
+    Computes aggregates that are likely to be requested next on a small
+    thread pool, storing them in each query's aggregate cache.
+
+    Each session has one batch in flight: a new batch (the session's
+    filters changed) cancels the jobs of the previous one that have not
+    started, and running jobs stop before their next aggregate.
+    """
+
+    def __init__(self, workers=2):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prefetch')
+        self.batches = {}
+        self.lock = threading.Lock()
+        self.computed = 0
+        self.cancelled = 0
+
+    def submit(self, session, jobs):
+        """Replace the session's batch with `jobs`: (query, aggregate names) pairs in priority order"""
+        stop = threading.Event()
+        with self.lock:
+            self._cancel(session)
+            self.batches[session] = (stop, [self.executor.submit(self._run, query, names, stop)
+                                            for query, names in jobs])
+
+    def cancel(self, session):
+        with self.lock:
+            self._cancel(session)
+
+    def _cancel(self, session):
+        stop, futures = self.batches.pop(session, (None, []))
+        if stop is not None:
+            stop.set()
+        self.cancelled += sum(future.cancel() for future in futures)
+
+    def _run(self, query, names, stop):
+        for name in names:
+            if stop.is_set():
+                return
+            _, hit = query.fetch(name)
+            if not hit:
+                with self.lock:
+                    self.computed += 1
+
+    def stats(self):
+        with self.lock:
+            pending = sum(not future.done() for _, futures in self.batches.values() for future in futures)
+            return {'computed': self.computed, 'cancelled': self.cancelled, 'pending': pending}
+
+
+# ============================================================================
+# DOWNSAMPLING
+# ============================================================================
+def lttb(x, y, n_out):
+    """
+    Indices of `n_out` points chosen by largest-triangle-three-buckets.
+
+    Keeps the first and last point; every bucket in between contributes
+    the point forming the largest triangle with the previously kept point
+    and the average of the next bucket, which preserves peaks and troughs
+    far better than striding. Returns all indices when n_out >= len(y).
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype('datetime64[ns]').view(np.int64)
+    x = x.astype(np.float64)
+    y = np.nan_to_num(np.asarray(y, dtype=np.float64))
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[hi:next_hi].mean(), y[hi:next_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+# ============================================================================
+# STAGE TIMING
+# ============================================================================
+class StageTimer:
+    """
+    Wall-clock spans for the stages of one dashboard rerun.
+
+    Each span records the stage name, its duration in milliseconds and,
+    when the caller fills them in, the rows going in and out and whether
+    the result came from a cache ('hit' or 'miss').
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+
+    @contextmanager
+    def span(self, stage, rows_in=None):
+        record = {'stage': stage, 'ms': None, 'rows_in': rows_in, 'rows_out': None, 'cache': None}
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['ms'] = round((time.perf_counter() - start) * 1000, 3)
+            self.spans.append(record)
+
+    def total_ms(self):
+        return round((time.perf_counter() - self.started) * 1000, 3)
+
+    def frame(self):
+        frame = pd.DataFrame(self.spans, columns=['stage', 'ms', 'rows_in', 'rows_out', 'cache'])
+        return frame.astype({'rows_in': 'Int64', 'rows_out': 'Int64'})
+
+    def write_jsonl(self, path, **fields):
+        """Append this rerun as one JSON line, with extra top-level fields"""
+        line = dict(fields, total_ms=self.total_ms(), stages=self.spans)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(line, default=str) + '\n')
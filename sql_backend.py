@@ -0,0 +1,454 @@
+"""
+Embedded SQL query backend for the Sales Performance Dashboard.
+
+An optional alternative to the in-memory structures of sales_engine for
+sales files larger than memory. The sales rows stay on disk as a table of
+an embedded engine: DuckDB queries the Parquet snapshot (or the CSV) in
+place, SQLite gets a database file imported next to the CSV chunk by chunk.
+Sidebar filters become a WHERE clause and each chart's grouping a GROUP BY,
+so only the aggregated rows come back to pandas.
+"""
+import json
+import sqlite3
+import threading
+from contextlib import closing
+from pathlib import Path
+
+import pandas as pd
+
+import data_store
+import sales_engine
+
+try:
+    import duckdb
+    DUCKDB_AVAILABLE = True
+except ImportError:
+    DUCKDB_AVAILABLE = False
+
+ENGINES = ['duckdb', 'sqlite']
+DATABASE_SUFFIX = '.sqlite'
+# Sales columns with an index in the SQLite database
+SQLITE_INDEXES = ['OrderDate', 'CustomerID', 'Region', 'Category', 'SalesChannel']
+# Bumped when the imported sales table changes shape; older databases are rebuilt
+SQLITE_SCHEMA_VERSION = 2
+
+# Engine-specific SQL fragments
+DIALECTS = {
+    'duckdb': {'timestamp': 'CAST(? AS TIMESTAMP)', 'day': 'CAST(s.OrderDate AS DATE)',
+               'text': 'CAST({} AS VARCHAR)'},
+    'sqlite': {'timestamp': '?', 'day': 'date(s.OrderDate)', 'text': '{}'},
+}
+# Filter spec key -> sales column (tiers go through the customers table)
+FILTER_COLUMNS = {'regions': 'Region', 'categories': 'Category', 'channels': 'SalesChannel'}
+
+SALES = 'sales s'
+SALES_WITH_CUSTOMERS = 'sales s LEFT JOIN customers c ON c.CustomerID = s.CustomerID'
+
+
+def default_engine():
+    return 'duckdb' if DUCKDB_AVAILABLE else 'sqlite'
+
+
+def quote(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def placeholders(values):
+    return ', '.join('?' * len(values))
+
+
+def customer_attribute(column):
+    """A joined customers column, with data_store's policy for missing customers"""
+    if data_store.MISSING_MEMBER_POLICY == 'unknown':
+        return f"COALESCE(c.{column}, {quote(data_store.UNKNOWN_MEMBER)})"
+    return f"c.{column}"
+
+
+# ============================================================================
+# FILTER TRANSLATION
+# ============================================================================
+def where_clause(spec, dialect):
+    """
+    SQL condition and parameters for a filter spec over sales aliased as
+    `s`. The end date is inclusive; customers missing from customers.csv
+    follow data_store.MISSING_MEMBER_POLICY, as in the in-memory path.
+    """
+    conditions, params = [], []
+    if spec['start'] is not None:
+        conditions.append(f"s.OrderDate >= {dialect['timestamp']}")
+        params.append(str(pd.Timestamp(spec['start'])))
+    if spec['end'] is not None:
+        conditions.append(f"s.OrderDate < {dialect['timestamp']}")
+        params.append(str(pd.Timestamp(spec['end']) + pd.Timedelta(days=1)))
+    for key, column in FILTER_COLUMNS.items():
+        if spec[key] is not None:
+            conditions.append(f"s.{column} IN ({placeholders(spec[key])})" if spec[key] else '1 = 0')
+            params.extend(spec[key])
+    if spec['tiers'] is not None:
+        tier = "(SELECT t.Tier FROM customers t WHERE t.CustomerID = s.CustomerID)"
+        if data_store.MISSING_MEMBER_POLICY == 'unknown':
+            tier = f"COALESCE({tier}, {quote(data_store.UNKNOWN_MEMBER)})"
+        conditions.append(f"{tier} IN ({placeholders(spec['tiers'])})" if spec['tiers'] else '1 = 0')
+        params.extend(spec['tiers'])
+    return ' AND '.join(conditions) or '1 = 1', params
+
+
+def spec_signature(spec):
+    """Hashable form of a filter spec; selections are sorted and de-duplicated"""
+    key = []
+    for name, value in spec.items():
+        if value is None or name in ('start', 'end'):
+            key.append(None if value is None else str(value))
+        else:
+            key.append(tuple(sorted(set(value), key=str)))
+    return tuple(key)
+
+
+# ============================================================================
+# BACKEND
+# ============================================================================
+def sqlite_type(dtype):
+    if pd.api.types.is_integer_dtype(dtype) or pd.api.types.is_bool_dtype(dtype):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'REAL'
+    return 'TEXT'
+
+
+def sqlite_rows(chunk):
+    """Rows of a parsed chunk as plain Python values for executemany"""
+    chunk = chunk.assign(OrderDate=chunk['OrderDate'].dt.strftime('%Y-%m-%d %H:%M:%S'))
+    chunk = chunk.astype(object).where(chunk.notna(), None)
+    return chunk.itertuples(index=False, name=None)
+
+
+def parse_dates(frame):
+    """Query results with OrderDate as datetimes (SQLite returns text)"""
+    if 'OrderDate' in frame.columns:
+        frame['OrderDate'] = pd.to_datetime(frame['OrderDate'])
+    return frame
+
+
+class SqlBackend:
+    """
+    The sales and customer tables of one data directory in an embedded engine.
+
+    DuckDB reads the files in place: the Parquet snapshot while it is
+    current, the CSV otherwise. SQLite imports the CSV into
+    sales_transactions.sqlite in chunks and, when the CSV has only grown,
+    imports just the appended rows. refresh() picks up changes on disk and
+    `version` counts them.
+    """
+
+    def __init__(self, data_dir, engine=None):
+        self.data_dir = Path(data_dir)
+        self.engine = engine or default_engine()
+        if self.engine not in ENGINES:
+            raise ValueError(f"Unknown SQL engine '{self.engine}' (expected one of {ENGINES})")
+        if self.engine == 'duckdb' and not DUCKDB_AVAILABLE:
+            raise ImportError("The duckdb engine requires the duckdb package")
+        self.dialect = DIALECTS[self.engine]
+        self.connection = duckdb.connect() if self.engine == 'duckdb' else None
+        self.lock = threading.RLock()
+        self.signature = None
+        self.customers_signature = None
+        self.source = None
+        self.columns = []
+        self.version = 0
+        self.refresh()
+
+    @property
+    def csv_path(self):
+        return self.data_dir / data_store.SALES_FILE
+
+    @property
+    def customers_path(self):
+        return self.data_dir / data_store.DIMENSION_FILES['customers']
+
+    @property
+    def database_path(self):
+        return self.csv_path.with_suffix(DATABASE_SUFFIX)
+
+    def refresh(self):
+        """Bring the tables up to date with the files; returns True if they changed"""
+        with self.lock:
+            customers = data_store.file_signature(self.customers_path) if self.customers_path.exists() else None
+            status = data_store.source_status(self.csv_path, self.signature)
+            if status == 'unchanged' and customers == self.customers_signature and self.version:
+                return False
+            if self.engine == 'duckdb':
+                self._register_files()
+            else:
+                self._import_files()
+            self.customers_signature = customers
+            # Every column of the file, for the detail table and exports
+            self.columns = list(self.query("SELECT * FROM sales LIMIT 0").columns)
+            self.version += 1
+            return True
+
+    def _register_files(self):
+        meta = data_store.read_snapshot_meta(self.csv_path)
+        if meta is not None and data_store.source_status(self.csv_path, meta) == 'unchanged':
+            snapshot_path, _ = data_store.snapshot_paths(self.csv_path)
+            self.source = 'snapshot'
+            table = f"read_parquet({quote(snapshot_path)})"
+        else:
+            self.source = 'csv'
+            table = f"read_csv_auto({quote(self.csv_path)})"
+        self.connection.execute(f"CREATE OR REPLACE VIEW sales AS SELECT * FROM {table}")
+        columns = ['CustomerID'] + data_store.CUSTOMER_ATTRIBUTES
+        if self.customers_path.exists():
+            attributes = ', '.join(f"first({c}) AS {c}" for c in data_store.CUSTOMER_ATTRIBUTES)
+            customers = (f"SELECT CustomerID, {attributes} "
+                         f"FROM read_csv_auto({quote(self.customers_path)}) GROUP BY CustomerID")
+        else:
+            customers = f"SELECT {', '.join(f'NULL::VARCHAR AS {c}' for c in columns)} WHERE false"
+        self.connection.execute(f"CREATE OR REPLACE VIEW customers AS {customers}")
+        self.signature = data_store.source_signature(self.csv_path)
+
+    def _import_files(self):
+        """Import new or changed rows into the SQLite database in one transaction"""
+        self.source = 'sqlite'
+        with closing(sqlite3.connect(self.database_path, isolation_level=None)) as con:
+            con.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            row = con.execute("SELECT value FROM meta WHERE key = 'signature'").fetchone()
+            stored = json.loads(row[0]) if row else None
+            if stored is not None and stored.get('schema') != SQLITE_SCHEMA_VERSION:
+                stored = None
+            status = data_store.source_status(self.csv_path, stored)
+            con.execute("BEGIN")
+            try:
+                if status == 'unchanged':
+                    signature = stored
+                else:
+                    signature = self._import_sales(con, stored if status == 'appended' else None)
+                    con.execute("INSERT OR REPLACE INTO meta VALUES ('signature', ?)", (json.dumps(signature),))
+                self._import_customers(con)
+                con.execute("COMMIT")
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
+        self.signature = signature
+
+    def _import_sales(self, con, previous):
+        """Append the rows after `previous` (a signature), or rebuild when it is None"""
+        signature = data_store.source_signature(self.csv_path)
+        offset, rows = (previous['size'], previous['rows']) if previous else (0, 0)
+        if previous is None:
+            con.execute("DROP TABLE IF EXISTS sales")
+        for chunk in data_store.iter_sales_csv(self.csv_path, offset, signature['size']):
+            if rows == 0 and previous is None:
+                columns = ', '.join(f'"{c}" {sqlite_type(t)}' for c, t in chunk.dtypes.items())
+                con.execute(f"CREATE TABLE sales ({columns})")
+            con.executemany(f"INSERT INTO sales ({', '.join(chunk.columns)}) VALUES ({placeholders(chunk.columns)})",
+                            sqlite_rows(chunk))
+            rows += len(chunk)
+        for column in SQLITE_INDEXES:
+            con.execute(f"CREATE INDEX IF NOT EXISTS sales_{column} ON sales ({column})")
+        signature['rows'] = rows
+        signature['schema'] = SQLITE_SCHEMA_VERSION
+        return signature
+
+    def _import_customers(self, con):
+        columns = ['CustomerID'] + data_store.CUSTOMER_ATTRIBUTES
+        con.execute("DROP TABLE IF EXISTS customers")
+        con.execute(f"CREATE TABLE customers (CustomerID TEXT PRIMARY KEY, "
+                    f"{', '.join(c + ' TEXT' for c in data_store.CUSTOMER_ATTRIBUTES)})")
+        if not self.customers_path.exists():
+            return
+        customers = pd.read_csv(self.customers_path).drop_duplicates('CustomerID').reindex(columns=columns)
+        con.executemany(f"INSERT INTO customers VALUES ({placeholders(columns)})",
+                        customers.astype(object).where(customers.notna(), None).itertuples(index=False, name=None))
+
+    def query(self, sql, params=()):
+        """Run a query and return its result as a DataFrame"""
+        if self.engine == 'duckdb':
+            with self.lock:
+                cursor = self.connection.cursor()
+            with closing(cursor):
+                return cursor.execute(sql, list(params)).df()
+        with closing(sqlite3.connect(self.database_path)) as con:
+            return pd.read_sql_query(sql, con, params=list(params))
+
+    def query_chunks(self, sql, params=(), chunk_rows=data_store.EXPORT_CHUNK_ROWS):
+        """Run a query and yield its result as DataFrames of at most chunk_rows (at least one)"""
+        if self.engine == 'duckdb':
+            with self.lock:
+                con = self.connection.cursor()
+        else:
+            con = sqlite3.connect(self.database_path)
+        with closing(con):
+            cursor = con.execute(sql, list(params))
+            columns = [d[0] for d in cursor.description]
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                yield pd.DataFrame.from_records(rows, columns=columns)
+                if len(rows) < chunk_rows:
+                    return
+
+
+# ============================================================================
+# PUSHED-DOWN AGGREGATES
+# ============================================================================
+def range_totals(q, spec):
+    where, params = where_clause(spec, q.backend.dialect)
+    return q.backend.query(
+        "SELECT COALESCE(SUM(s.TotalSales), 0) AS TotalSales, COALESCE(SUM(s.Profit), 0) AS Profit, "
+        "COUNT(*) AS OrderCount, COUNT(DISTINCT s.CustomerID) AS Customers, "
+        "COUNT(DISTINCT s.Region) AS Regions, COUNT(DISTINCT s.Country) AS Countries "
+        f"FROM {SALES} WHERE {where}", params
+    ).iloc[0]
+
+
+def kpi_values(q):
+    """Headline KPIs, as sales_engine.kpi_values returns them"""
+    totals = range_totals(q, q.spec)
+    total_sales, total_profit = float(totals['TotalSales']), float(totals['Profit'])
+    order_count = int(totals['OrderCount'])
+
+    sales_growth = 0
+    if q.spec['start'] is not None and q.spec['end'] is not None:
+        # Against the equally long period before the range, same filters
+        start, end = pd.Timestamp(q.spec['start']), pd.Timestamp(q.spec['end'])
+        length = end - start + pd.Timedelta(days=1)
+        previous_spec = dict(q.spec, start=start - length, end=start - pd.Timedelta(days=1))
+        previous = float(range_totals(q, previous_spec)['TotalSales'])
+        sales_growth = ((total_sales - previous) / previous * 100) if previous > 0 else 0
+
+    return {
+        'total_sales': total_sales,
+        'total_profit': total_profit,
+        'profit_margin': (total_profit / total_sales * 100) if total_sales > 0 else 0,
+        'avg_order_value': (total_sales / order_count) if order_count > 0 else 0,
+        'order_count': order_count,
+        'customer_count': int(totals['Customers']),
+        'sales_growth': sales_growth,
+        'region_count': int(totals['Regions']),
+        'country_count': int(totals['Countries']),
+    }
+
+
+def daily_totals(q):
+    """Sales and profit per day; coarser trends are resampled from it in pandas"""
+    daily = q.select(
+        f"SELECT {q.backend.dialect['day']} AS OrderDate, SUM(s.TotalSales) AS TotalSales, "
+        f"SUM(s.Profit) AS Profit FROM {SALES} WHERE {q.where} GROUP BY 1 ORDER BY 1"
+    )
+    daily['OrderDate'] = pd.to_datetime(daily['OrderDate'])
+    return sales_engine.sales_trend(daily, 'D')
+
+
+def sales_by(q, column, top=None):
+    """Total sales per value of a column, optionally only the `top` largest"""
+    if column in data_store.CUSTOMER_ATTRIBUTES:
+        expression, source = customer_attribute(column), SALES_WITH_CUSTOMERS
+    else:
+        expression, source = f's.{column}', SALES
+    order = f"2 DESC LIMIT {int(top)}" if top is not None else "1"
+    return q.select(
+        f"SELECT {expression} AS {column}, SUM(s.TotalSales) AS TotalSales FROM {source} "
+        f"WHERE {q.where} AND {expression} IS NOT NULL GROUP BY 1 ORDER BY {order}"
+    )
+
+
+def region_performance(q):
+    return q.select(
+        "SELECT s.Region AS Region, SUM(s.TotalSales) AS TotalSales, SUM(s.Profit) AS Profit, "
+        f"SUM(s.Quantity) AS Quantity FROM {SALES} WHERE {q.where} GROUP BY 1 ORDER BY 1"
+    )
+
+
+def segment_customers(q):
+    """Distinct customers per segment"""
+    segment = customer_attribute('Segment')
+    return q.select(
+        f"SELECT {segment} AS Segment, COUNT(DISTINCT s.CustomerID) AS Count FROM {SALES_WITH_CUSTOMERS} "
+        f"WHERE {q.where} AND {segment} IS NOT NULL GROUP BY 1 ORDER BY 1"
+    )
+
+
+# The aggregates of sales_engine.AGGREGATES, pushed down to SQL
+SQL_AGGREGATES = {
+    'kpis': kpi_values,
+    'trend_daily': daily_totals,
+    'trend_weekly': lambda q: sales_engine.sales_trend(q.aggregate('trend_daily'), 'W'),
+    'trend_monthly': lambda q: sales_engine.sales_trend(q.aggregate('trend_daily'), 'ME'),
+    'channel': lambda q: sales_by(q, 'SalesChannel'),
+    'region': region_performance,
+    'country': lambda q: sales_by(q, 'Country', 10),
+    'product': lambda q: sales_by(q, 'ProductName', 10),
+    'category': lambda q: sales_by(q, 'Category'),
+    'segment': segment_customers,
+    'tier': lambda q: sales_by(q, 'Tier'),
+}
+
+
+# ============================================================================
+# QUERIES
+# ============================================================================
+class SqlQuery:
+    """
+    One filter spec evaluated by a SqlBackend, with the interface of
+    sales_engine.Query. Each aggregate is a single pushed-down query;
+    results go through the same AggregateCache when one is given.
+    """
+
+    def __init__(self, backend, spec, cache=None, version=0):
+        self.backend = backend
+        self.spec = sales_engine.filter_spec(**spec)
+        self.signature = spec_signature(self.spec)
+        self.where, self.params = where_clause(self.spec, backend.dialect)
+        self.cache = cache
+        self.version = version
+
+    def select(self, sql, params=None):
+        return self.backend.query(sql, self.params if params is None else params)
+
+    def fetch(self, name):
+        """Return (result, hit) for a named aggregate; hit is False without a cache"""
+        compute = SQL_AGGREGATES[name]
+        if self.cache is None:
+            return compute(self), False
+        key = (self.backend.engine, self.version, self.signature, name)
+        return self.cache.fetch(key, lambda: compute(self))
+
+    def aggregate(self, name):
+        return self.fetch(name)[0]
+
+    def count(self):
+        return self.aggregate('kpis')['order_count']
+
+    def latest(self, n, search=''):
+        """The n most recent matching rows, newest first, optionally searched"""
+        where, params = self.where, list(self.params)
+        search = search.strip().lower()
+        columns = [c for c in sales_engine.SEARCH_COLUMNS if c in self.backend.columns]
+        if search and columns:
+            # Case-insensitive substring match on the searched columns
+            pattern = '%' + search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            text = self.backend.dialect['text']
+            matches = [f"lower({text.format('s.' + c)}) LIKE ? ESCAPE '\\'" for c in columns]
+            where += f" AND ({' OR '.join(matches)})"
+            params += [pattern] * len(columns)
+        return self.rows(params=params, where=where, limit=n)
+
+    def _rows_sql(self, columns=None, where=None, limit=None):
+        columns = self.backend.columns if columns is None else columns
+        return (f"SELECT {', '.join('s.' + c for c in columns)} FROM {SALES} WHERE {where or self.where} "
+                f"ORDER BY s.OrderDate" + (f" DESC LIMIT {int(limit)}" if limit is not None else ""))
+
+    def rows(self, columns=None, params=None, where=None, limit=None):
+        """
+        Matching rows in OrderDate order (newest first with a limit). Without
+        a limit the whole selection is materialized; exports use row_chunks().
+        """
+        return parse_dates(self.select(self._rows_sql(columns, where, limit), params))
+
+    def describe(self, columns):
+        """Summary statistics of `columns` over the matching rows, as DataFrame.describe()"""
+        return self.rows(columns).describe()
+
+    def row_chunks(self, chunk_rows=data_store.EXPORT_CHUNK_ROWS):
+        """The matching rows in OrderDate order as frames of at most chunk_rows, read from a cursor"""
+        for chunk in self.backend.query_chunks(self._rows_sql(), self.params, chunk_rows):
+            yield parse_dates(chunk)
@@ -0,0 +1,169 @@
+"""
+Shared fixtures: small generated datasets and plain-pandas references.
+
+Every query structure is checked against the same computation done the
+obvious way on the raw CSV rows, so the references share no code with
+sales_engine, data_store or sql_backend.
+"""
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_generation
+import data_store
+import sales_engine
+
+ROWS = 5_000
+SEED = 7
+
+# Filter specs the aggregates are compared under, from no filter to one
+# that matches nothing
+SPECS = {
+    'all': {},
+    'year': dict(start='2023-01-01', end='2023-12-31'),
+    'drilldown': dict(start='2023-04-01', end='2024-06-30', regions=['Europe', 'North America'],
+                      categories=['Electronics']),
+    'tier_channel': dict(tiers=['Silver'], channels=['Online', 'Corporate']),
+    'empty': dict(regions=['Atlantis']),
+}
+
+
+@pytest.fixture(scope='session')
+def data_dir(tmp_path_factory):
+    """A single-CSV data folder; tests that modify files copy it first"""
+    path = tmp_path_factory.mktemp('data') / 'sales_dashboard_data'
+    data_generation.write_dataset(ROWS, SEED, ROWS, 1, str(path), verbose=False)
+    return path
+
+
+@pytest.fixture(scope='session')
+def partitioned_dir(tmp_path_factory):
+    path = tmp_path_factory.mktemp('partitioned') / 'sales_dashboard_data'
+    data_generation.write_dataset(ROWS, SEED, ROWS, 1, str(path), verbose=False, partitioned=True)
+    return path
+
+
+
+@pytest.fixture
+def data_copy(data_dir, tmp_path):
+    return shutil.copytree(data_dir, tmp_path / 'sales_dashboard_data')
+
+
+@pytest.fixture(scope='session')
+def dataset(data_dir):
+    return data_store.Dataset(data_dir)
+
+
+@pytest.fixture(scope='session')
+def model(dataset):
+    return sales_engine.build_model(dataset)
+
+
+@pytest.fixture(scope='session')
+def raw_sales(data_dir):
+    return read_raw_sales([data_dir / data_store.SALES_FILE], data_dir / 'customers.csv')
+
+
+# ============================================================================
+# PLAIN PANDAS REFERENCES
+# ============================================================================
+def read_raw_sales(paths, customers_path):
+    """The sales rows as read_csv gives them (float64), with the customer Tier and Segment joined on"""
+    sales = pd.concat([pd.read_csv(path) for path in paths], ignore_index=True)
+    sales['OrderDate'] = pd.to_datetime(sales['OrderDate'])
+    customers = pd.read_csv(customers_path)[['CustomerID', 'Tier', 'Segment']]
+    return sales.merge(customers, on='CustomerID', how='left')
+
+
+def spec_mask(sales, start=None, end=None, regions=None, categories=None, tiers=None, channels=None):
+    mask = pd.Series(True, index=sales.index)
+    if start is not None:
+        mask &= sales['OrderDate'] >= pd.Timestamp(start)
+    if end is not None:
+        mask &= sales['OrderDate'] <= pd.Timestamp(end)
+    for column, selected in (('Region', regions), ('Category', categories),
+                             ('Tier', tiers), ('SalesChannel', channels)):
+        if selected is not None:
+            mask &= sales[column].isin(selected)
+    return mask
+
+
+def reference_kpis(sales, spec):
+    spec = sales_engine.filter_spec(**spec)
+    rows = sales[spec_mask(sales, **spec)]
+    total_sales, total_profit = rows['TotalSales'].sum(), rows['Profit'].sum()
+    growth = 0
+    if spec['start'] is not None and spec['end'] is not None:
+        start, end = pd.Timestamp(spec['start']), pd.Timestamp(spec['end'])
+        length = end - start + pd.Timedelta(days=1)
+        previous_spec = dict(spec, start=start - length, end=start - pd.Timedelta(days=1))
+        previous = sales.loc[spec_mask(sales, **previous_spec), 'TotalSales'].sum()
+        growth = (total_sales - previous) / previous * 100 if previous > 0 else 0
+    return {
+        'total_sales': total_sales,
+        'total_profit': total_profit,
+        'profit_margin': total_profit / total_sales * 100 if total_sales > 0 else 0,
+        'avg_order_value': total_sales / len(rows) if len(rows) else 0,
+        'order_count': len(rows),
+        'customer_count': rows['CustomerID'].nunique(),
+        'sales_growth': growth,
+        'region_count': rows['Region'].nunique(),
+        'country_count': rows['Country'].nunique(),
+    }
+
+
+def reference_trend(rows, freq):
+    trend = rows.set_index('OrderDate').resample(freq)[['TotalSales', 'Profit']].sum().reset_index()
+    trend['ProfitMargin'] = trend['Profit'] / trend['TotalSales'] * 100
+    return trend
+
+
+def reference_totals(rows, column, top=None):
+    totals = rows.groupby(column)['TotalSales'].sum()
+    if top is not None:
+        totals = totals.nlargest(top)
+    return totals.reset_index()
+
+
+def reference_aggregate(sales, spec, name):
+    """What sales_engine.AGGREGATES[name] should return for `spec`"""
+    if name == 'kpis':
+        return reference_kpis(sales, spec)
+    rows = sales[spec_mask(sales, **sales_engine.filter_spec(**spec))]
+    if name.startswith('trend_'):
+        return reference_trend(rows, {'trend_daily': 'D', 'trend_weekly': 'W', 'trend_monthly': 'ME'}[name])
+    if name == 'region':
+        return rows.groupby('Region')[['TotalSales', 'Profit', 'Quantity']].sum().reset_index()
+    if name == 'segment':
+        return rows.groupby('Segment')['CustomerID'].nunique().rename('Count').reset_index()
+    column, top = {'channel': ('SalesChannel', None), 'country': ('Country', 10), 'product': ('ProductName', 10),
+                   'category': ('Category', None), 'tier': ('Tier', None)}[name]
+    return reference_totals(rows, column, top)
+
+
+def normalize(frame):
+    """A result frame with plain columns in key order, for comparisons"""
+    frame = frame.reset_index(drop=True)
+    frame = frame.astype({c: object for c in frame.columns
+                          if isinstance(frame[c].dtype, pd.CategoricalDtype) or frame[c].dtype == object})
+    return frame.sort_values(frame.columns[0]).reset_index(drop=True)
+
+
+def assert_same_aggregate(actual, expected, rtol=1e-9):
+    """Aggregates agree up to the summation order of the measures"""
+    if isinstance(expected, dict):
+        assert actual.keys() >= expected.keys()
+        for key, value in expected.items():
+            assert actual[key] == pytest.approx(value, rel=rtol, abs=1e-6), key
+        return
+    actual, expected = normalize(actual), normalize(expected)
+    assert list(actual.columns) == list(expected.columns)
+    assert len(actual) == len(expected)
+    for column in expected.columns:
+        if pd.api.types.is_numeric_dtype(expected[column]):
+            np.testing.assert_allclose(actual[column].astype(float), expected[column].astype(float),
+                                       rtol=rtol, atol=1e-6, err_msg=column)
+        else:
+            assert list(actual[column]) == list(expected[column]), column
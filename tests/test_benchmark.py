@@ -0,0 +1,27 @@
+import pytest
+
+import benchmark
+import sales_engine
+
+
+@pytest.mark.parametrize('backend', ['pandas', 'stream', 'sqlite'])
+def test_every_stage_is_timed(data_copy, backend):
+    results, rss = benchmark.run_dataset(data_copy, 5_000, ['all', 'month_drilldown'], 1, False, backend)
+    stages = {(r['scenario'], r['stage']) for r in results}
+    for scenario in ('all', 'month_drilldown'):
+        for stage in list(sales_engine.AGGREGATES) + ['tab_reports', 'search']:
+            assert (scenario, stage) in stages
+    assert (None, 'load_csv') in stages and (None, 'index') in stages
+    assert all(r['seconds'] >= 0 and r['peak_bytes'] is None for r in results)
+    assert rss > 0
+
+
+def test_compare_flags_slower_and_larger_stages():
+    def result(stage, seconds, peak):
+        return {'rows': 10, 'scenario': 'all', 'stage': stage, 'seconds': seconds, 'peak_bytes': peak}
+    baseline = {'results': [result('kpis', 1.0, 100), result('region', 1.0, 100), result('tier', 0.001, 100)]}
+    results = [result('kpis', 1.5, 100), result('region', 1.1, 200), result('tier', 0.003, 100),
+               result('channel', 9.0, 100)]
+    regressions = benchmark.compare(results, baseline, tolerance=0.25, min_seconds=0.005)
+    # 'tier' is three times slower but by less than min_seconds; 'channel' has no baseline
+    assert [(r['stage'], metric) for r, _, metric in regressions] == [('kpis', 'seconds'), ('region', 'peak_bytes')]
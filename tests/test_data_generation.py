@@ -0,0 +1,103 @@
+import io
+import random
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_generation
+
+
+# ============================================================================
+# TRANSACTIONS
+# ============================================================================
+@pytest.fixture(scope='module')
+def transactions():
+    return data_generation.generate_transactions(20_000, 3)
+
+
+def test_transactions_are_deterministic(transactions):
+    pd.testing.assert_frame_equal(data_generation.generate_transactions(20_000, 3), transactions)
+    assert not data_generation.generate_transactions(1_000, 4).equals(transactions.head(1_000))
+
+
+def test_transaction_values(transactions):
+    df = transactions
+    assert df['TransactionID'].is_unique
+    assert df['Quantity'].between(1, 10).all()
+    np.testing.assert_allclose(df['TotalSales'], (df['Quantity'] * df['UnitPrice']).round(2))
+    np.testing.assert_allclose(df['Profit'], (df['TotalSales'] - df['TotalCost']).round(2), atol=1e-9)
+    dates = pd.to_datetime(df['OrderDate'])
+    assert dates.between(data_generation.start_date, data_generation.end_date).all()
+    assert (dates.dt.year == df['OrderYear']).all()
+    assert (df['ShippingCost'][df['SalesChannel'] != 'Online'] == 0).all()
+
+
+def test_places_belong_to_their_region(transactions):
+    for (region, country, city), _ in transactions.groupby(['Region', 'Country', 'City']):
+        assert city in data_generation.regions_config[region]['countries'][country]['cities']
+
+
+def test_every_third_transaction_reuses_a_customer(transactions):
+    numbers = data_generation.customer_numbers(transactions['CustomerID']).values
+    positions = np.arange(len(numbers))
+    repeat = (positions % 3 == 0) & (positions > 0)
+    # New customers are numbered in order of creation
+    assert (np.diff(numbers[~repeat]) == 1).all()
+    assert (numbers[repeat] < positions[repeat] - (positions[repeat] - 1) // 3).all()
+    # A customer's segment does not depend on the transaction
+    assert (transactions.groupby('CustomerID')['CustomerSegment'].nunique() == 1).all()
+
+
+def test_batches_continue_the_numbering(transactions):
+    tail = data_generation.generate_transactions(5_000, 3, start_index=15_000)
+    assert list(tail['TransactionID']) == list(transactions['TransactionID'].iloc[15_000:])
+    # A customer created in either run has the same segment in both
+    segments = transactions.drop_duplicates('CustomerID').set_index('CustomerID')['CustomerSegment']
+    both = tail.drop_duplicates('CustomerID').set_index('CustomerID')['CustomerSegment']
+    shared = segments.index.intersection(both.index)
+    assert len(shared) > 0 and (segments[shared] == both[shared]).all()
+
+
+# ============================================================================
+# CUSTOMER TABLE
+# ============================================================================
+def test_spilled_customers_match_the_in_memory_merge(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_generation, 'customer_bucket_size', 1_000)
+    data_generation.write_dataset(12_000, 5, 5_000, 1, str(tmp_path), customer_limit=6_000, verbose=False)
+    sales = pd.read_csv(tmp_path / 'sales_transactions.csv')
+    summaries = [data_generation.summarize_transactions(sales.iloc[start:start + 5_000])
+                 for start in range(0, len(sales), 5_000)]
+    expected = data_generation.build_customers(data_generation.merge_summaries(summaries), limit=6_000)
+    customers = pd.read_csv(tmp_path / 'customers.csv')
+    pd.testing.assert_frame_equal(customers, pd.read_csv(io.StringIO(expected.to_csv(index=False))))
+    assert not (tmp_path / data_generation.CUSTOMER_SPILL_DIR).exists()
+
+
+def test_peak_memory_does_not_grow_with_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_generation, 'customer_bucket_size', 500)
+    peaks = []
+    for rows in (5_000, 20_000):
+        tracemalloc.start()
+        try:
+            data_generation.write_dataset(rows, 3, 2_500, 1, str(tmp_path / str(rows)), verbose=False)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+    # Four times the rows (and customers): peak memory is still that of
+    # one chunk and one bucket
+    assert peaks[1] < 1.25 * peaks[0]
+
+
+# ============================================================================
+# DIMENSION TABLES
+# ============================================================================
+def test_dimension_tables_depend_only_on_the_seed(tmp_path):
+    for name, seed in (('a', 3), ('b', 3), ('c', 4)):
+        # Whatever state the global generator is left in
+        random.seed(name)
+        data_generation.write_dataset(2_000, seed, 2_000, 1, str(tmp_path / name), verbose=False)
+    for table in ('regions.csv', 'products.csv', 'dates.csv'):
+        assert (tmp_path / 'a' / table).read_bytes() == (tmp_path / 'b' / table).read_bytes()
+    assert (tmp_path / 'a' / 'regions.csv').read_bytes() != (tmp_path / 'c' / 'regions.csv').read_bytes()
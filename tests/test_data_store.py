@@ -0,0 +1,337 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_store
+import sales_engine
+from conftest import SPECS, assert_same_aggregate, read_raw_sales, reference_aggregate
+
+
+# ============================================================================
+# SNAPSHOT
+# ============================================================================
+def test_snapshot_is_used_on_the_next_load(data_copy):
+    first = data_store.Dataset(data_copy)
+    second = data_store.Dataset(data_copy)
+    assert second.source == 'snapshot'
+    pd.testing.assert_frame_equal(second.sales, first.sales)
+
+
+def test_stale_snapshot_is_not_used(data_copy):
+    data_store.Dataset(data_copy)
+    csv_path = data_copy / data_store.SALES_FILE
+    lines = csv_path.read_text(encoding='utf-8').splitlines(keepends=True)
+    # Drop a row from the middle: the snapshot no longer matches the CSV
+    csv_path.write_text(''.join(lines[:100] + lines[101:]), encoding='utf-8')
+
+    dataset = data_store.Dataset(data_copy)
+    assert dataset.source == 'csv'
+    assert len(dataset.sales) == len(lines) - 2
+    assert data_store.Dataset(data_copy).source == 'snapshot'
+
+
+def test_amounts_keep_their_cents(data_copy):
+    raw = pd.read_csv(data_copy / data_store.SALES_FILE)
+    # Parsed from the CSV, then read from the snapshot
+    for dataset in (data_store.Dataset(data_copy), data_store.Dataset(data_copy)):
+        sales = dataset.sales.set_index('TransactionID').loc[raw['TransactionID']]
+        for column in ('UnitPrice', 'TotalSales', 'Profit'):
+            assert sales[column].dtype == np.float64
+            np.testing.assert_array_equal(sales[column].values, raw[column].values)
+    # float32 stays available for tables that are only aggregated
+    compact = data_store.Dataset(data_copy, float_dtype='float32')
+    assert compact.sales['TotalSales'].dtype == np.float32
+
+
+# ============================================================================
+# EXPORT
+# ============================================================================
+def test_selection_chunks_cover_the_selection(model):
+    index = model.filter_index
+    selection = index.select(**sales_engine.filter_spec(**SPECS['drilldown']))
+    chunks = list(data_store.selection_chunks(index.sales, selection, chunk_rows=100))
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    pd.testing.assert_frame_equal(pd.concat(chunks), index.take(selection))
+
+
+@pytest.mark.parametrize('fmt', list(data_store.EXPORT_FORMATS))
+def test_export_writes_every_chunk(model, tmp_path, fmt):
+    index = model.filter_index
+    selection = index.select(**sales_engine.filter_spec(**SPECS['drilldown']))
+    path = tmp_path / f'export.{data_store.EXPORT_FORMATS[fmt][0]}'
+    written = data_store.write_export(data_store.selection_chunks(index.sales, selection, 100), path, fmt)
+
+    exported = pd.read_parquet(path) if fmt == 'Parquet' else pd.read_csv(path)
+    expected = index.take(selection)
+    assert written == len(exported) == len(expected)
+    assert list(exported['TransactionID']) == list(expected['TransactionID'])
+    # Exported amounts are the loaded ones to the cent
+    np.testing.assert_array_equal(exported['TotalSales'], expected['TotalSales'])
+
+
+@pytest.mark.parametrize('fmt', list(data_store.EXPORT_FORMATS))
+def test_empty_export_keeps_the_columns(model, tmp_path, fmt):
+    index = model.filter_index
+    selection = index.select(**sales_engine.filter_spec(**SPECS['empty']))
+    path = tmp_path / f'export.{data_store.EXPORT_FORMATS[fmt][0]}'
+    assert data_store.write_export(data_store.selection_chunks(index.sales, selection), path, fmt) == 0
+    exported = pd.read_parquet(path) if fmt == 'Parquet' else pd.read_csv(path)
+    assert len(exported) == 0 and list(exported.columns) == list(index.sales.columns)
+
+
+def test_full_rows_add_the_file_columns(data_copy, tmp_path):
+    dataset = data_store.Dataset(data_copy)
+    raw = pd.read_csv(dataset.csv_path).set_index('TransactionID')
+    rows = dataset.sales.sample(200, random_state=0)
+    full = dataset.full_rows(rows)
+    header = data_store.sales_file_columns(dataset.csv_path)
+    assert list(full.columns[:len(header)]) == header
+    expected = raw.loc[full['TransactionID']]
+    for column in ('OrderYear', 'Brand', 'CostPrice', 'ShippingCost'):
+        np.testing.assert_array_equal(full[column].values, expected[column].values)
+
+    # Appended rows get their columns too, and exports carry them
+    append_text(dataset.csv_path, ''.join(new_lines(dataset.csv_path, 10)))
+    status, tail = dataset.refresh()
+    full = dataset.full_rows(dataset.sales[dataset.sales['TransactionID'].isin(tail['TransactionID'])])
+    assert len(full) == 10 and full['CostPrice'].notna().all()
+    path = tmp_path / 'export.csv'
+    assert data_store.write_export([full], path, 'CSV') == 10
+    assert list(pd.read_csv(path).columns[:len(header)]) == header
+
+
+def test_full_rows_of_partitions(partitioned_dir):
+    dataset = data_store.Dataset(partitioned_dir)
+    rows = dataset.load_range('2023-03-01', '2023-04-30')
+    full = dataset.full_rows(rows)
+    assert len(full) == len(rows) and full['ShippingCost'].notna().all()
+    # Loading more partitions reads their columns on the next use
+    rest = dataset.load_range()
+    assert dataset.full_rows(rest)['ShippingCost'].notna().all()
+
+
+# ============================================================================
+# REFRESH
+# ============================================================================
+def new_lines(csv_path, n):
+    """`n` CSV lines copied from the file's last rows, with fresh TransactionIDs"""
+    with open(csv_path, 'r', encoding='utf-8') as f:
+        lines = f.read().splitlines()[-n:]
+    return [f'TNEW{i:05d},' + line.split(',', 1)[1] + '\n' for i, line in enumerate(lines)]
+
+
+def append_text(path, text):
+    with open(path, 'a', encoding='utf-8', newline='') as f:
+        f.write(text)
+
+
+def assert_matches_files(model, data_dir):
+    raw = read_raw_sales([data_dir / data_store.SALES_FILE], data_dir / 'customers.csv')
+    for spec in (SPECS['all'], SPECS['drilldown']):
+        for name in sales_engine.AGGREGATES:
+            assert_same_aggregate(sales_engine.Query(model, spec).aggregate(name),
+                                  reference_aggregate(raw, spec, name))
+
+
+def test_refresh_without_changes(data_copy):
+    dataset = data_store.Dataset(data_copy)
+    assert dataset.refresh() == ('unchanged', None)
+    assert dataset.version == 0
+
+
+def test_refresh_reads_appended_rows(data_copy):
+    dataset = data_store.Dataset(data_copy)
+    model = sales_engine.build_model(dataset)
+    rows = len(dataset.sales)
+    append_text(dataset.csv_path, ''.join(new_lines(dataset.csv_path, 25)))
+
+    status, tail = dataset.refresh()
+    assert status == 'appended'
+    assert list(tail['TransactionID']) == [f'TNEW{i:05d}' for i in range(25)]
+    assert len(dataset.sales) == rows + 25 and dataset.version == 1
+    assert dataset.refresh() == ('unchanged', None)
+    # Extending the model with the tail gives what the files say
+    assert_matches_files(model.append(tail, dataset.customers), data_copy)
+
+
+def test_snapshot_is_topped_up_with_appended_rows(data_copy):
+    rows = len(data_store.Dataset(data_copy).sales)
+    csv_path = data_copy / data_store.SALES_FILE
+    append_text(csv_path, ''.join(new_lines(csv_path, 10)))
+
+    dataset = data_store.Dataset(data_copy)
+    assert dataset.source == 'snapshot' and len(dataset.sales) == rows + 10
+    assert data_store.read_snapshot_meta(csv_path)['rows'] == rows + 10
+
+
+def test_refresh_waits_for_a_partial_line(data_copy):
+    dataset = data_store.Dataset(data_copy)
+    rows = len(dataset.sales)
+    lines = new_lines(dataset.csv_path, 4)
+    half = len(lines[-1]) // 2
+    append_text(dataset.csv_path, ''.join(lines[:-1]) + lines[-1][:half])
+
+    status, tail = dataset.refresh()
+    assert status == 'appended' and len(tail) == 3
+    # Only the rest of the half-written row has not arrived yet
+    assert dataset.refresh() == ('unchanged', None)
+
+    append_text(dataset.csv_path, lines[-1][half:])
+    status, tail = dataset.refresh()
+    assert status == 'appended'
+    assert list(tail['TransactionID']) == ['TNEW00003']
+    assert len(dataset.sales) == rows + 4
+    assert dataset.sales['TransactionID'].is_unique
+
+
+def test_refresh_merges_back_dated_rows(data_copy):
+    dataset = data_store.Dataset(data_copy)
+    model = sales_engine.build_model(dataset)
+    # Late-arriving rows for a day in the middle of the history
+    day = dataset.sales['OrderDate'].iloc[len(dataset.sales) // 2].strftime('%Y-%m-%d')
+    lines = [line.replace(line.split(',')[1], day, 1) for line in new_lines(dataset.csv_path, 20)]
+    append_text(dataset.csv_path, ''.join(lines))
+
+    status, tail = dataset.refresh()
+    assert status == 'appended' and len(tail) == 20
+    assert dataset.sales['OrderDate'].is_monotonic_increasing
+    merged = dataset.sales.loc[dataset.sales['OrderDate'] == day, 'TransactionID']
+    assert list(merged[-20:]) == list(tail['TransactionID'])
+    assert_matches_files(model.append(tail, dataset.customers), data_copy)
+
+
+def test_refresh_reports_dimension_only_changes(data_copy):
+    dataset = data_store.Dataset(data_copy)
+    sales = dataset.sales
+    regions = pd.read_csv(data_copy / 'regions.csv')
+    regions['RegionalManager'] = 'Someone Else'
+    regions.to_csv(data_copy / 'regions.csv', index=False)
+
+    assert dataset.refresh() == ('dimensions', ['regions.csv'])
+    assert dataset.version == 1 and dataset.sales is sales
+    assert (dataset.regions['RegionalManager'] == 'Someone Else').all()
+    assert dataset.refresh() == ('unchanged', None)
+
+
+def test_refresh_reloads_edited_rows(data_copy):
+    dataset = data_store.Dataset(data_copy)
+    path = dataset.csv_path
+    text = path.read_text(encoding='utf-8')
+    row = next(line for line in text.splitlines() if ',Europe,' in line)
+    stat = os.stat(path)
+    # Same size, different content: only the modification time gives it away
+    path.write_text(text.replace(row, row.replace(',Europe,', ',Erope_,', 1), 1), encoding='utf-8')
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert dataset.refresh() == ('reloaded', None)
+    assert (dataset.sales['Region'] == 'Erope_').sum() == 1
+
+
+def test_complete_length_ignores_a_partial_row(tmp_path):
+    path = tmp_path / 'rows.csv'
+    path.write_bytes(b'a,b\n1,2\n3,')
+    assert data_store.complete_length(path) == len(b'a,b\n1,2\n')
+    path.write_bytes(b'a,b')
+    assert data_store.complete_length(path) == 0
+
+
+# ============================================================================
+# STAR JOIN
+# ============================================================================
+def test_refresh_reloads_changed_customer_attributes(data_copy):
+    dataset = data_store.Dataset(data_copy)
+    customers = pd.read_csv(data_copy / 'customers.csv')
+    customer = dataset.sales['CustomerID'].iloc[0]
+    customers.loc[customers['CustomerID'] == customer, 'Tier'] = 'Platinum'
+    customers.to_csv(data_copy / 'customers.csv', index=False)
+
+    assert dataset.refresh() == ('reloaded', None)
+    assert (dataset.sales.loc[dataset.sales['CustomerID'] == customer, 'Tier'] == 'Platinum').all()
+
+
+def test_attributes_match_the_dimension_tables(dataset, raw_sales):
+    sales = dataset.sales.set_index('TransactionID')
+    expected = raw_sales.set_index('TransactionID').loc[sales.index]
+    for column in ('Tier', 'Segment'):
+        assert (sales[column].astype(object) == expected[column]).all()
+    brands = dataset.products.set_index('ProductID')['Brand']
+    assert (sales['Brand'].astype(object).values == brands.loc[sales['ProductID'].astype(object)].values).all()
+
+
+@pytest.mark.parametrize('policy', ['unknown', 'exclude'])
+def test_missing_members(policy):
+    sales = pd.DataFrame({'CustomerID': ['C1', 'C2', 'C9']})
+    customers = pd.DataFrame({'CustomerID': ['C1', 'C2'], 'Tier': ['Gold', 'Silver'],
+                              'Segment': ['Retail', 'SMB'], 'PreferredChannel': ['Online', 'Online']})
+    tiers = data_store.denormalize(sales, {'customers': customers}, policy)['Tier']
+    assert tiers.iloc[:2].tolist() == ['Gold', 'Silver']
+    if policy == 'unknown':
+        assert tiers.iloc[2] == data_store.UNKNOWN_MEMBER
+    else:
+        assert pd.isna(tiers.iloc[2])
+
+
+# ============================================================================
+# PARTITIONS
+# ============================================================================
+def test_partitions_load_on_demand(partitioned_dir):
+    dataset = data_store.Dataset(partitioned_dir)
+    assert dataset.partitioned and dataset.sales is None
+    assert not dataset.covers('2023-03-01', '2023-03-31')
+
+    rows = dataset.load_range('2023-03-10', '2023-04-05')
+    # Only the March and April 2023 partitions are read
+    periods = {data_store.partition_period(path, partitioned_dir / data_store.PARTITION_DIR)[0]
+               for path in dataset.partitions}
+    assert periods == {pd.Timestamp('2023-03-01'), pd.Timestamp('2023-04-01')}
+    assert rows['OrderDate'].between('2023-03-01', '2023-04-30').all()
+    assert dataset.covers('2023-03-15', '2023-04-30') and not dataset.covers('2023-03-15', '2023-05-01')
+    # Loading an already loaded range reads nothing
+    assert dataset.load_range('2023-03-01', '2023-03-31') is None
+
+
+def test_partitioned_aggregates_match_pandas(partitioned_dir):
+    dataset = data_store.Dataset(partitioned_dir)
+    # Load a filter's range as app.py does: with the previous period KPI growth compares against
+    dataset.load_range(*sales_engine.date_span('2023-01-01', '2023-12-31'))
+    assert dataset.sales['OrderDate'].min() == pd.Timestamp('2022-01-01')
+    raw = read_raw_sales(sorted((partitioned_dir / data_store.PARTITION_DIR).rglob('*.csv')),
+                         partitioned_dir / 'customers.csv')
+    model = sales_engine.build_model(dataset)
+    spec = dict(SPECS['year'], regions=['Europe'])
+    for name in sales_engine.AGGREGATES:
+        assert_same_aggregate(sales_engine.Query(model, spec).aggregate(name), reference_aggregate(raw, spec, name))
+
+    # The rest of the partitions extend the table like appended rows
+    rest = dataset.load_range()
+    # Earlier months are merged in ahead of the ones loaded first
+    assert len(dataset.sales) == len(raw) and dataset.sales['OrderDate'].is_monotonic_increasing
+    grown = model.append(rest, dataset.customers)
+    for name in sales_engine.AGGREGATES:
+        assert_same_aggregate(sales_engine.Query(grown, {}).aggregate(name), reference_aggregate(raw, {}, name))
+
+
+def test_refresh_reads_rows_appended_to_a_partition(partitioned_dir, tmp_path):
+    data_dir = shutil.copytree(partitioned_dir, tmp_path / 'sales_dashboard_data')
+    dataset = data_store.Dataset(data_dir)
+    dataset.load_range('2024-02-01', '2024-02-29')
+    path, = dataset.partitions
+    unloaded = next(p for p in data_store.list_partitions(data_dir / data_store.PARTITION_DIR) if p != path)
+    append_text(path, ''.join(new_lines(path, 5)))
+    append_text(unloaded, ''.join(new_lines(unloaded, 5)))
+
+    status, tail = dataset.refresh()
+    # Rows for months that are not loaded wait until they are
+    assert status == 'appended' and len(tail) == 5
+    assert list(dataset.partitions) == [path]
+
+
+def test_empty_partition_folder(tmp_path):
+    (tmp_path / data_store.PARTITION_DIR).mkdir()
+    dataset = data_store.Dataset(tmp_path)
+    assert dataset.partitioned and dataset.partition_bounds() is None
+    assert dataset.load_range('2023-01-01', '2023-03-31') is None
+    assert dataset.sales is None and dataset.covers()
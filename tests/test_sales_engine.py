@@ -0,0 +1,481 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_store
+import sales_engine
+from conftest import SPECS, assert_same_aggregate, reference_aggregate, spec_mask
+
+
+# ============================================================================
+# QUERY AGGREGATES
+# ============================================================================
+@pytest.mark.parametrize('scenario', SPECS)
+@pytest.mark.parametrize('name', sales_engine.AGGREGATES)
+def test_aggregate_matches_pandas(model, raw_sales, name, scenario):
+    query = sales_engine.Query(model, SPECS[scenario])
+    assert_same_aggregate(query.aggregate(name), reference_aggregate(raw_sales, SPECS[scenario], name))
+
+
+# ============================================================================
+# FILTER INDEX
+# ============================================================================
+@pytest.mark.parametrize('scenario', SPECS)
+def test_filter_index_matches_mask(model, scenario):
+    spec = sales_engine.filter_spec(**SPECS[scenario])
+    index = model.filter_index
+    expected = np.flatnonzero(spec_mask(index.sales, **spec).values)
+    selection = index.select(**spec)
+    np.testing.assert_array_equal(np.arange(index.n_rows)[selection], expected)
+    np.testing.assert_array_equal(np.flatnonzero(sales_engine.filter_mask(index.sales, **spec)), expected)
+    assert len(index.take(selection)) == len(expected)
+
+
+def test_date_only_selection_is_a_slice(model):
+    assert isinstance(model.filter_index.select(**sales_engine.filter_spec(**SPECS['year'])), slice)
+
+
+# ============================================================================
+# SEARCH INDEX
+# ============================================================================
+def brute_force_search(frame, query):
+    query = query.strip().lower()
+    mask = np.zeros(len(frame), dtype=bool)
+    for column in sales_engine.SEARCH_COLUMNS:
+        if column in frame.columns:
+            mask |= frame[column].astype(str).str.lower().str.contains(query, regex=False).values
+    return np.flatnonzero(mask)
+
+
+@pytest.mark.parametrize('query', ['tokyo', 'Ultra', 'c10', 'ny', 'x', '  Online ', 'no such text'])
+def test_search_matches_substring_scan(model, query):
+    sales = model.filter_index.sales
+    expected = brute_force_search(sales, query)
+    np.testing.assert_array_equal(model.search_index.search(query), expected)
+    np.testing.assert_array_equal(np.flatnonzero(sales_engine.search_mask(sales, query)), expected)
+
+
+def test_search_within_a_selection(model):
+    index = model.filter_index
+    for spec in (SPECS['year'], SPECS['drilldown']):
+        selection = index.select(**sales_engine.filter_spec(**spec))
+        within = np.arange(index.n_rows)[selection]
+        expected = np.intersect1d(brute_force_search(index.sales, 'europe'), within)
+        np.testing.assert_array_equal(model.search_index.search('europe', within=selection), expected)
+
+
+def test_latest_rows_are_newest_first(model):
+    query = sales_engine.Query(model, SPECS['drilldown'])
+    latest = query.latest(20)
+    expected = query.sales_filtered.iloc[::-1].head(20)
+    assert list(latest['TransactionID']) == list(expected['TransactionID'])
+
+
+# ============================================================================
+# AGGREGATE CACHE
+# ============================================================================
+def test_cache_key_ignores_the_order_of_filter_values(model):
+    cache = sales_engine.AggregateCache()
+    result, hit = sales_engine.Query(model, SPECS['drilldown'], cache).fetch('region')
+    assert not hit
+    reordered = dict(SPECS['drilldown'], regions=list(reversed(SPECS['drilldown']['regions'])))
+    assert sales_engine.Query(model, reordered, cache).fetch('region') == (result, True)
+
+
+def test_cache_key_of_every_region_is_no_region_filter(model):
+    cache = sales_engine.AggregateCache()
+    result, _ = sales_engine.Query(model, SPECS['year'], cache).fetch('channel')
+    every_region = dict(SPECS['year'], regions=list(model.filter_index.values['Region']))
+    assert sales_engine.Query(model, every_region, cache).fetch('channel') == (result, True)
+
+
+def test_separate_region_selections_are_cached_apart(model, raw_sales):
+    cache = sales_engine.AggregateCache()
+    for region in ('Europe', 'Asia Pacific', 'North America'):
+        spec = dict(SPECS['year'], regions=[region])
+        result, hit = sales_engine.Query(model, spec, cache).fetch('channel')
+        assert not hit
+        assert_same_aggregate(result, reference_aggregate(raw_sales, spec, 'channel'))
+    assert cache.stats()['entries'] == 3
+
+
+def test_cache_evicts_the_least_recently_used(model):
+    query = sales_engine.Query(model, SPECS['all'])
+    size = sales_engine.estimate_bytes(query.aggregate('channel'))
+    cache = sales_engine.AggregateCache(max_bytes=2 * size)
+    for name in ('channel', 'category', 'tier'):
+        cache.fetch(name, lambda: query.aggregate('channel'))
+    assert 'channel' not in cache and 'category' in cache and 'tier' in cache
+    assert cache.stats()['evictions'] == 1
+
+
+# ============================================================================
+# DAILY SERIES
+# ============================================================================
+@pytest.mark.parametrize('scenario', SPECS)
+def test_daily_series_totals(model, raw_sales, scenario):
+    spec = sales_engine.filter_spec(**SPECS[scenario])
+    rows = raw_sales[spec_mask(raw_sales, **spec)]
+    totals = model.daily_series.totals(**spec)
+    assert totals['TotalSales'] == pytest.approx(rows['TotalSales'].sum(), rel=1e-6)
+    assert totals['Profit'] == pytest.approx(rows['Profit'].sum(), rel=1e-6)
+    assert totals['OrderCount'] == len(rows)
+
+
+def test_daily_series_outside_the_data_is_zero(model):
+    totals = model.daily_series.totals('2030-01-01', '2030-12-31')
+    assert totals['TotalSales'] == 0 and totals['OrderCount'] == 0
+
+
+@pytest.mark.parametrize('scenario', ['year', 'drilldown'])
+def test_daily_series_growth(model, raw_sales, scenario):
+    spec = sales_engine.filter_spec(**SPECS[scenario])
+    filters = {k: v for k, v in spec.items() if k not in ('start', 'end')}
+    current, previous, growth = model.daily_series.growth(spec['start'], spec['end'], **filters)
+    before = dict(spec, **dict(zip(('start', 'end'), sales_engine.previous_period(spec['start'], spec['end']))))
+    expected_current = raw_sales.loc[spec_mask(raw_sales, **spec), 'TotalSales'].sum()
+    expected_previous = raw_sales.loc[spec_mask(raw_sales, **before), 'TotalSales'].sum()
+    assert (current, previous) == pytest.approx((expected_current, expected_previous), rel=1e-6)
+    assert growth == pytest.approx((expected_current - expected_previous) / expected_previous * 100, rel=1e-5)
+
+
+# ============================================================================
+# APPENDED ROWS
+# ============================================================================
+def test_appended_model_matches_rebuilt(dataset, model, raw_sales):
+    sales = dataset.sales
+    cut = np.searchsorted(sales['OrderDate'].values, np.datetime64('2024-07-01'))
+    grown = sales_engine.SalesModel(sales.iloc[:cut], dataset.customers)
+    grown = grown.append(sales.iloc[cut:].reset_index(drop=True))
+    for spec in SPECS.values():
+        for name in sales_engine.AGGREGATES:
+            assert_same_aggregate(sales_engine.Query(grown, spec).aggregate(name),
+                                  reference_aggregate(raw_sales, spec, name))
+
+
+def test_appended_filter_index_matches_rebuilt(dataset):
+    sales = dataset.sales
+    cut = np.searchsorted(sales['OrderDate'].values, np.datetime64('2024-07-01'))
+    # Start the appended rows a month early, so the suffix overlaps indexed days
+    tail = sales[sales['OrderDate'] >= '2024-06-01'].sample(frac=1, random_state=0).reset_index(drop=True)
+    grown = sales_engine.FilterIndex(sales.iloc[:cut]).append(tail)
+    rebuilt = sales_engine.FilterIndex(sales_engine.concat_frames([sales.iloc[:cut], tail]))
+    for spec in SPECS.values():
+        spec = sales_engine.filter_spec(**spec)
+        assert (sorted(grown.filter(**spec)['TransactionID'])
+                == sorted(rebuilt.filter(**spec)['TransactionID']))
+
+
+# ============================================================================
+# DOWNSAMPLING
+# ============================================================================
+def test_lttb_keeps_endpoints_and_peaks():
+    x = np.arange(1_000)
+    y = np.sin(x / 50.0)
+    y[437] = 10
+    selected = sales_engine.lttb(x, y, 100)
+    assert len(selected) == 100
+    assert selected[0] == 0 and selected[-1] == len(x) - 1
+    assert (np.diff(selected) > 0).all()
+    assert 437 in selected
+
+
+def test_lttb_on_dates():
+    x = pd.date_range('2024-01-01', periods=500).values
+    selected = sales_engine.lttb(x, np.random.default_rng(0).normal(size=500), 50)
+    assert selected[0] == 0 and selected[-1] == 499 and len(selected) == 50
+
+
+@pytest.mark.parametrize('n_out', [2, 10, 11])
+def test_lttb_short_series_returns_every_index(n_out):
+    np.testing.assert_array_equal(sales_engine.lttb(np.arange(10), np.arange(10.0), n_out), np.arange(10))
+
+
+# ============================================================================
+# STREAMED SUMMARY
+# ============================================================================
+def test_streamed_summary_matches_pandas(dataset, raw_sales):
+    summary = sales_engine.build_summary(dataset, chunk_rows=1_000)
+    for spec in SPECS.values():
+        query = sales_engine.Query(summary, spec)
+        for name in sales_engine.AGGREGATES.keys() - sales_engine.ROW_AGGREGATES:
+            assert_same_aggregate(query.aggregate(name), reference_aggregate(raw_sales, spec, name))
+        assert query.count() == spec_mask(raw_sales, **sales_engine.filter_spec(**spec)).sum()
+
+
+def test_streamed_rows_match_the_model(dataset, model):
+    summary = sales_engine.build_summary(dataset, chunk_rows=700)
+    for spec in (SPECS['all'], SPECS['drilldown'], SPECS['empty']):
+        streamed, indexed = sales_engine.Query(summary, spec), sales_engine.Query(model, spec)
+        chunks = list(streamed.row_chunks())
+        assert sorted(pd.concat(chunks)['TransactionID']) == sorted(indexed.rows()['TransactionID'])
+        # Row-level reads carry every column of the file, not just the modelled ones
+        assert set(data_store.sales_file_columns(dataset.csv_path)) <= set(chunks[0].columns)
+        assert (sorted(streamed.latest(50, 'tokyo')['TransactionID'])
+                == sorted(indexed.latest(50, 'tokyo')['TransactionID']))
+
+
+def test_streamed_describe_matches_pandas(dataset, model):
+    summary = sales_engine.build_summary(dataset, chunk_rows=700)
+    columns = ['TotalSales', 'Profit', 'Quantity', 'ProfitMargin']
+    for spec in (SPECS['all'], SPECS['drilldown']):
+        streamed = sales_engine.Query(summary, spec).describe(columns)
+        expected = sales_engine.Query(model, spec).rows(columns).astype(np.float64).describe()
+        pd.testing.assert_frame_equal(streamed, expected.loc[streamed.index], rtol=1e-9)
+    assert sales_engine.Query(summary, SPECS['empty']).describe(columns).loc['count'].eq(0).all()
+
+
+def test_streamed_latest_rows_are_cached_per_version(dataset, monkeypatch):
+    summary = sales_engine.build_summary(dataset, chunk_rows=700)
+    scans = []
+    scan = summary.scan
+    monkeypatch.setattr(summary, 'scan', lambda *args: scans.append(args) or scan(*args))
+    first = sales_engine.Query(summary, SPECS['year']).latest(100, 'tokyo')
+    # A rerun with the same filters and search reads nothing
+    assert sales_engine.Query(summary, SPECS['year']).latest(100, 'tokyo') is first
+    assert len(scans) == 1
+    sales_engine.Query(summary, SPECS['year']).latest(100, 'tok')
+    sales_engine.Query(summary, SPECS['year'], version=1).latest(100, 'tokyo')
+    assert len(scans) == 3
+
+
+# ============================================================================
+# PREFETCH
+# ============================================================================
+def test_adjacent_periods():
+    assert sales_engine.adjacent_periods('2024-03-01', '2024-03-31') == [
+        (pd.Timestamp('2024-02-01'), pd.Timestamp('2024-02-29')),
+        (pd.Timestamp('2024-04-01'), pd.Timestamp('2024-04-30'))]
+    assert sales_engine.adjacent_periods('2024-04-01', '2024-06-30')[0] == (
+        pd.Timestamp('2024-01-01'), pd.Timestamp('2024-03-31'))
+    assert sales_engine.adjacent_periods('2024-03-05', '2024-03-14') == [
+        (pd.Timestamp('2024-02-24'), pd.Timestamp('2024-03-04')),
+        (pd.Timestamp('2024-03-15'), pd.Timestamp('2024-03-24'))]
+
+
+def test_likely_specs_stay_within_the_data():
+    spec = sales_engine.filter_spec(start='2022-01-01', end='2022-01-31')
+    specs = sales_engine.likely_specs(spec, ['Europe', 'Asia Pacific'], '2022-01-01', '2024-12-31')
+    # No month before the data; then a drill-in to each region
+    assert [s['start'] for s in specs] == [pd.Timestamp('2022-02-01')] + [spec['start']] * 2
+    assert [s['regions'] for s in specs] == [None, ['Europe'], ['Asia Pacific']]
+
+
+def test_prefetched_aggregates_are_cache_hits(model):
+    cache = sales_engine.AggregateCache()
+    prefetcher = sales_engine.Prefetcher(workers=1)
+    jobs = [(sales_engine.Query(model, spec, cache), ['region', 'channel'])
+            for spec in sales_engine.likely_specs(SPECS['year'], ['Europe', 'Asia Pacific'])]
+    prefetcher.submit('session', jobs)
+    prefetcher.executor.shutdown(wait=True)
+
+    assert prefetcher.stats() == {'computed': 2 * len(jobs), 'cancelled': 0, 'pending': 0}
+    for query, names in jobs:
+        assert all(query.fetch(name)[1] for name in names)
+
+
+# ============================================================================
+# SHARDED AGGREGATES
+# ============================================================================
+def test_sharded_aggregates_match_single_pass(dataset, model):
+    pool = sales_engine.ShardPool(3, min_rows=0)
+    sharded = sales_engine.build_model(dataset, pool)
+    for spec in SPECS.values():
+        for name in sales_engine.AGGREGATES:
+            assert_same_aggregate(sales_engine.Query(sharded, spec).aggregate(name),
+                                  sales_engine.Query(model, spec).aggregate(name), rtol=1e-9)
+
+
+def test_shards_cover_the_frame(raw_sales):
+    shards = sales_engine.ShardPool(4, min_rows=0).shards(raw_sales)
+    assert len(shards) == 4
+    pd.testing.assert_frame_equal(pd.concat(shards), raw_sales)
+
+
+def test_process_pool_partials(raw_sales):
+    pool = sales_engine.ShardPool(2, kind='process', min_rows=0)
+    try:
+        totals = sales_engine.grouped_totals(raw_sales, 'Region', {'TotalSales': ('TotalSales', 'sum')}, pool)
+        assert sales_engine.distinct_count(raw_sales['CustomerID'], pool) == raw_sales['CustomerID'].nunique()
+    finally:
+        pool.executor.shutdown()
+    np.testing.assert_allclose(totals['TotalSales'], raw_sales.groupby('Region')['TotalSales'].sum())
+
+
+# ============================================================================
+# DISTINCT CUSTOMERS
+# ============================================================================
+def synthetic_sales(rows, customers, seed=0):
+    """Sales rows carrying only what the customer sketch reads"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'OrderDate': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 60, rows), unit='D'),
+        'Region': rng.choice(['Europe', 'Asia Pacific'], rows),
+        'Category': rng.choice(['Electronics', 'Furniture'], rows),
+        'Tier': rng.choice(['Gold', 'Silver'], rows),
+        'SalesChannel': rng.choice(['Online', 'Retail Store'], rows),
+        'Segment': rng.choice(['Retail', 'SMB'], rows),
+        'CustomerID': pd.Series(rng.integers(0, customers, rows)).map('C{}'.format),
+    }).sort_values('OrderDate', kind='stable').reset_index(drop=True)
+
+
+@pytest.mark.parametrize('precision', [10, 12])
+def test_sketch_error_bound(precision):
+    sales = synthetic_sales(200_000, 150_000)
+    sketch = sales_engine.CustomerSketch(sales, precision)
+    specs = [{}, dict(start='2024-01-10', end='2024-02-10'), dict(regions=['Europe'], tiers=['Gold']),
+             dict(start='2024-02-01', categories=['Furniture'], channels=['Online'])]
+    for spec in specs:
+        spec = sales_engine.filter_spec(**spec)
+        exact = sales.loc[spec_mask(sales, **spec), 'CustomerID'].nunique()
+        # Four standard errors: the sketch and the data are deterministic,
+        # so this either always holds or always fails
+        assert abs(sketch.count(**spec) - exact) <= 4 * sketch.error * exact
+    by_segment = sketch.count_by('Segment').set_index('Segment')['Count']
+    for segment, exact in sales.groupby('Segment')['CustomerID'].nunique().items():
+        assert abs(by_segment[segment] - exact) <= 4 * sketch.error * exact
+
+
+def test_sketch_precision_meets_requested_error():
+    for error in (0.005, 0.01, 0.02, 0.05):
+        precision = sales_engine.hll_precision(error)
+        assert 1.04 / np.sqrt(1 << precision) <= error
+        assert 1.04 / np.sqrt(1 << (precision - 1)) > error
+
+
+def test_appended_sketch_matches_rebuilt():
+    sales = synthetic_sales(50_000, 30_000)
+    half = len(sales) // 2
+    grown = sales_engine.CustomerSketch(sales.iloc[:half]).append(sales.iloc[half:])
+    rebuilt = sales_engine.CustomerSketch(sales)
+    for spec in ({}, dict(start='2024-02-01'), dict(regions=['Asia Pacific'])):
+        assert grown.count(**spec) == rebuilt.count(**spec)
+
+
+def test_sketch_union_matches_the_rows():
+    sales = synthetic_sales(50_000, 30_000)
+    sketch = sales_engine.CustomerSketch(sales)
+    specs = [{}, dict(start='2024-01-01', end='2024-01-31'), dict(start='2024-01-15', end='2024-02-29'),
+             dict(start='2024-01-31', end='2024-02-01'), dict(end='2024-02-10', regions=['Europe'])]
+    for spec in specs:
+        spec = sales_engine.filter_spec(**spec)
+        rows = sales[spec_mask(sales, **spec)]
+        registers, ranks = sales_engine.hll_registers(sales_engine.hll_hashes(rows['CustomerID'])[0])
+        union = np.zeros(1 << sales_engine.HLL_PRECISION, dtype=np.uint8)
+        np.maximum.at(union, registers, ranks)
+        # Whole months come from the monthly level, the rest from the days
+        assert sketch.count(**spec) == sales_engine.hll_estimate(union)
+
+
+def test_sketch_entries_do_not_grow_with_repeat_customers():
+    sketch = sales_engine.CustomerSketch(synthetic_sales(400_000, 500))
+    # Each (month, cell) holds at most one entry per customer: whole
+    # months merge at most 2 months x 32 cells x 500 entries
+    assert len(sketch.monthly[0]) <= 2 * 32 * 500 < len(sketch.daily[0])
+
+
+def test_approximate_query_estimates_customers(model, raw_sales):
+    for spec in (SPECS['all'], SPECS['year'], SPECS['drilldown']):
+        estimate = sales_engine.Query(model, spec, approximate=True).aggregate('kpis')['customer_count']
+        exact = raw_sales.loc[spec_mask(raw_sales, **sales_engine.filter_spec(**spec)), 'CustomerID'].nunique()
+        assert abs(estimate - exact) <= 4 * model.customer_sketch.error * exact
+
+
+def test_small_tables_count_exactly_by_default(model):
+    assert not sales_engine.approximate_by_default(model)
+    assert sales_engine.approximate_by_default(model, min_rows=model.filter_index.n_rows)
+
+
+# ============================================================================
+# STRATIFIED SAMPLE AND PREVIEWS
+# ============================================================================
+def test_sample_strata_and_weights(dataset):
+    sales = dataset.sales
+    sample = sales_engine.StratifiedSample(sales, dataset.customers, rows=500, min_rows=3, seed=1)
+    assert sample.population.sum() == len(sales)
+    assert (sample.sampled == np.minimum(sample.population, np.maximum(sample.sampled, 3))).all()
+    assert (np.bincount(sample.sales['Stratum'], minlength=len(sample.population)) == sample.sampled).all()
+    assert sample.sales['Weight'].sum() == pytest.approx(len(sales))
+
+
+def test_sample_estimates_cover_the_truth(dataset, raw_sales):
+    sample = sales_engine.StratifiedSample(dataset.sales, dataset.customers, rows=1_500, min_rows=5, seed=1)
+    for spec in (SPECS['all'], SPECS['year'], SPECS['drilldown']):
+        spec = sales_engine.filter_spec(**spec)
+        rows = raw_sales[spec_mask(raw_sales, **spec)]
+        estimate = sample.estimate(spec).iloc[0]
+        assert abs(estimate['TotalSales'] - rows['TotalSales'].sum()) <= 2 * estimate['TotalSales_ci']
+        distinct = sample.distinct(spec).iloc[0]
+        assert distinct['Low'] <= rows['CustomerID'].nunique()
+        assert distinct['Low'] <= distinct['Count'] <= distinct['High']
+
+
+def test_full_sample_is_exact(model, raw_sales):
+    # The model samples up to SAMPLE_ROWS: every row of the small dataset
+    assert len(model.sample.sales) == model.filter_index.n_rows
+    spec = sales_engine.filter_spec(**SPECS['drilldown'])
+    by_region = model.sample.estimate(spec, 'Region', ['TotalSales', 'Profit'])
+    expected = raw_sales[spec_mask(raw_sales, **spec)].groupby('Region')[['TotalSales', 'Profit']].sum()
+    assert (by_region[['TotalSales_ci', 'Profit_ci']] == 0).all().all()
+    np.testing.assert_allclose(by_region.set_index('Region')[['TotalSales', 'Profit']].astype(float),
+                               expected, rtol=1e-5)
+
+
+@pytest.mark.parametrize('name', sales_engine.AGGREGATES)
+def test_preview_has_the_columns_of_the_aggregate(model, name):
+    query = sales_engine.Query(model, SPECS['drilldown'])
+    preview, _ = sales_engine.PreviewQuery(query).fetch(name)
+    exact = query.aggregate(name)
+    if name == 'kpis':
+        assert preview.keys() >= exact.keys()
+        low, high = preview['customer_count_range']
+        assert low <= preview['customer_count'] <= high
+    else:
+        assert set(preview.columns) >= set(exact.columns)
+
+
+# ============================================================================
+# STAGE TIMING
+# ============================================================================
+def test_stage_timer_records_spans(tmp_path):
+    timer = sales_engine.StageTimer()
+    with timer.span('filter', rows_in=10) as span:
+        span['rows_out'] = 4
+    with pytest.raises(ValueError):
+        with timer.span('failing'):
+            raise ValueError
+    frame = timer.frame()
+    assert list(frame['stage']) == ['filter', 'failing']
+    assert frame['rows_out'].iloc[0] == 4 and pd.isna(frame['rows_out'].iloc[1])
+    assert (frame['ms'] >= 0).all()
+
+    path = tmp_path / 'timings.jsonl'
+    timer.write_jsonl(path, session='a')
+    timer.write_jsonl(path, session='b')
+    lines = pd.read_json(path, lines=True)
+    assert list(lines['session']) == ['a', 'b'] and len(lines['stages'][0]) == 2
+
+
+# ============================================================================
+# BATCH EVALUATION
+# ============================================================================
+def test_spec_grid_covers_every_combination(model):
+    grid = sales_engine.spec_grid(model, by=('region', 'year'))
+    regions = sorted(model.filter_index.sales['Region'].astype(str).unique())
+    years = sorted(model.filter_index.sales['OrderDate'].dt.year.unique())
+    assert len(grid) == len(regions) * len(years)
+    spec = grid[f'{regions[0]} | {years[0]}']
+    assert spec['regions'] == [regions[0]]
+    assert pd.Timestamp(spec['start']) == pd.Timestamp(f'{years[0]}-01-01')
+
+
+def test_batch_matches_single_queries(model):
+    grid = sales_engine.spec_grid(model, by=('tier', 'quarter'), start='2023-01-01', end='2023-06-30')
+    batch = sales_engine.evaluate_batch(model, grid, names=['kpis', 'region'])
+    assert list(batch['kpis']['spec']) == list(grid)
+    for spec_name, spec in grid.items():
+        query = sales_engine.Query(model, spec)
+        kpis = batch['kpis'].set_index('spec').loc[spec_name]
+        assert kpis['total_sales'] == pytest.approx(query.aggregate('kpis')['total_sales'])
+        region = batch['region'][batch['region']['spec'] == spec_name].drop(columns='spec')
+        assert_same_aggregate(region.reset_index(drop=True), query.aggregate('region'))
@@ -0,0 +1,62 @@
+import shutil
+
+import pandas as pd
+import pytest
+
+import data_store
+import sales_engine
+import sql_backend
+from conftest import SPECS, assert_same_aggregate
+
+ENGINES = [pytest.param(engine, marks=pytest.mark.skipif(
+               engine == 'duckdb' and not sql_backend.DUCKDB_AVAILABLE, reason='duckdb is not installed'))
+           for engine in sql_backend.ENGINES]
+
+
+@pytest.fixture(scope='module', params=ENGINES)
+def backend(request, data_dir, tmp_path_factory):
+    path = shutil.copytree(data_dir, tmp_path_factory.mktemp(request.param) / 'sales_dashboard_data')
+    return sql_backend.SqlBackend(path, request.param)
+
+
+@pytest.mark.parametrize('scenario', SPECS)
+@pytest.mark.parametrize('name', sales_engine.AGGREGATES)
+def test_sql_aggregate_matches_pandas_backend(backend, model, name, scenario):
+    expected = sales_engine.Query(model, SPECS[scenario]).aggregate(name)
+    assert_same_aggregate(sql_backend.SqlQuery(backend, SPECS[scenario]).aggregate(name), expected)
+
+
+@pytest.mark.parametrize('scenario', SPECS)
+def test_sql_rows_match_pandas_backend(backend, model, scenario):
+    query = sql_backend.SqlQuery(backend, SPECS[scenario])
+    expected = sales_engine.Query(model, SPECS[scenario])
+    chunks = list(query.row_chunks(chunk_rows=300))
+    assert all(len(chunk) <= 300 for chunk in chunks)
+    rows = pd.concat(chunks)
+    assert query.count() == len(rows) == expected.count()
+    assert sorted(rows['TransactionID']) == sorted(expected.rows()['TransactionID'])
+    assert pd.api.types.is_datetime64_any_dtype(rows['OrderDate'])
+    assert set(data_store.sales_file_columns(backend.csv_path)) <= set(rows.columns)
+
+
+def test_sql_search_matches_pandas_backend(backend, model):
+    spec = SPECS['year']
+    latest = sql_backend.SqlQuery(backend, spec).latest(10_000, 'tokyo')
+    expected = sales_engine.Query(model, spec).latest(10_000, 'tokyo')
+    assert len(expected) > 0
+    assert sorted(latest['TransactionID']) == sorted(expected['TransactionID'])
+
+
+def test_sql_refresh_imports_appended_rows(data_copy):
+    backend = sql_backend.SqlBackend(data_copy, 'sqlite')
+    before, version = sql_backend.SqlQuery(backend, {}).count(), backend.version
+    csv_path = data_copy / data_store.SALES_FILE
+    with open(csv_path, 'r', encoding='utf-8') as f:
+        last = f.read().splitlines()[-1]
+    with open(csv_path, 'a', encoding='utf-8', newline='') as f:
+        f.write('TNEW00000,' + last.split(',', 1)[1] + '\n')
+
+    assert backend.refresh()
+    assert backend.version == version + 1
+    assert not backend.refresh()
+    assert sql_backend.SqlQuery(backend, {}).count() == before + 1